@@ -0,0 +1,116 @@
+"""Time building and querying the CSR actor collaboration graph on a synthetic catalogue.
+
+Compares "worked with" checks against the Actor.colleague lists of the domain model, and bidirectional against
+one-sided breadth-first search for shortest collaboration paths, then times adding movies to the built graph.
+
+Usage: python -m benchmarks.collaboration_graph [number of actors]
+"""
+import random
+import sys
+import time
+from itertools import accumulate
+
+from movie_web_app.adapters.collaboration_graph import CollaborationGraph
+from movie_web_app.domainmodel.model import Actor
+
+ACTORS_PER_MOVIE = 4
+QUERIES = 2000
+PATH_QUERIES = 200
+
+
+def synthetic_casts(actors, seed=235):
+    # Two movies per actor on average, with casts drawn from a skewed popularity, so a few actors appear in a thousand
+    # movies and most in one or two, as in real credits.
+    generator = random.Random(seed)
+    names = [f'Actor {number}' for number in range(actors)]
+    cumulative = list(accumulate(1 / (rank + 1) ** 0.6 for rank in range(actors)))
+    casts = []
+    for _ in range(actors * 2 // ACTORS_PER_MOVIE):
+        casts.append(list(dict.fromkeys(generator.choices(names, cum_weights=cumulative, k=ACTORS_PER_MOVIE))))
+    return names, casts
+
+
+def colleague_lists(casts):
+    # The domain model's representation: every actor holds a list of the actors they worked with.
+    colleagues = {}
+    for cast in casts:
+        for name in cast:
+            colleagues.setdefault(name, {}).update((colleague, None) for colleague in cast if colleague != name)
+    actors = {name: Actor(name) for name in colleagues}
+    for name, names in colleagues.items():
+        for colleague in names:
+            actors[name].add_actor_colleague(actors[colleague])
+    return actors
+
+
+def one_sided_path_length(graph, source, target):
+    offsets, neighbours = graph._offsets, graph._neighbours
+    source, target = graph._index[source], graph._index[target]
+    seen = {source}
+    frontier = [source]
+    length = 0
+    while frontier:
+        if target in seen:
+            return length
+        next_frontier = []
+        for vertex in frontier:
+            for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+        length += 1
+    return None
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(actors='200000'):
+    names, casts = synthetic_casts(int(actors))
+    graph, build_time = timed(lambda: CollaborationGraph.from_casts(casts))
+    size = sum(len(array) * array.itemsize for array in (graph._offsets, graph._neighbours, graph._shared))
+    print(f'{len(graph)} actors, {graph.number_of_collaborations} collaborations from {len(casts)} movies: '
+          f'built in {build_time:.2f} s, {size / 2 ** 20:.1f} MiB of arrays')
+
+    generator = random.Random(1)
+    actor_names = [name for name in names if name in graph]
+    pairs = [(generator.choice(actor_names), generator.choice(actor_names)) for _ in range(QUERIES)]
+    # Half of the checks are pairs that did work together.
+    pairs[::2] = [tuple(generator.sample(cast, 2)) for cast in generator.sample(
+        [cast for cast in casts if len(cast) > 1], QUERIES // 2)]
+
+    actors, list_build_time = timed(lambda: colleague_lists(casts))
+    actor_pairs = [(actors[first], actors[second]) for first, second in pairs]
+    list_results, list_time = timed(lambda: [first.check_if_this_actor_worked_with(second)
+                                             for first, second in actor_pairs])
+    graph_results, graph_time = timed(lambda: [graph.worked_with(first, second) for first, second in pairs])
+    assert list_results == graph_results
+    print(f'worked with: colleague lists {list_time / QUERIES * 1e6:.1f} us (built in {list_build_time:.2f} s), '
+          f'CSR {graph_time / QUERIES * 1e6:.1f} us per check ({list_time / graph_time:.0f}x)')
+
+    path_pairs = pairs[1:2 * PATH_QUERIES:2]
+    paths, bidirectional_time = timed(lambda: [graph.shortest_path(first, second) for first, second in path_pairs])
+    lengths, one_sided_time = timed(lambda: [one_sided_path_length(graph, first, second)
+                                             for first, second in path_pairs])
+    assert [None if path is None else len(path) - 1 for path in paths] == lengths
+    connected = [length for length in lengths if length is not None]
+    print(f'shortest paths: one-sided BFS {one_sided_time / len(path_pairs) * 1000:.1f} ms, bidirectional '
+          f'{bidirectional_time / len(path_pairs) * 1000:.2f} ms per query '
+          f'({one_sided_time / bidirectional_time:.0f}x), mean length {sum(connected) / len(connected):.1f}, '
+          f'{len(path_pairs) - len(connected)} unconnected')
+
+    # Movies added to the catalogue go into the added collaborations rather than rebuilding the arrays.
+    added_casts = [generator.sample(actor_names, ACTORS_PER_MOVIE) for _ in range(QUERIES)]
+    _, add_time = timed(lambda: [graph.add_cast(cast) for cast in added_casts])
+    _, added_check_time = timed(lambda: [graph.worked_with(first, second) for first, second in pairs])
+    _, fold_time = timed(graph.folded)
+    print(f'added movies: {add_time / QUERIES * 1e6:.1f} us per cast, then {added_check_time / QUERIES * 1e6:.1f} us '
+          f'per worked with check; folded into the arrays in {fold_time:.2f} s')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,67 @@
+"""Time filter+sort queries on the memory repository and the NumPy columnar repository.
+
+Usage: python -m benchmarks.columnar_filter [number of movies]
+"""
+import random
+import sys
+import time
+
+from movie_web_app.adapters.Movie_repo import MovieRepo
+from movie_web_app.adapters.columnar_repository import ColumnarMovieRepo
+from movie_web_app.domainmodel.model import Movie, Genre
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Drama', 'Family', 'Fantasy', 'History',
+          'Horror', 'Music', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Sport', 'Thriller', 'War', 'Western']
+
+QUERIES = [
+    dict(genre='Action', first_year=2010, last_year=2015, min_rating=7, order_by='votes'),
+    dict(genre='Drama', min_rating=8, order_by='rating'),
+    dict(first_year=2000, last_year=2005, order_by='runtime'),
+    dict(genre='War', max_rating=5, order_by='year'),
+]
+
+
+def synthetic_movies(count, seed=235):
+    # Movies with random attributes, sharing one Genre instance per name as the CSV loader does.
+    generator = random.Random(seed)
+    genres = [Genre(name) for name in GENRES]
+    movies = []
+    for movie_id in range(1, count + 1):
+        movie = Movie(f'Movie {movie_id}', generator.randint(1950, 2020), new_id=movie_id)
+        movie.rating = f'{generator.uniform(1, 10):.1f}'
+        movie.votes = str(generator.randint(0, 2000000))
+        movie.runtime_minutes = generator.randint(60, 200)
+        for genre in generator.sample(genres, generator.randint(1, 3)):
+            movie.add_genre(genre)
+        movies.append(movie)
+    return movies
+
+
+def best_time(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(count='200000'):
+    movies = synthetic_movies(int(count))
+    repos = {}
+    for label, repo_class in (('memory', MovieRepo), ('columnar', ColumnarMovieRepo)):
+        repo = repos[label] = repo_class()
+        repo.add_movies(movies)
+        repo.get_movie_ids_for_filter()  # Sort the posting lists and build the columns outside the timings.
+
+    for criteria in QUERIES:
+        results = {label: repo.get_movie_ids_for_filter(**criteria) for label, repo in repos.items()}
+        assert results['memory'] == results['columnar']
+        timings = {label: best_time(lambda: repo.get_movie_ids_for_filter(**criteria))
+                   for label, repo in repos.items()}
+        print(f"{criteria}: {len(results['memory'])} movies, memory {timings['memory'] * 1000:.1f} ms, "
+              f"columnar {timings['columnar'] * 1000:.1f} ms ({timings['memory'] / timings['columnar']:.0f}x)")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,64 @@
+"""Time database_repository.populate on a synthetic catalogue built by repeating the sample movies.
+
+Usage: python -m benchmarks.database_load [number of movies]
+"""
+import csv
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import clear_mappers
+
+from movie_web_app.adapters.database_engine import create_database_engine
+from movie_web_app.adapters.database_repository import populate
+from movie_web_app.adapters.orm import metadata
+
+DATA_PATH = 'movie_web_app/datafilereaders'
+
+
+def write_catalogue(directory, count):
+    # Copies the sample movies with fresh ranks until there are count rows; every copy after the first gets its own
+    # actor and director names so the entity tables grow with the catalogue.
+    with open(os.path.join(DATA_PATH, 'Data1000Movies.csv'), encoding='utf-8-sig', newline='') as source:
+        reader = csv.reader(source)
+        header = next(reader)
+        rows = list(reader)
+    rank, director, actors = header.index('Rank'), header.index('Director'), header.index('Actors')
+
+    with open(os.path.join(directory, 'Data1000Movies.csv'), 'w', encoding='utf-8', newline='') as target:
+        writer = csv.writer(target)
+        writer.writerow(header)
+        for number in range(count):
+            row = list(rows[number % len(rows)])
+            copy = number // len(rows)
+            row[rank] = str(number + 1)
+            if copy > 0:
+                row[director] = f'{row[director]} {copy}'
+                row[actors] = ','.join(f'{name.strip()} {copy}' for name in row[actors].split(','))
+            writer.writerow(row)
+    for filename in ('users.csv', 'comments.csv'):
+        shutil.copy(os.path.join(DATA_PATH, filename), directory)
+
+
+def main(count='100000'):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with tempfile.TemporaryDirectory() as directory:
+        write_catalogue(directory, int(count))
+        engine = create_database_engine('sqlite:///' + os.path.join(directory, 'movies.db'),
+                                        pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+        clear_mappers()
+        metadata.create_all(engine)
+
+        start = time.perf_counter()
+        populate(engine, None, directory, 'Data1000Movies.csv')
+        elapsed = time.perf_counter() - start
+        with engine.connect() as connection:
+            link_count = connection.execute('SELECT COUNT(*) FROM movie_actors').scalar()
+        print(f"{count} movies and {link_count} actor links in {elapsed:.2f}s ({int(count) / elapsed:.0f} movies/sec)")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,63 @@
+"""Measure requests/sec of the database repository with and without connection pooling and SQLite pragmas.
+
+Usage: python -m benchmarks.database_requests [seconds per configuration]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import clear_mappers
+
+from movie_web_app import create_app
+from movie_web_app.adapters.database_repository import populate
+from movie_web_app.adapters.orm import metadata
+
+DATA_PATH = 'movie_web_app/datafilereaders'
+PATHS = ['/movies_by_genre?genre=Action', '/movies_by_genre?genre=Drama&cursor=20', '/movies_by_date?year=2012',
+         '/browse?genre=Sci-Fi&min_rating=7']
+
+CONFIGURATIONS = [
+    ('no pool, no pragmas', dict(SQLALCHEMY_POOL_SIZE=0, SQLITE_PRAGMAS={})),
+    ('pooled, tuned', dict()),
+]
+
+
+def build_database(database_path):
+    engine = create_engine('sqlite:///' + database_path)
+    metadata.create_all(engine)
+    populate(engine, None, DATA_PATH, 'Data1000Movies.csv')
+    engine.dispose()
+
+
+def requests_per_second(database_uri, config, seconds):
+    clear_mappers()
+    app = create_app(dict(config, REPOSITORY='database', SQLALCHEMY_DATABASE_URI=database_uri, TESTING=False,
+                          TEST_DATA_PATH=DATA_PATH, SQLALCHEMY_ECHO=False))
+    client = app.test_client()
+    for path in PATHS:
+        assert client.get(path).status_code == 200
+
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        client.get(PATHS[count % len(PATHS)])
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main(seconds='5'):
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, 'movies.db')
+        build_database(database_path)
+        results = []
+        for label, config in CONFIGURATIONS:
+            rate = requests_per_second('sqlite:///' + database_path, config, float(seconds))
+            results.append(rate)
+            print(f"{label:>20}: {rate:7.1f} requests/sec")
+        print(f"{'speed-up':>20}: {results[-1] / results[0]:.2f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
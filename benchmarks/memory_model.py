@@ -0,0 +1,81 @@
+"""Compare the memory used by the slotted, interned domain model with the previous representation.
+
+Usage: python -m benchmarks.memory_model [path/to/Data1000Movies.csv]
+"""
+import gc
+import sys
+import tracemalloc
+import types
+
+from movie_web_app.datafilereaders.movie_file_stream_reader import MovieFileStreamReader, build_movies, COLUMNS
+from movie_web_app.domainmodel.model import Movie, Actor, Director, Genre
+
+DEFAULT_FILE = 'movie_web_app/datafilereaders/Data1000Movies.csv'
+
+
+def unslotted(cls):
+    # The same class without __slots__, so every instance carries a __dict__ as the model did before.
+    namespace = {name: value for name, value in vars(cls).items()
+                 if not isinstance(value, types.MemberDescriptorType) and name not in ('__slots__', '__weakref__')}
+    return type(cls.__name__, (object,), namespace)
+
+
+LegacyMovie = unslotted(Movie)
+LegacyActor = unslotted(Actor)
+LegacyDirector = unslotted(Director)
+LegacyGenre = unslotted(Genre)
+
+
+def build_legacy_movies(chunk, genres, actors, directors):
+    # Mirrors the allocations of the previous loader: each movie got its own Actor and Genre copies from the
+    # Movie.actors and Movie.genres setters, and every actor carried a colleague list.
+    movies = []
+    for rank, title, genre_names, description, director_name, actor_names, year, runtime, rating, votes in zip(
+            *(chunk[column] for column in COLUMNS)):
+        movie = LegacyMovie(title, int(year), new_id=int(rank))
+        movie.description = description
+        movie.runtime_minutes = int(runtime)
+        movie.rating = rating
+        movie.votes = votes
+
+        movie._actors = []
+        for name in actor_names.split(','):
+            actor = LegacyActor(name)
+            actor._colleagues = []
+            movie._actors.append(actor)
+            canonical = actors.setdefault(actor.actor_full_name, LegacyActor(name))
+            canonical._colleagues = []
+            canonical._movies.append(movie)
+
+        movie._genres = [LegacyGenre(name) for name in genre_names.split(',')]
+        for genre in movie._genres:
+            genres.setdefault(genre.genre_name, LegacyGenre(genre.genre_name))._movie.append(movie)
+
+        directors.setdefault(director_name.strip(), LegacyDirector(director_name))._movies.append(movie)
+        movies.append(movie)
+    return movies
+
+
+def measure(builder, filename):
+    gc.collect()
+    tracemalloc.start()
+    genres, actors, directors = {}, {}, {}
+    movies = []
+    for chunk in MovieFileStreamReader(filename).read_chunks():
+        movies += builder(chunk, genres, actors, directors)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(movies), current
+
+
+def main(filename=DEFAULT_FILE):
+    results = []
+    for label, builder in (('previous model', build_legacy_movies), ('slotted, interned', build_movies)):
+        count, size = measure(builder, filename)
+        results.append(size)
+        print(f"{label:>18}: {size / 2 ** 20:8.2f} MiB for {count} movies ({size / count:.0f} bytes/movie)")
+    print(f"{'saving':>18}: {1 - results[1] / results[0]:.0%}")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
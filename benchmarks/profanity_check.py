@@ -0,0 +1,59 @@
+"""Time comment profanity checks with better_profanity and with the precompiled ProfanityFilter automaton.
+
+Usage: python -m benchmarks.profanity_check [number of comments]
+"""
+import random
+import sys
+import time
+
+from movie_web_app.movie.profanity_filter import ProfanityFilter, CHARACTER_VARIANTS, read_wordlist, \
+    better_profanity_file
+
+WORDS = ('the movie was great and I loved every minute of it although the ending dragged a bit for my taste '
+         'class glass assessment pass Scunthorpe brilliant acting soundtrack').split()
+
+
+def synthetic_comments(count, words_per_comment, seed=235):
+    # Ordinary comments, a quarter of them with one wordlist entry spelt with random character variants.
+    generator = random.Random(seed)
+    wordlist = read_wordlist(better_profanity_file('profanity_wordlist.txt'))
+    comments = []
+    for _ in range(count):
+        words = [generator.choice(WORDS) for _ in range(words_per_comment)]
+        if generator.random() < 0.25:
+            word = ''.join(generator.choice(CHARACTER_VARIANTS.get(letter, (letter,)))
+                           for letter in generator.choice(wordlist))
+            words[generator.randrange(len(words))] = word
+        comments.append(' '.join(words))
+    return comments
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(count='2000'):
+    from better_profanity import Profanity
+
+    better_profanity, build_better = timed(Profanity)
+    automaton, build_automaton = timed(ProfanityFilter.from_better_profanity)
+    print(f'build: better_profanity {build_better * 1000:.0f} ms, automaton {build_automaton * 1000:.0f} ms')
+
+    for words_per_comment in (10, 50, 250):
+        comments = synthetic_comments(int(count), words_per_comment)
+        # The automaton memoises its transitions on first use; time it once they are in place.
+        for comment in comments:
+            automaton.contains_profanity(comment)
+        automaton_results, automaton_time = timed(lambda: [automaton.contains_profanity(c) for c in comments])
+        better_results, better_time = timed(lambda: [better_profanity.contains_profanity(c) for c in comments])
+        agree = sum(a == b for a, b in zip(automaton_results, better_results))
+        print(f'{words_per_comment} words: better_profanity {better_time / len(comments) * 1e6:.0f} us, '
+              f'automaton {automaton_time / len(comments) * 1e6:.1f} us per comment '
+              f'({better_time / automaton_time:.0f}x), {sum(automaton_results)} flagged, '
+              f'{agree}/{len(comments)} agree')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -17,8 +17,36 @@ class Config:
 
     # Database configuration
     SQLALCHEMY_DATABASE_URI = environ.get('SQLALCHEMY_DATABASE_URI')
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = environ.get('SQLALCHEMY_ECHO') == 'True'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connections kept open for reuse; 0 opens a new connection for every session.
+    SQLALCHEMY_POOL_SIZE = int(environ.get('SQLALCHEMY_POOL_SIZE', 5))
+
+    # Pragmas applied to each new SQLite connection.
+    SQLITE_PRAGMAS = {
+        'journal_mode': environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', 256 * 2 ** 20)),
+        'cache_size': int(environ.get('SQLITE_CACHE_SIZE', -64 * 2 ** 10)),
+    }
+
+    # Optional write-behind queue for comments in database mode. Comments are committed in batches of up to
+    # COMMENT_BATCH_SIZE, at most COMMENT_MAX_LATENCY seconds after they were posted. A request waits at most
+    # COMMENT_WAIT_TIMEOUT seconds for its user's own comments to be written.
+    COMMENT_WRITE_BEHIND = environ.get('COMMENT_WRITE_BEHIND') == 'True'
+    COMMENT_BATCH_SIZE = int(environ.get('COMMENT_BATCH_SIZE', 100))
+    COMMENT_MAX_LATENCY = float(environ.get('COMMENT_MAX_LATENCY', 0.05))
+    COMMENT_WAIT_TIMEOUT = float(environ.get('COMMENT_WAIT_TIMEOUT', 5))
+
     REPOSITORY = environ.get('REPOSITORY')
 
+    # Optional read-through cache in front of the repository: at most REPOSITORY_CACHE_SIZE results, each kept for up to
+    # REPOSITORY_CACHE_TTL seconds.
+    REPOSITORY_CACHE = environ.get('REPOSITORY_CACHE') == 'True'
+    REPOSITORY_CACHE_SIZE = int(environ.get('REPOSITORY_CACHE_SIZE', 4096))
+    REPOSITORY_CACHE_TTL = float(environ.get('REPOSITORY_CACHE_TTL', 60))
+
+    # Optional snapshot file for warm-starting the memory repository.
+    SNAPSHOT_PATH = environ.get('SNAPSHOT_PATH')
+
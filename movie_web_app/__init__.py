@@ -1,15 +1,31 @@
-from flask import Flask
-from sqlalchemy import create_engine
+import atexit
+import os
+import shutil
+
+import click
+from flask import Flask, session
 from sqlalchemy.orm import clear_mappers, sessionmaker
-from sqlalchemy.pool import NullPool
 
-from movie_web_app.adapters import Movie_repo, database_repository
+from movie_web_app.adapters import Movie_repo, database_repository, snapshot, user_import
+from movie_web_app.adapters.caching_repository import CachingRepository
+from movie_web_app.adapters.comment_writer import CommentWriter
+from movie_web_app.adapters.database_engine import create_database_engine
 # from movie_web_app.adapters.Movie_repo import MovieRepo, populate
 from movie_web_app.adapters.orm import metadata, map_model_to_tables
 # from movie_web_app.datafilereaders.movie_file_csv_reader import MovieFileCSVReader
 import movie_web_app.adapters.repository as repo
 
 
+def database_repository_instance():
+    # The SqlAlchemyRepository behind repo_instance, which may be wrapped in a CachingRepository, or None.
+    instance = repo.repo_instance
+    if isinstance(instance, CachingRepository):
+        instance = instance.repository
+    if isinstance(instance, database_repository.SqlAlchemyRepository):
+        return instance
+    return None
+
+
 def create_app(test_config=None):
     # Create the Flask app object.
     app = Flask(__name__)
@@ -23,12 +39,30 @@ def create_app(test_config=None):
         app.config.from_mapping(test_config)
         data_path = app.config['TEST_DATA_PATH']
 
-    if app.config['REPOSITORY'] == 'memory':
-        # Create the MemoryRepository instance for a memory-based repository.
-        repo.repo_instance = Movie_repo.MovieRepo()
-        Movie_repo.populate(data_path, repo.repo_instance)
+    if app.config['REPOSITORY'] in ('memory', 'columnar'):
+        # The columnar repository is the memory repository with NumPy-backed filtering; NumPy is only imported when
+        # it is selected.
+        repo_class = Movie_repo.MovieRepo
+        if app.config['REPOSITORY'] == 'columnar':
+            from movie_web_app.adapters.columnar_repository import ColumnarMovieRepo
+            repo_class = ColumnarMovieRepo
+
+        # Warm-start from a snapshot when one was built from the current data files, otherwise create the
+        # MemoryRepository instance from the CSV files.
+        repo.repo_instance = None
+        snapshot_path = app.config.get('SNAPSHOT_PATH')
+        if snapshot_path:
+            repo.repo_instance = snapshot.load_snapshot(snapshot_path, data_path, repo_class)
+        if repo.repo_instance is None:
+            repo.repo_instance = repo_class()
+            Movie_repo.populate(data_path, repo.repo_instance)
 
     elif app.config['REPOSITORY'] == 'database':
+        # A repository this process created before must finish writing its queued comments first.
+        previous_repo = database_repository_instance()
+        if previous_repo is not None:
+            previous_repo.close()
+
         # Configure database.
         database_uri = app.config['SQLALCHEMY_DATABASE_URI']
 
@@ -36,11 +70,13 @@ def create_app(test_config=None):
         # For example the file database could be located locally and relative to the application in covid-19.db,
         # leading to a URI of "sqlite:///covid-19.db".
         # Note that create_engine does not establish any actual DB connection directly!
-        database_echo = app.config['SQLALCHEMY_ECHO']
-        database_engine = create_engine(database_uri, connect_args={"check_same_thread": False}, poolclass=NullPool,
-                                        echo=database_echo)
+        # The engine keeps a pool of connections, each set up with the configured SQLite pragmas.
+        database_engine = create_database_engine(database_uri, echo=app.config['SQLALCHEMY_ECHO'],
+                                                 pool_size=app.config['SQLALCHEMY_POOL_SIZE'],
+                                                 pragmas=app.config['SQLITE_PRAGMAS'])
 
-        if app.config['TESTING'] == 'True' or len(database_engine.table_names()) == 0:
+        # TESTING is a string when read from .env and a bool when given in test_config.
+        if app.config['TESTING'] in (True, 'True') or len(database_engine.table_names()) == 0:
             print("REPOPULATING DATABASE")
             # For testing, or first-time use of the web application, reinitialise the database.
             clear_mappers()
@@ -56,12 +92,71 @@ def create_app(test_config=None):
 
         else:
             # Solely generate mappings that map domain model classes to the database tables.
+            clear_mappers()
             map_model_to_tables()
+            database_repository.ensure_search_tokens(database_engine)
+            database_repository.ensure_data_versions(database_engine)
 
         # Create the database session factory using sessionmaker (this has to be done once, in a global manner)
         session_factory = sessionmaker(autocommit=False, autoflush=True, bind=database_engine)
+        # Optionally queue comments and write them in batches; anything still queued is written at exit.
+        comment_writer = None
+        if app.config['COMMENT_WRITE_BEHIND']:
+            comment_writer = CommentWriter(database_engine, batch_size=app.config['COMMENT_BATCH_SIZE'],
+                                           max_latency=app.config['COMMENT_MAX_LATENCY'])
+            atexit.register(comment_writer.close)
+
         # Create the SQLAlchemy DatabaseRepository instance for an sqlite3-based repository.
-        repo.repo_instance = database_repository.SqlAlchemyRepository(session_factory)
+        repo.repo_instance = database_repository.SqlAlchemyRepository(session_factory, comment_writer)
+        # Precompute the similar movies and the collaboration graph now rather than on the first request that needs
+        # them.
+        repo.repo_instance.build_similar_movies()
+        repo.repo_instance.build_collaboration_graph()
+        repo.repo_instance.close_session()
+
+    if app.config.get('REPOSITORY_CACHE'):
+        repo.repo_instance = CachingRepository(repo.repo_instance, max_entries=app.config['REPOSITORY_CACHE_SIZE'],
+                                               ttl=app.config['REPOSITORY_CACHE_TTL'])
+
+    @app.cli.command('build-snapshot')
+    @click.argument('snapshot_path', required=False)
+    def build_snapshot(snapshot_path=None):
+        """Build a memory repository snapshot from the CSV data files."""
+        snapshot_path = snapshot_path or app.config.get('SNAPSHOT_PATH')
+        if not snapshot_path:
+            raise click.UsageError('Give a snapshot path or set SNAPSHOT_PATH')
+        movie_repo = Movie_repo.MovieRepo()
+        Movie_repo.populate(data_path, movie_repo)
+        snapshot.save_snapshot(movie_repo, snapshot_path, data_path)
+        click.echo(f'Wrote snapshot of {movie_repo.get_number_of_movies()} movies to {snapshot_path}')
+
+    @app.cli.command('hash-users')
+    @click.argument('target', required=False)
+    @click.option('--source', default=None, help="users.csv file to read (default: the data directory's users.csv).")
+    @click.option('--workers', type=int, default=None, help='Number of hashing processes (default: one per CPU).')
+    @click.option('--in-place', is_flag=True,
+                  help='Rewrite the source itself, keeping the original as SOURCE.bak, instead of writing TARGET.')
+    def hash_users(target=None, source=None, workers=None, in_place=False):
+        """Write a copy of a users.csv file with every password hashed."""
+        source = source or os.path.join(data_path, 'users.csv')
+        if in_place:
+            if target is not None:
+                raise click.UsageError('Give either a TARGET or --in-place, not both')
+            target = source
+        elif target is None:
+            raise click.UsageError('Give a TARGET file, or --in-place to rewrite the source')
+        elif os.path.abspath(target) == os.path.abspath(source):
+            raise click.UsageError('TARGET is the source; use --in-place to rewrite it')
+
+        users = user_import.read_users(source, workers)
+        if in_place:
+            # Keep the original, and replace it only once the hashed copy is completely written.
+            shutil.copy2(source, source + '.bak')
+            user_import.write_users(source + '.tmp', users)
+            os.replace(source + '.tmp', source)
+        else:
+            user_import.write_users(target, users)
+        click.echo(f'Wrote {len(users)} users with hashed passwords to {target}')
 
     with app.app_context():
         # Register blueprints.
@@ -81,12 +176,19 @@ def create_app(test_config=None):
         # We reset the session inside the database repository before a new flask request is generated
         @app.before_request
         def before_flask_http_request_function():
-            if isinstance(repo.repo_instance, database_repository.SqlAlchemyRepository):
-                repo.repo_instance.reset_session()
+            database_repo = database_repository_instance()
+            if database_repo is not None:
+                database_repo.reset_session()
+                # Make sure a user's own queued comments are written before they see the next page, unless writing
+                # them takes too long, as when the database stays locked.
+                if 'username' in session and not database_repo.wait_for_comments(
+                        session['username'], app.config['COMMENT_WAIT_TIMEOUT']):
+                    app.logger.warning("Comments by %s are still waiting to be written", session['username'])
 
         # Register a tear-down method that will be called after each request has been processed.
         @app.teardown_appcontext
         def shutdown_session(exception=None):
-            if isinstance(repo.repo_instance, database_repository.SqlAlchemyRepository):
-                repo.repo_instance.close_session()
+            database_repo = database_repository_instance()
+            if database_repo is not None:
+                database_repo.close_session()
     return app
@@ -1,36 +1,57 @@
 import abc
 import csv
+import gc
 import os
-from bisect import insort_left, bisect_left
+from bisect import insort_left, bisect_left, bisect_right
+from collections import Counter
 from datetime import datetime
 from typing import List
 
-from werkzeug.security import generate_password_hash
-
-from movie_web_app.datafilereaders.movie_file_csv_reader import MovieFileCSVReader
-from movie_web_app.adapters.repository import AbstractRepository
-from movie_web_app.domainmodel.model import Movie, Actor, Director, User, Review, Genre, make_review
+from movie_web_app.datafilereaders.movie_file_stream_reader import MovieFileStreamReader, build_movies
+from movie_web_app.adapters.collaboration_graph import CollaborationGraph
+from movie_web_app.adapters.posting_list import PostingList
+from movie_web_app.adapters.repository import AbstractRepository, DataVersion, rating_key, year_key, filter_order_key, \
+    FACETS
+from movie_web_app.adapters.search_index import SearchIndex
+from movie_web_app.adapters.similar_movies import SimilarMovies, movie_features
+from movie_web_app.adapters.user_import import read_users
+from movie_web_app.domainmodel.model import Movie, Actor, Director, User, Review, Genre, make_review, \
+    normalise_user_name
 
 
 class MovieRepo(AbstractRepository):
+    similar_movies_class = SimilarMovies
 
     def __init__(self):
+        super().__init__()
         self._movies_index = {}
         self._movies: List[Movie] = []
+        self._unsorted_movies: List[Movie] = []
         self._actors = []
+        self._actor_set = set()
         self._genres = []
+        self._genre_set = set()
         self._reviews = []
         self._director = []
+        self._director_set = set()
         self._users = []
+        self._users_index = {}
         self._genre_dict = {}
         self._actor_dict = {}
         self._director_dict = {}
         self._year_dict = {}
+        self._genre_ids = {}
+        self._year_ids = {}
+        self._years = ()
+        self._rating_ids = PostingList()
         self._watch_list = []
+        self._search_index = SearchIndex()
+        self._similar_movies = None
+        self._collaboration_graph = None
 
     @property
     def movies_list(self):
-        return self._movies
+        return self._sorted_movies()
 
     @property
     def actors(self):
@@ -62,6 +83,7 @@ class MovieRepo(AbstractRepository):
 
     def remove_from_watch_list(self, user: User, movie: Movie):
         user.watch_list.remove_movie(movie)
+        self._changed('watch_lists', 'remove_from_watch_list', user, movie)
 
     def get_movie_index(self, new_id):
         return self._movies_index[new_id]
@@ -71,7 +93,17 @@ class MovieRepo(AbstractRepository):
             if new_movie not in self._year_dict[new_year]:
                 self._year_dict[new_year] += [new_movie]
         else:
+            self._add_year(new_year)
             self._year_dict[new_year] = [new_movie]
+        self._year_ids[new_year].add(new_movie)
+        self._changed('movies', 'add_movie_to_year_dict', new_movie)
+
+    def _add_year(self, new_year):
+        self._year_ids[new_year] = PostingList()
+        # A new year is rare, so rebuild the cached sorted years only then.
+        years = list(self._years)
+        insort_left(years, new_year)
+        self._years = tuple(years)
 
     def add_movie_to_genre_dict(self, movie: Movie, new_g: Genre):
         if new_g in self._genre_dict:
@@ -79,6 +111,9 @@ class MovieRepo(AbstractRepository):
                 self._genre_dict[new_g] += [movie]
         else:
             self._genre_dict[new_g] = [movie]
+            self._genre_ids[new_g.genre_name] = PostingList()
+        self._genre_ids[new_g.genre_name].add(movie)
+        self._changed('movies', 'add_movie_to_genre_dict', movie)
 
     def add_movie_to_actor_dict(self, movie: Movie, new_a: Actor):
         if new_a in self._actor_dict:
@@ -86,6 +121,7 @@ class MovieRepo(AbstractRepository):
                 self._actor_dict[new_a] += [movie]
         else:
             self._actor_dict[new_a] = [movie]
+        self._changed('movies', 'add_movie_to_actor_dict', movie)
 
     def add_movie_to_director_dict(self, movie: Movie, new_d: Director):
         if new_d in self._director_dict:
@@ -93,36 +129,124 @@ class MovieRepo(AbstractRepository):
                 self._director_dict[new_d] += [movie]
         else:
             self._director_dict[new_d] = [movie]
+        self._changed('movies', 'add_movie_to_director_dict', movie)
 
     def add_user(self, user: User):
         self._users.append(user)
+        self._users_index[user.user_name] = user
+        self._changed('users', 'add_user', user)
+
+    def add_users(self, users):
+        users = list(users)
+        self._users += users
+        self._users_index.update((user.user_name, user) for user in users)
+        self._changed('users', 'add_users', *users)
 
     def get_user(self, username) -> User:
-        return next((hi for hi in self._users if hi.user_name == username), None)
+        return self._users_index.get(normalise_user_name(username))
 
     def add_movie(self, movie: Movie):
-        insort_left(self._movies, movie)
+        insort_left(self._sorted_movies(), movie)
         self._movies_index[movie.id] = movie
+        self._rating_ids.add(movie)
+        self._search_index.add_movie(movie)
+        if self._similar_movies is not None:
+            self._similar_movies.add_movie(movie.id, movie_features(movie))
+        if self._collaboration_graph is not None:
+            self._collaboration_graph.add_cast(actor.actor_full_name for actor in movie.actors)
+        self._changed('movies', 'add_movie', movie)
+
+    def add_movies(self, movies):
+        # Bulk path for loaders. The movies must be new to the repository and already reference their shared Genre,
+        # Actor and Director entities, so the per-movie duplicate checks of the add_movie_to_*_dict methods are
+        # skipped and the movie list is only re-sorted when it is next read.
+        movies = list(movies)
+        self._unsorted_movies += movies
+        year_movies = {}
+        genre_movies = {}
+        self._search_index.add_movies(movies)
+        self._rating_ids.extend(movies)
+        for movie in movies:
+            self._movies_index[movie.id] = movie
+            year_movies.setdefault(movie.year, []).append(movie)
+            for genre in movie.genres:
+                genre_movies.setdefault(genre, []).append(movie)
+            for actor in movie.actors:
+                self._add_actor(actor)
+                self._actor_dict.setdefault(actor, []).append(movie)
+            if movie.director is not None:
+                self._add_director(movie.director)
+                self._director_dict.setdefault(movie.director, []).append(movie)
+
+        for year, new_movies in year_movies.items():
+            if year not in self._year_dict:
+                self._add_year(year)
+            self._year_dict.setdefault(year, []).extend(new_movies)
+            self._year_ids[year].extend(new_movies)
+
+        for genre, new_movies in genre_movies.items():
+            self._add_genre(genre)
+            if genre not in self._genre_dict:
+                self._genre_ids[genre.genre_name] = PostingList()
+            self._genre_dict.setdefault(genre, []).extend(new_movies)
+            self._genre_ids[genre.genre_name].extend(new_movies)
+        if self._similar_movies is not None:
+            for movie in movies:
+                self._similar_movies.add_movie(movie.id, movie_features(movie))
+        if self._collaboration_graph is not None:
+            for movie in movies:
+                self._collaboration_graph.add_cast(actor.actor_full_name for actor in movie.actors)
+            # A bulk load can add many edges, which the arrays answer faster than the added collaborations.
+            self._collaboration_graph = self._collaboration_graph.folded()
+        # One change for the whole batch, however many movies, genres and people it brought.
+        self._changed('movies', 'add_movies', *movies)
+
+    def _sorted_movies(self):
+        if len(self._unsorted_movies) > 0:
+            # Same order add_movie gives: by year, with the most recently added movie first within a year.
+            self._movies = sorted(self._unsorted_movies[::-1] + self._movies, key=lambda movie: movie.year)
+            self._unsorted_movies = []
+        return self._movies
 
     def add_genre(self, new_g: Genre):
-        if new_g not in self._genres:
-            self._genres.append(new_g)
+        if self._add_genre(new_g):
+            self._changed('movies', 'add_genre', new_g)
 
     def add_actor(self, new_a: Actor):
-        if new_a not in self._actors:
-            self._actors.append(new_a)
+        if self._add_actor(new_a):
+            self._changed('movies', 'add_actor', new_a)
 
     def add_director(self, new_d: Director):
-        if new_d not in self._director:
-            self._director.append(new_d)
+        if self._add_director(new_d):
+            self._changed('movies', 'add_director', new_d)
+
+    # The _add_* helpers return whether the entity was new, and leave publishing the change to their caller.
+    def _add_genre(self, new_g: Genre):
+        if new_g in self._genre_set:
+            return False
+        self._genre_set.add(new_g)
+        self._genres.append(new_g)
+        return True
+
+    def _add_actor(self, new_a: Actor):
+        if new_a in self._actor_set:
+            return False
+        self._actor_set.add(new_a)
+        self._actors.append(new_a)
+        return True
+
+    def _add_director(self, new_d: Director):
+        if new_d in self._director_set:
+            return False
+        self._director_set.add(new_d)
+        self._director.append(new_d)
+        return True
 
     def get_genre_list(self) -> List[Genre]:
         return self._genres
 
     def get_year_list(self) -> List[int]:
-        year_list = list(self._year_dict.keys())
-        year_list.sort()
-        return year_list
+        return self._years
 
     def get_genre_dict(self):
         return self._genre_dict
@@ -140,9 +264,11 @@ class MovieRepo(AbstractRepository):
 
     def set_actors(self, actor_list):
         self._actors = actor_list
+        self._actor_set = set(actor_list)
 
     def set_directors(self, new_d_list):
         self._director = new_d_list
+        self._director_set = set(new_d_list)
 
     def get_movies_by_year(self, target_year: int) -> List[Movie]:
         matching_movies = list()
@@ -190,20 +316,22 @@ class MovieRepo(AbstractRepository):
         return matching_movies
 
     def get_number_of_movies(self):
-        return len(self._movies)
+        return len(self._movies) + len(self._unsorted_movies)
 
     def get_first_movie(self):
         movie = None
+        movies = self._sorted_movies()
 
-        if len(self._movies) > 0:
-            movie = self._movies[0]
+        if len(movies) > 0:
+            movie = movies[0]
         return movie
 
     def get_last_movie(self):
         movie = None
+        movies = self._sorted_movies()
 
-        if len(self._movies) > 0:
-            movie = self._movies[-1]
+        if len(movies) > 0:
+            movie = movies[-1]
         return movie
 
     def get_movies_by_id(self, id_list):
@@ -215,79 +343,158 @@ class MovieRepo(AbstractRepository):
         return movies
 
     def get_movie_ids_for_genre(self, new_genre: str):
-        # Linear search, to find the first occurrence of a Genre with the name tag_name.
-        genre: Genre = next((genre for genre in self._genre_dict if genre.genre_name == new_genre), None)
+        # The posting list is already in rating order, so return its shared immutable snapshot.
+        if new_genre in self._genre_ids:
+            return self._genre_ids[new_genre].ids
+        return ()
+
+    def get_movie_ids_for_year(self, new_year):
+        if new_year in self._year_ids:
+            return self._year_ids[new_year].ids
+        return ()
 
-        # Retrieve the ids of articles associated with the Tag.
+    def get_movie_ids_for_filter(self, genre=None, first_year=None, last_year=None, min_rating=None, max_rating=None,
+                                 order_by='rating'):
+        order_key = filter_order_key(order_by)
+
+        # Start from the narrowest index available: the genre's posting list or those of the years in range.
         if genre is not None:
-            list1 = self._genre_dict[genre]
-            list1.sort(key=lambda movie: movie.rating, reverse=True)
-            movie_ids = [movie.id for movie in list1]
+            movies = self.get_movies_by_id(self.get_movie_ids_for_genre(genre))
+        elif first_year is not None or last_year is not None:
+            movies = self.get_movies_by_id(self._movie_ids_for_year_range(first_year, last_year))
         else:
-            # No Tag with name tag_name, so return an empty list.
-            movie_ids = list()
+            movies = self._movies_index.values()
+
+        matches = [movie for movie in movies
+                   if (first_year is None or year_key(movie) >= first_year)
+                   and (last_year is None or year_key(movie) <= last_year)
+                   and (min_rating is None or rating_key(movie) >= min_rating)
+                   and (max_rating is None or rating_key(movie) <= max_rating)]
+        matches.sort(key=lambda movie: (-order_key(movie), movie.id))
+        return [movie.id for movie in matches]
+
+    def _movie_ids_for_year_range(self, first_year, last_year):
+        start = 0 if first_year is None else bisect_left(self._years, first_year)
+        stop = len(self._years) if last_year is None else bisect_right(self._years, last_year)
+        return [movie_id for year in self._years[start:stop] for movie_id in self._year_ids[year].ids]
+
+    def get_movie_ids_for_facets(self, genre=None, first_year=None, last_year=None, director=None, actor=None,
+                                 min_rating=None, max_rating=None):
+        # Gather the ids each criterion allows from its own index and intersect them, smallest first, so the work
+        # depends on the size of the matches rather than of the catalogue.
+        candidates = []
+        if genre is not None:
+            candidates.append(self.get_movie_ids_for_genre(genre))
+        if first_year is not None or last_year is not None:
+            candidates.append(self._movie_ids_for_year_range(first_year, last_year))
+        if director is not None:
+            candidates.append([movie.id for movie in self._director_dict.get(Director(director), [])])
+        if actor is not None:
+            candidates.append([movie.id for movie in self._actor_dict.get(Actor(actor), [])])
+        if min_rating is not None or max_rating is not None or len(candidates) == 0:
+            candidates.append(self._rating_ids.ids_for_rating_range(min_rating, max_rating))
+
+        candidates.sort(key=len)
+        matches = set(candidates[0])
+        for movie_ids in candidates[1:]:
+            if len(matches) == 0:
+                break
+            matches.intersection_update(movie_ids)
+
+        movies = self.get_movies_by_id(matches)
+        movies.sort(key=lambda movie: (-rating_key(movie), movie.id))
+        return [movie.id for movie in movies]
+
+    def get_facet_counts(self, id_list):
+        counts = {facet: Counter() for facet in FACETS}
+        for movie in self.get_movies_by_id(id_list):
+            counts['year'][movie.year] += 1
+            counts['rating'][int(rating_key(movie))] += 1
+            counts['genre'].update(genre.genre_name for genre in movie.genres)
+            counts['actor'].update(actor.actor_full_name for actor in movie.actors)
+            if movie.director is not None:
+                counts['director'][movie.director.director_full_name] += 1
+        return {facet: dict(counter) for facet, counter in counts.items()}
+
+    def build_similar_movies(self):
+        # Built from the genre, actor and director indexes by populate, or restored from a snapshot; movies added later
+        # are folded in as they arrive.
+        postings = {('genre', name): ids.ids for name, ids in self._genre_ids.items()}
+        postings.update((('actor', actor.actor_full_name), [movie.id for movie in movies])
+                        for actor, movies in self._actor_dict.items())
+        postings.update((('director', director.director_full_name), [movie.id for movie in movies])
+                        for director, movies in self._director_dict.items())
+        self._similar_movies = self.similar_movies_class(postings)
 
-        return movie_ids
+    @property
+    def similar_movies(self) -> SimilarMovies:
+        # Only a repository filled without populate builds the table on first use.
+        if self._similar_movies is None:
+            self.build_similar_movies()
+        return self._similar_movies
 
-    def get_movie_ids_for_year(self, new_year):
-        year = next((year for year in self._year_dict if year == new_year), None)
+    def get_similar_movie_ids(self, movie_id):
+        return self.similar_movies.get(movie_id)
 
-        # Retrieve the ids of articles associated with the Tag.
-        if year is not None:
-            list1 = self._year_dict[year]
-            list1.sort(key=lambda movie: movie.rating, reverse=True)
-            movie_ids = [movie.id for movie in list1]
-        else:
-            # No Tag with name tag_name, so return an empty list.
-            movie_ids = list()
+    def build_collaboration_graph(self):
+        self._collaboration_graph = CollaborationGraph.from_casts(
+            [actor.actor_full_name for actor in movie.actors] for movie in self._movies_index.values())
 
-        return movie_ids
+    def get_collaboration_graph(self) -> CollaborationGraph:
+        # Built when the repository is populated; movies added later are added to it as they arrive.
+        if self._collaboration_graph is None:
+            self.build_collaboration_graph()
+        return self._collaboration_graph
 
     def get_year_of_previous_movie(self, movie: Movie):
         previous_year = None
-        year_list = list(self._year_dict.keys())
-        year_list.sort()
-        position = year_list.index(movie.year)
-        try:
-            index = position - 1
-            if index >= 0:
-                previous_year = year_list[index]
-        except ValueError:
-            # No earlier articles, so return None.
-            pass
+        position = bisect_left(self._years, movie.year)
+        if position > 0:
+            previous_year = self._years[position - 1]
 
         return previous_year
 
     def get_year_of_next_movie(self, movie: Movie):
         next_year = None
-        year_list = list(self._year_dict.keys())
-        year_list.sort()
-        position = year_list.index(movie.year)
-        try:
-            index = position + 1
-            if index < len(year_list):
-                next_year = year_list[index]
-        except ValueError:
-            # No subsequent articles, so return None.
-            pass
+        position = bisect_right(self._years, movie.year)
+        if position < len(self._years):
+            next_year = self._years[position]
 
         return next_year
 
     def add_comment(self, review: Review):
         super().add_comment(review)
         self._reviews.append(review)
+        self._changed('comments', 'add_comment', review)
 
     def get_comments(self):
         return self._reviews
 
+    def get_data_version(self, kind, user_name=None) -> DataVersion:
+        # The change feed's versions count from 0 in every process, so they are qualified with its epoch.
+        return DataVersion(f'{self.changes.epoch}.{self.changes.version(kind, user_name)}',
+                           self.changes.last_changed(kind, user_name))
+
     def add_to_watch_list(self, user: User, movie: Movie):
         # super().add_to_watch_list(user, movie)
         user.add_watch_list(movie)
+        self._changed('watch_lists', 'add_to_watch_list', user, movie)
 
     def get_watch_list(self):
         return self._watch_list
 
+    def get_watch_list_ids(self, user: User, cursor=0, limit=None):
+        stop = None if limit is None else cursor + limit
+        return [movie.id for movie in user.watch_list.by_rating(cursor, stop)]
+
+    def get_watch_list_size(self, user: User) -> int:
+        return user.watch_list.size()
+
+    def get_watch_list_ids_among(self, user: User, id_list):
+        return {movie_id for movie_id in id_list if user.watch_list.contains(movie_id)}
+
     def __iter__(self):
+        self._sorted_movies()
         self._current = 0
         return self
 
@@ -300,7 +507,7 @@ class MovieRepo(AbstractRepository):
 
     # Helper method to return movie index.
     def movie_index(self, movie: Movie):
-        index = bisect_left(self._movies, movie)
+        index = bisect_left(self._sorted_movies(), movie)
         if index != len(self._movies) and self._movies[index].year == movie.year:
             return index
         raise ValueError
@@ -308,12 +515,15 @@ class MovieRepo(AbstractRepository):
     def get_movies(self, movie_name):
         movie_list = []
         movie_name = movie_name.lower()
-        for movie in self._movies:
+        for movie in self._sorted_movies():
             pattern = movie.title.lower()
             if movie_name == pattern:
                 movie_list.append(movie)
         return movie_list
 
+    def get_movie_ids_for_search(self, query):
+        return self._search_index.search(query)
+
     def get_movies_for_actor(self, name):
         name = name.lower()
         match_list = []
@@ -351,45 +561,135 @@ class MovieRepo(AbstractRepository):
         return match_list
 
 
-def new_load_movie_actor_and_genre(data_path, repo: MovieRepo):
-    filename = os.path.join(data_path, "Data1000Movies.csv")
-    with open(filename, mode='r', encoding='utf-8-sig') as csvfile:
-        movie_file_reader = csv.DictReader(csvfile)
-        for row in movie_file_reader:
-            title = row['Title']
-            release_year = int(row['Year'])
-            run_time = int(row['Runtime (Minutes)'])
-            director = Director(row["Director"])
-            actor_list = row["Actors"].split(',')
-            description = row['Description']
-            genre_list = row['Genre'].split(",")
-            rating = row['Rating']
-            votes = row['Votes']
-            rank = int(row['Rank'])
-
-            movie = Movie(title, release_year, new_id=rank)
+    def snapshot_state(self):
+        # Flattens the repository into plain records. Object references become ids or positions in the entity name
+        # lists, so the state can be serialised without walking the cyclic Movie/Actor/Review object graph. The
+        # rating and search indexes hold only ids and are kept as they are.
+        genre_names = {}
+        actor_names = {}
+        director_names = {}
+
+        def genre_position(genre: Genre):
+            return genre_names.setdefault(genre.genre_name, len(genre_names))
+
+        def actor_position(actor: Actor):
+            return actor_names.setdefault(actor.actor_full_name, len(actor_names))
+
+        def director_position(director: Director):
+            return director_names.setdefault(director.director_full_name, len(director_names))
+
+        movie_records = []
+        for movie in self._movies_index.values():
+            director = -1 if movie.director is None else director_position(movie.director)
+            movie_records.append((movie.id, movie.title, movie.year, movie.description, movie.runtime_minutes,
+                                  movie.rating, movie.votes, director,
+                                  tuple(actor_position(actor) for actor in movie.actors),
+                                  tuple(genre_position(genre) for genre in movie.genres)))
+
+        return {
+            'movies': movie_records,
+            'genres': [genre_position(genre) for genre in self._genres],
+            'actors': [actor_position(actor) for actor in self._actors],
+            'directors': [director_position(director) for director in self._director],
+            'genre_dict': [(genre_position(genre), [movie.id for movie in movies])
+                           for genre, movies in self._genre_dict.items()],
+            'actor_dict': [(actor_position(actor), [movie.id for movie in movies])
+                           for actor, movies in self._actor_dict.items()],
+            'director_dict': [(director_position(director), [movie.id for movie in movies])
+                              for director, movies in self._director_dict.items()],
+            'year_dict': [(year, [movie.id for movie in movies]) for year, movies in self._year_dict.items()],
+            'genre_names': list(genre_names),
+            'actor_names': list(actor_names),
+            'director_names': list(director_names),
+            'users': [(user.user_name, user.password, [movie.id for movie in user.watch_list.watch_list])
+                      for user in self._users],
+            'reviews': [(review.user.user_name, review.movie.id, review.review_text, review.timestamp)
+                        for review in self._reviews],
+            'genre_ids': self._genre_ids,
+            'year_ids': self._year_ids,
+            'years': self._years,
+            'rating_ids': self._rating_ids,
+            'search_index': self._search_index,
+            'similar_movies': self.similar_movies,
+            'collaboration_graph': self.get_collaboration_graph().folded(),
+        }
+
+    @classmethod
+    def from_snapshot_state(cls, state):
+        repo = cls()
+        genres = [Genre(name) for name in state['genre_names']]
+        actors = [Actor(name) for name in state['actor_names']]
+        directors = [Director(name) for name in state['director_names']]
+
+        movies = repo._movies_index
+        for movie_id, title, year, description, runtime, rating, votes, director, actor_positions, genre_positions \
+                in state['movies']:
+            movie = Movie(title, year, new_id=movie_id)
             movie.description = description
-            movie.actors = actor_list
-            movie.genres = genre_list
-            movie.runtime_minutes = run_time
+            if runtime is not None:
+                movie.runtime_minutes = runtime
             movie.rating = rating
             movie.votes = votes
+            if director >= 0:
+                movie.director = directors[director]
+                directors[director].movies = movie
+            for actor in actor_positions:
+                movie.add_actor(actors[actor])
+                actors[actor].movies = movie
+            for genre in genre_positions:
+                movie.add_genre(genres[genre])
+                genres[genre].movie_list.append(movie)
+            movies[movie_id] = movie
+        repo._unsorted_movies = list(movies.values())
+
+        repo._genres = [genres[genre] for genre in state['genres']]
+        repo._genre_set = set(repo._genres)
+        repo.set_actors([actors[actor] for actor in state['actors']])
+        repo.set_directors([directors[director] for director in state['directors']])
+        repo._genre_dict = {genres[genre]: [movies[movie_id] for movie_id in ids] for genre, ids in state['genre_dict']}
+        repo._actor_dict = {actors[actor]: [movies[movie_id] for movie_id in ids] for actor, ids in state['actor_dict']}
+        repo._director_dict = {directors[director]: [movies[movie_id] for movie_id in ids]
+                               for director, ids in state['director_dict']}
+        repo._year_dict = {year: [movies[movie_id] for movie_id in ids] for year, ids in state['year_dict']}
+
+        users = {}
+        for name, password, watch_list in state['users']:
+            user = users[name] = User(name, password)
+            for movie_id in watch_list:
+                user.add_watch_list(movies[movie_id])
+        repo.add_users(users.values())
+        for name, movie_id, text, timestamp in state['reviews']:
+            repo._reviews.append(make_review(text, users[name], movies[movie_id], timestamp))
+
+        repo._genre_ids = state['genre_ids']
+        repo._year_ids = state['year_ids']
+        repo._years = state['years']
+        repo._rating_ids = state['rating_ids']
+        repo._search_index = state['search_index']
+        repo._similar_movies = state['similar_movies']
+        repo._collaboration_graph = state['collaboration_graph']
+        return repo
+
+
+def new_load_movie_actor_and_genre(data_path, repo: MovieRepo, chunk_size=10000):
+    filename = os.path.join(data_path, "Data1000Movies.csv")
+    movie_file_reader = MovieFileStreamReader(filename, chunk_size)
 
-            repo.add_movie(movie)
-            repo.add_movie_to_year_dict(movie, release_year)
-            for genre in genre_list:
-                new_g = Genre(genre)
-                new_g.add_movie(movie)
-                repo.add_genre(new_g)
-                repo.add_movie_to_genre_dict(movie, new_g)
+    # Interning pools shared across chunks, so each Genre, Actor and Director is created once.
+    genres = {}
+    actors = {}
+    directors = {}
+    # Loading only creates long-lived objects, so cyclic garbage collection passes over the growing heap are wasted.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for chunk in movie_file_reader.read_chunks():
+            repo.add_movies(build_movies(chunk, genres, actors, directors))
+    finally:
+        if gc_enabled:
+            gc.enable()
 
-            for actor in actor_list:
-                new_a = Actor(actor)
-                new_a.movies = movie
-                repo.add_actor(new_a)
-                repo.add_movie_to_actor_dict(movie, new_a)
-            repo.add_movie_to_director_dict(movie, director)
-            repo.add_director(director)
+    return movie_file_reader
 
 
 def read_csv_file(filename: str):
@@ -409,13 +709,13 @@ def read_csv_file(filename: str):
 def load_users(data_path: str, repo: MovieRepo):
     users = dict()
     filename = os.path.join(data_path, "users.csv")
-    for data_row in read_csv_file(filename):
+    for user_id, user_name, password_hash in read_users(filename):
         user = User(
-            name=data_row[1],
-            password=generate_password_hash(data_row[2])
+            name=user_name,
+            password=password_hash
         )
-        repo.add_user(user)
-        users[data_row[0]] = user
+        users[user_id] = user
+    repo.add_users(users.values())
     return users
 
 
@@ -436,6 +736,9 @@ def populate(data_path, repo: MovieRepo):
     # set up all movies repository
     # load_movies(data_path, repo)
     new_load_movie_actor_and_genre(data_path, repo)
+    # Index who worked with whom, and which movies are alike, once every cast is loaded.
+    repo.build_collaboration_graph()
+    repo.build_similar_movies()
 
     # set up user information
     users = load_users(data_path, repo)
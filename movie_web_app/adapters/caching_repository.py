@@ -0,0 +1,232 @@
+import abc
+import threading
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Iterator, Set
+
+from movie_web_app.adapters.repository import AbstractRepository, ChangeFeed
+from movie_web_app.domainmodel.model import Movie, User, normalise_user_name
+
+
+def _forward(name):
+    def method(self, *args, **kwargs):
+        return getattr(self._repository, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+# An AbstractRepository that passes every method through to self._repository; CachingRepository overrides the reads it
+# caches.
+ForwardingRepository = abc.ABCMeta('ForwardingRepository', (AbstractRepository,), {
+    name: _forward(name) for name in AbstractRepository.__abstractmethods__})
+
+
+def _key(value):
+    # Users and Movies are keyed by name and id, so equal entities from different database sessions share entries.
+    if isinstance(value, User):
+        return ('user', value.user_name)
+    if isinstance(value, Movie):
+        return ('movie', value.id)
+    if isinstance(value, (list, tuple, Set)):
+        return tuple(_key(item) for item in value)
+    return value
+
+
+class ReadCache:
+    """ Results of repository reads, keyed by method and arguments, in one LRU of at most max_entries results.
+
+    A result is dropped ttl seconds after it was loaded (never if ttl is None). Loads run outside the lock; a load that
+    an invalidation overtook is returned to its caller but not stored, so a write is never hidden by an older read.
+    """
+
+    def __init__(self, max_entries=4096, ttl=60, clock=time.monotonic):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._keys_by_method = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._method_counts = {}
+
+    def get(self, method, key, load):
+        key = (method, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or self._clock() < entry[0]):
+                self._entries.move_to_end(key)
+                self._count(method, 'hits')
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+                self._counts['expirations'] += 1
+            self._count(method, 'misses')
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            if generation == self._generation:
+                expires = None if self._ttl is None else self._clock() + self._ttl
+                self._entries[key] = (expires, value)
+                self._keys_by_method.setdefault(method, set()).add(key)
+                while len(self._entries) > self._max_entries:
+                    self._remove(next(iter(self._entries)))
+                    self._counts['evictions'] += 1
+        return value
+
+    def _count(self, method, outcome):
+        self._counts[outcome] += 1
+        self._method_counts.setdefault(method, Counter())[outcome] += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._keys_by_method[key[0]].discard(key)
+
+    def invalidate(self, method, matches=None):
+        # Drops the cached results of method, or only those whose argument key satisfies matches.
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._keys_by_method.get(method, ()) if matches is None or matches(key[1])]
+            for key in keys:
+                self._remove(key)
+            self._counts['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._counts['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._keys_by_method.clear()
+
+    def statistics(self):
+        with self._lock:
+            statistics = {outcome: self._counts[outcome]
+                          for outcome in ('hits', 'misses', 'evictions', 'expirations', 'invalidations')}
+            statistics['entries'] = len(self._entries)
+            statistics['methods'] = {method: dict(counts) for method, counts in self._method_counts.items()}
+            return statistics
+
+
+def _cached(name):
+    def method(self, *args, **kwargs):
+        # An id list given as a generator is read once, for both the key and the wrapped repository.
+        args = tuple(list(arg) if isinstance(arg, Iterator) else arg for arg in args)
+        key = (_key(args), tuple(sorted((keyword, _key(value)) for keyword, value in kwargs.items())))
+        result = self._cache.get(name, key, lambda: getattr(self._repository, name)(*args, **kwargs))
+        result = self._repository.reuse(result)
+        # Callers may sort or extend the lists they are given, so they each get their own copy.
+        return list(result) if isinstance(result, list) else result
+    method.__name__ = name
+    return method
+
+
+# Cached reads that derive from the whole catalogue, dropped whenever any movie or index changes.
+CATALOGUE_READS = ('get_number_of_movies', 'get_first_movie', 'get_last_movie', 'get_genre_list', 'get_year_list',
+                   'get_movie_ids_for_genre', 'get_movie_ids_for_year', 'get_movie_ids_for_search',
+                   'get_movie_ids_for_filter', 'get_movie_ids_for_facets', 'get_facet_counts',
+                   'get_similar_movie_ids', 'get_year_of_previous_movie', 'get_year_of_next_movie')
+# Cached reads of one user's watch list, keyed by the user as their first argument.
+WATCH_LIST_READS = ('get_watch_list_ids', 'get_watch_list_size', 'get_watch_list_ids_among')
+
+
+class CachingRepository(ForwardingRepository):
+    """ Wraps any AbstractRepository and memoises its read methods in a bounded LRU whose entries expire after ttl
+    seconds.
+
+    Every change the wrapped repository publishes on its change feed, whether written through the wrapper or not,
+    drops exactly the results it can change: adding a movie drops that movie's entries and the catalogue-wide reads, a
+    comment drops its movie and author, and a watch list change drops that user's reads. Methods outside
+    AbstractRepository are passed through uncached; call invalidate() after changing the wrapped repository's storage
+    some other way.
+    """
+
+    def __init__(self, repository: AbstractRepository, max_entries=4096, ttl=60, clock=time.monotonic):
+        self._repository = repository
+        self._cache = ReadCache(max_entries, ttl, clock)
+        repository.changes.subscribe(self._on_change)
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    @property
+    def repository(self) -> AbstractRepository:
+        return self._repository
+
+    @property
+    def changes(self) -> ChangeFeed:
+        return self._repository.changes
+
+    def statistics(self):
+        """ Returns the hit, miss, eviction, expiration and invalidation counts, the number of cached results, and
+        the hits and misses of each method.
+        """
+        return self._cache.statistics()
+
+    def invalidate(self):
+        self._cache.clear()
+
+    get_movie = _cached('get_movie')
+    get_movies_by_id = _cached('get_movies_by_id')
+    _get_user = _cached('get_user')
+
+    def get_user(self, username) -> User:
+        # Keyed by the normalised name, so every spelling of it shares the one entry that adding the user drops.
+        return self._get_user(normalise_user_name(username))
+
+    get_comments = _cached('get_comments')
+    get_number_of_movies = _cached('get_number_of_movies')
+    get_first_movie = _cached('get_first_movie')
+    get_last_movie = _cached('get_last_movie')
+    get_genre_list = _cached('get_genre_list')
+    get_year_list = _cached('get_year_list')
+    get_movie_ids_for_genre = _cached('get_movie_ids_for_genre')
+    get_movie_ids_for_year = _cached('get_movie_ids_for_year')
+    get_movie_ids_for_search = _cached('get_movie_ids_for_search')
+    get_movie_ids_for_filter = _cached('get_movie_ids_for_filter')
+    get_movie_ids_for_facets = _cached('get_movie_ids_for_facets')
+    get_facet_counts = _cached('get_facet_counts')
+    get_similar_movie_ids = _cached('get_similar_movie_ids')
+    get_year_of_previous_movie = _cached('get_year_of_previous_movie')
+    get_year_of_next_movie = _cached('get_year_of_next_movie')
+    get_watch_list_ids = _cached('get_watch_list_ids')
+    get_watch_list_size = _cached('get_watch_list_size')
+    get_watch_list_ids_among = _cached('get_watch_list_ids_among')
+
+    def _on_change(self, change):
+        # Subscribed to the wrapped repository's change feed, so writes made through the wrapper and directly on the
+        # wrapped repository alike drop the results they can change.
+        if change.kind == 'movies':
+            movies = [subject for subject in change.subjects if isinstance(subject, Movie)]
+            if change.operation == 'add_genre':
+                self._cache.invalidate('get_genre_list')
+                return
+            self._invalidate_movies({movie.id for movie in movies})
+            self._invalidate_catalogue()
+        elif change.kind == 'comments':
+            self._cache.invalidate('get_comments')
+            for review in change.subjects:
+                self._invalidate_movies({review.movie.id})
+                self._invalidate_user(review.user.user_name)
+        elif change.kind == 'users':
+            for user in change.subjects:
+                self._invalidate_user(user.user_name)
+        elif change.kind == 'watch_lists':
+            self._invalidate_watch_list(change.subjects[0])
+
+    def _invalidate_movies(self, movie_ids):
+        self._cache.invalidate('get_movie', lambda key: len(key[0]) == 0 or key[0][0] in movie_ids)
+        self._cache.invalidate('get_movies_by_id',
+                               lambda key: len(key[0]) == 0 or not movie_ids.isdisjoint(key[0][0]))
+
+    def _invalidate_catalogue(self):
+        for method in CATALOGUE_READS:
+            self._cache.invalidate(method)
+
+    def _invalidate_user(self, user_name):
+        self._cache.invalidate('get_user', lambda key: key[0] == (user_name,))
+
+    def _invalidate_watch_list(self, user: User):
+        for method in WATCH_LIST_READS:
+            self._cache.invalidate(method, lambda key: len(key[0]) == 0 or key[0][0] == _key(user))
+        self._invalidate_user(user.user_name)
@@ -0,0 +1,206 @@
+import heapq
+from array import array
+from bisect import bisect_left
+
+
+class CollaborationGraph:
+    """ Which actors have appeared in a movie together, as a compressed sparse row (CSR) adjacency index.
+
+    Actors are numbered in the order they are first seen. The collaborators of actor v are
+    _neighbours[_offsets[v]:_offsets[v + 1]], in ascending actor number, and _shared holds the number of movies each
+    pair appeared in. Both are flat typed arrays, so the whole graph costs a few bytes per edge and pickles as three
+    buffers. A row is sorted, so whether two actors worked together is a bisection of the shorter row.
+
+    The arrays can't take new edges in place, so the casts of movies added later go into _added, a dict from each
+    actor to a dict of the collaborators and shared movies added since the arrays were built, which the queries
+    consult as well. folded() returns the graph with them merged into the arrays.
+    """
+
+    def __init__(self, names, offsets, neighbours, shared):
+        self._names = names
+        self._index = {name: vertex for vertex, name in enumerate(names)}
+        self._offsets = offsets
+        self._neighbours = neighbours
+        self._shared = shared
+        self._added = {}
+        self._number_added = 0
+
+    @classmethod
+    def from_casts(cls, casts):
+        # casts yields the actor names of each movie.
+        index = {}
+        movies = []
+        for cast in casts:
+            movies.append(sorted({index.setdefault(name, len(index)) for name in cast}))
+
+        # Each co-appearance becomes the key first * count + second, for both orders of the pair, so sorting the keys
+        # groups them into rows and runs of equal keys count the movies a pair shared.
+        count = len(index)
+        keys = sorted(first * count + second for cast in movies for first in cast for second in cast
+                      if first != second)
+
+        offsets = array('q', [0]) * (count + 1)
+        neighbours = array('i')
+        shared = array('I')
+        previous = -1
+        for key in keys:
+            if key == previous:
+                shared[-1] += 1
+                continue
+            previous = key
+            first, second = divmod(key, count)
+            offsets[first + 1] += 1
+            neighbours.append(second)
+            shared.append(1)
+        for vertex in range(count):
+            offsets[vertex + 1] += offsets[vertex]
+        return cls(list(index), offsets, neighbours, shared)
+
+    def add_cast(self, cast):
+        # Links the actors named in cast, the cast of a movie added to the repository.
+        vertices = set()
+        for name in cast:
+            if name not in self._index:
+                self._names.append(name)
+                self._index[name] = len(self._names) - 1
+            vertices.add(self._index[name])
+        cast = sorted(vertices)
+        for first in cast:
+            added = self._added.setdefault(first, {})
+            for second in cast:
+                if first == second:
+                    continue
+                if first < second and second not in added and not self._in_row(first, second):
+                    self._number_added += 1
+                added[second] = added.get(second, 0) + 1
+
+    def folded(self):
+        """ Returns a CollaborationGraph of the same collaborations with those added since this one was built merged
+        into its arrays. """
+        offsets = array('q', [0]) * (len(self._names) + 1)
+        neighbours = array('i')
+        shared = array('I')
+        for vertex in range(len(self._names)):
+            row = dict(zip(self._row_neighbours(vertex), self._row_shared(vertex)))
+            for neighbour, count in self._added.get(vertex, {}).items():
+                row[neighbour] = row.get(neighbour, 0) + count
+            for neighbour in sorted(row):
+                neighbours.append(neighbour)
+                shared.append(row[neighbour])
+            offsets[vertex + 1] = len(neighbours)
+        return CollaborationGraph(list(self._names), offsets, neighbours, shared)
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def number_of_collaborations(self):
+        return len(self._neighbours) // 2 + self._number_added
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def _row(self, vertex):
+        # Actors added since the arrays were built have an empty row.
+        if vertex >= len(self._offsets) - 1:
+            return 0, 0
+        return self._offsets[vertex], self._offsets[vertex + 1]
+
+    def _row_neighbours(self, vertex):
+        start, stop = self._row(vertex)
+        return self._neighbours[start:stop]
+
+    def _row_shared(self, vertex):
+        start, stop = self._row(vertex)
+        return self._shared[start:stop]
+
+    def _in_row(self, first, second):
+        start, stop = self._row(first)
+        position = bisect_left(self._neighbours, second, start, stop)
+        return position < stop and self._neighbours[position] == second
+
+    def _neighbours_of(self, vertex):
+        # The row, then the collaborators added since that aren't in it. The added ones are copied first, so a cast
+        # added meanwhile can't change them while they are read.
+        row = self._row_neighbours(vertex)
+        added = list(self._added.get(vertex, ()))
+        if len(added) == 0:
+            return row
+        return list(row) + [neighbour for neighbour in added if not self._in_row(vertex, neighbour)]
+
+    def worked_with(self, first, second) -> bool:
+        if first not in self._index or second not in self._index:
+            return False
+        first, second = self._index[first], self._index[second]
+        if second in self._added.get(first, ()):
+            return True
+        start, stop = self._row(first)
+        other_start, other_stop = self._row(second)
+        if stop - start > other_stop - other_start:
+            first, second = second, first
+        return self._in_row(first, second)
+
+    def collaborators(self, name):
+        if name not in self._index:
+            return []
+        return [self._names[vertex] for vertex in sorted(self._neighbours_of(self._index[name]))]
+
+    def top_collaborators(self, name, limit=10):
+        # Returns (name, number of shared movies) pairs, most shared first and then by name.
+        if name not in self._index:
+            return []
+        vertex = self._index[name]
+        if vertex not in self._added:
+            start, stop = self._row(vertex)
+            pairs = ((self._names[self._neighbours[edge]], self._shared[edge]) for edge in range(start, stop))
+            return heapq.nsmallest(limit, pairs, key=lambda pair: (-pair[1], pair[0]))
+        shared = dict(zip(self._row_neighbours(vertex), self._row_shared(vertex)))
+        for neighbour, count in list(self._added.get(vertex, {}).items()):
+            shared[neighbour] = shared.get(neighbour, 0) + count
+        pairs = ((self._names[neighbour], count) for neighbour, count in shared.items())
+        return heapq.nsmallest(limit, pairs, key=lambda pair: (-pair[1], pair[0]))
+
+    def shortest_path(self, first, second):
+        """ Returns the names along a shortest chain of collaborations from first to second, both included.
+
+        The search grows a breadth-first frontier from each end, always expanding the smaller one by a whole level,
+        and stops as soon as they meet. With d steps between the actors it reaches about b^(d/2) actors from each end,
+        where a one-sided search reaches b^d. Returns None if either actor is unknown or there is no chain between them.
+        """
+        if first not in self._index or second not in self._index:
+            return None
+        source, target = self._index[first], self._index[second]
+        if source == target:
+            return [first]
+
+        # Each side maps the actors it has reached to the actor it reached them from. No actor is reached by both
+        # sides before the meeting, so the first actor reached by both closes a shortest chain.
+        forward, backward = {source: None}, {target: None}
+        forward_frontier, backward_frontier = [source], [target]
+        while forward_frontier and backward_frontier:
+            if len(forward_frontier) > len(backward_frontier):
+                forward, backward = backward, forward
+                forward_frontier, backward_frontier = backward_frontier, forward_frontier
+
+            next_frontier = []
+            for vertex in forward_frontier:
+                for neighbour in self._neighbours_of(vertex):
+                    if neighbour in forward:
+                        continue
+                    forward[neighbour] = vertex
+                    if neighbour in backward:
+                        path = self._walk(forward, neighbour)[::-1] + self._walk(backward, neighbour)[1:]
+                        if path[0] != source:
+                            path.reverse()
+                        return [self._names[step] for step in path]
+                    next_frontier.append(neighbour)
+            forward_frontier = next_frontier
+        return None
+
+    @staticmethod
+    def _walk(parents, vertex):
+        path = []
+        while vertex is not None:
+            path.append(vertex)
+            vertex = parents[vertex]
+        return path
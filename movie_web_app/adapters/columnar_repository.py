@@ -0,0 +1,143 @@
+from itertools import islice
+
+import numpy as np
+
+from movie_web_app.adapters.Movie_repo import MovieRepo
+from movie_web_app.adapters.repository import rating_key, votes_key, year_key, runtime_key, filter_order_key
+from movie_web_app.adapters.similar_movies import SimilarMovies
+from movie_web_app.domainmodel.model import Movie, Genre
+
+WORD_BITS = 64
+
+
+class MovieColumns:
+    """ Read-only column arrays over a fixed set of movies, with one row per movie in year order.
+
+    Year, rating, votes and runtime are held as NumPy arrays and genre membership as a bitmask with one bit per genre,
+    so a filter is a handful of vectorised comparisons and a year range is a contiguous slice of rows.
+    """
+
+    def __init__(self, movies, genre_ids):
+        movies = sorted(movies, key=lambda movie: (year_key(movie), movie.id))
+        count = len(movies)
+        self.ids = np.fromiter((movie.id for movie in movies), dtype=np.int64, count=count)
+        self.years = np.fromiter((year_key(movie) for movie in movies), dtype=np.int32, count=count)
+        self.ratings = np.fromiter((rating_key(movie) for movie in movies), dtype=np.float64, count=count)
+        self.votes = np.fromiter((votes_key(movie) for movie in movies), dtype=np.int64, count=count)
+        self.runtimes = np.fromiter((runtime_key(movie) for movie in movies), dtype=np.int32, count=count)
+
+        # genre_ids maps each genre name to the ids of its movies; each genre gets the next free bit.
+        rows = {movie_id: row for row, movie_id in enumerate(self.ids.tolist())}
+        self.genre_bits = {name: bit for bit, name in enumerate(genre_ids)}
+        self.genre_mask = np.zeros((count, max(1, -(-len(self.genre_bits) // WORD_BITS))), dtype=np.uint64)
+        for name, bit in self.genre_bits.items():
+            genre_rows = np.fromiter((rows[movie_id] for movie_id in genre_ids[name] if movie_id in rows),
+                                     dtype=np.intp)
+            self.genre_mask[genre_rows, bit // WORD_BITS] |= np.uint64(1 << bit % WORD_BITS)
+
+    def column(self, order_by):
+        return {'rating': self.ratings, 'votes': self.votes, 'year': self.years, 'runtime': self.runtimes}[order_by]
+
+    def select(self, genre=None, first_year=None, last_year=None, min_rating=None, max_rating=None,
+               order_by='rating'):
+        if genre is not None and genre not in self.genre_bits:
+            return []
+
+        # Rows are in year order, so the year bounds narrow the scan to a slice before any masks are built.
+        start = 0 if first_year is None else int(np.searchsorted(self.years, first_year, side='left'))
+        stop = len(self.years) if last_year is None else int(np.searchsorted(self.years, last_year, side='right'))
+        keep = np.ones(max(0, stop - start), dtype=bool)
+        if genre is not None:
+            bit = self.genre_bits[genre]
+            keep &= (self.genre_mask[start:stop, bit // WORD_BITS] & np.uint64(1 << bit % WORD_BITS)) != 0
+        if min_rating is not None:
+            keep &= self.ratings[start:stop] >= min_rating
+        if max_rating is not None:
+            keep &= self.ratings[start:stop] <= max_rating
+
+        rows = np.flatnonzero(keep) + start
+        ids = self.ids[rows]
+        # lexsort sorts by its last key first: highest value first, then ascending id.
+        order = np.lexsort((ids, -self.column(order_by)[rows]))
+        return ids[order].tolist()
+
+
+class ColumnarSimilarMovies(SimilarMovies):
+    """ SimilarMovies whose full build computes the rows of the similarity matrix with NumPy.
+
+    The posting lists are concatenated into one array of movie rows, so a movie's row is a gather of its features'
+    postings and a weighted bincount, with no Python loop over the movies it shares features with. The dot products
+    are added in the same order as the pure Python build, so both keep the same neighbours.
+    """
+
+    def _build_rows(self):
+        movie_ids = np.fromiter(self._features, dtype=np.int64, count=len(self._features))
+        rows = {movie_id: row for row, movie_id in enumerate(movie_ids.tolist())}
+        norms = np.fromiter((self._norms[movie_id] for movie_id in self._features), dtype=np.float64,
+                            count=len(self._features))
+
+        features = list(self._postings)
+        columns = {feature: column for column, feature in enumerate(features)}
+        squared_weights = np.array([self._weights[feature] ** 2 for feature in features], dtype=np.float64)
+        lengths = np.array([min(len(self._postings[feature]), self._max_postings) for feature in features],
+                           dtype=np.intp)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        posting_rows = np.fromiter((rows[movie_id] for feature in features
+                                    for movie_id in islice(self._postings[feature], self._max_postings)),
+                                   dtype=np.intp, count=int(offsets[-1]))
+
+        result = {}
+        for row, movie_id in enumerate(movie_ids.tolist()):
+            own = np.array([columns[feature] for feature in self._features[movie_id]], dtype=np.intp)
+            own = own[squared_weights[own] > 0]
+            if len(own) == 0:
+                result[movie_id] = []
+                continue
+            others = np.concatenate([posting_rows[offsets[column]:offsets[column + 1]] for column in own])
+            candidates, positions = np.unique(others, return_inverse=True)
+            dots = np.bincount(positions, weights=np.repeat(squared_weights[own], lengths[own]))
+            keep = candidates != row
+            candidates = candidates[keep]
+            scores = dots[keep] / (norms[row] * norms[candidates])
+            # lexsort sorts by its last key first: highest score first, then ascending id.
+            order = np.lexsort((movie_ids[candidates], -scores))[:self._neighbours]
+            result[movie_id] = list(zip((-scores[order]).tolist(), movie_ids[candidates[order]].tolist()))
+        return result
+
+
+class ColumnarMovieRepo(MovieRepo):
+    """ MovieRepo that answers get_movie_ids_for_filter from NumPy column arrays.
+
+    The columns are built on the first filter query and rebuilt only after movies or genres have changed. The similar
+    movies table is built with NumPy too.
+    """
+
+    similar_movies_class = ColumnarSimilarMovies
+
+    def __init__(self):
+        super().__init__()
+        self._columns = None
+
+    @property
+    def columns(self) -> MovieColumns:
+        if self._columns is None:
+            genre_ids = {name: postings.ids for name, postings in self._genre_ids.items()}
+            self._columns = MovieColumns(self._movies_index.values(), genre_ids)
+        return self._columns
+
+    def add_movie(self, movie: Movie):
+        super().add_movie(movie)
+        self._columns = None
+
+    def add_movies(self, movies):
+        super().add_movies(movies)
+        self._columns = None
+
+    def add_movie_to_genre_dict(self, movie: Movie, new_g: Genre):
+        super().add_movie_to_genre_dict(movie, new_g)
+        self._columns = None
+
+    def get_movie_ids_for_filter(self, genre=None, first_year=None, last_year=None, min_rating=None, max_rating=None,
+                                 order_by='rating'):
+        filter_order_key(order_by)
+        return self.columns.select(genre, first_year, last_year, min_rating, max_rating, order_by)
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from movie_web_app.adapters.orm import metadata, record_change
+from movie_web_app.adapters.repository import RepositoryException
+from movie_web_app.domainmodel.model import Review
+
+logger = logging.getLogger(__name__)
+
+
+class CommentWriter:
+    """ Write-behind queue for the comments posted in database mode.
+
+    add() returns as soon as a comment is queued. A background thread writes queued comments in batches of up to
+    batch_size, one transaction per batch, at most max_latency seconds after the oldest of them was queued; the same
+    transaction records the new version of the comments. A write that fails with an OperationalError, such as SQLite's
+    "database is locked", is tried again after retry_delay seconds, doubling up to max_retry_delay, until it succeeds
+    or the writer is closed; comments the database refuses otherwise are logged and dropped.
+    wait_for(username) blocks until that user's comments have been written, so authors always see their own comments,
+    and close() writes everything still queued before it returns.
+    """
+
+    def __init__(self, engine, batch_size=100, max_latency=0.05, retry_delay=0.05, max_retry_delay=5.0):
+        self._engine = engine
+        self._batch_size = batch_size
+        self._max_latency = max_latency
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._queue = deque()
+        # Number of comments queued or being written, by author.
+        self._pending = Counter()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        # The author is looked up by user name inside the insert, so a batch is a single executemany.
+        comments, users = metadata.tables['comments'], metadata.tables['users']
+        self._insert = comments.insert().values(
+            user_id=select([users.c.id]).where(users.c.username == bindparam('author')).as_scalar(),
+            movie_id=bindparam('movie'), comment=bindparam('text'), timestamp=bindparam('posted'))
+
+        self._thread = threading.Thread(target=self._run, name='comment-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, review: Review, on_written=None):
+        # on_written is called on the writer thread once the comment is in the database, and not if it is dropped.
+        row = {'author': review.user.user_name, 'movie': review.movie.id, 'text': review.review_text,
+               'posted': review.timestamp}
+        with self._condition:
+            if self._closed:
+                raise RepositoryException('CommentWriter is closed')
+            self._queue.append((time.monotonic(), row, on_written))
+            self._pending[row['author']] += 1
+            self._condition.notify_all()
+
+    def wait_for(self, username, timeout=None) -> bool:
+        # Returns False if username still had comments waiting to be written after timeout seconds.
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending[username] == 0, timeout)
+
+    def flush(self, timeout=None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._pending) == 0, timeout)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._closed:
+                    self._condition.wait()
+                if len(self._queue) == 0:
+                    return
+
+                # Let a burst of comments gather into one batch, but never hold the oldest longer than max_latency.
+                deadline = self._queue[0][0] + self._max_latency
+                while len(self._queue) < self._batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                entries = [self._queue.popleft() for _ in range(min(len(self._queue), self._batch_size))]
+            batch = [row for _, row, _ in entries]
+
+            # Nothing may stop the thread while comments are queued, or their authors would wait for them forever.
+            try:
+                written = self._write(batch)
+            except Exception:
+                logger.exception("Dropped %d comments", len(batch))
+                written = [False] * len(batch)
+            try:
+                # Called before the authors are told, so what reacts to a comment is done when its author reads.
+                for (_, _, on_written), was_written in zip(entries, written):
+                    if on_written is not None and was_written:
+                        try:
+                            on_written()
+                        except Exception:
+                            logger.exception("Comment callback %r failed", on_written)
+            finally:
+                with self._condition:
+                    for row in batch:
+                        self._pending[row['author']] -= 1
+                        if self._pending[row['author']] == 0:
+                            del self._pending[row['author']]
+                    self._condition.notify_all()
+
+    def _write(self, batch):
+        # Returns whether each row of batch was written.
+        if self._insert_rows(batch):
+            return [True] * len(batch)
+        logger.warning("Writing a batch of %d comments failed; retrying them one at a time", len(batch))
+
+        # Write the comments one by one, so one bad comment doesn't lose the rest of its batch.
+        written = []
+        for row in batch:
+            written.append(self._insert_rows([row]))
+            if not written[-1]:
+                logger.error("Dropped comment by %s on movie %s", row['author'], row['movie'])
+        return written
+
+    def _insert_rows(self, rows) -> bool:
+        # Inserts rows in one transaction, retrying it after operational errors until the writer is closed. Returns
+        # False if the rows were not written.
+        delay = self._retry_delay
+        while True:
+            try:
+                with self._engine.begin() as connection:
+                    connection.execute(self._insert, rows)
+                    record_change(connection, 'comments')
+                return True
+            except OperationalError:
+                with self._condition:
+                    if self._closed:
+                        logger.exception("Writing %d comments failed while closing", len(rows))
+                        return False
+                    logger.warning("Writing %d comments failed; retrying in %.2fs", len(rows), delay, exc_info=True)
+                    self._condition.wait_for(lambda: self._closed, delay)
+                delay = min(delay * 2, self._max_retry_delay)
+            except SQLAlchemyError:
+                logger.exception("Writing %d comments failed", len(rows))
+                return False
@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+
+def create_database_engine(database_uri, echo=False, pool_size=5, pragmas=None):
+    """ Returns an Engine for database_uri.
+
+    For SQLite files, a pool_size above 0 keeps that many connections open for reuse (0 opens a new connection for
+    every session), and each new connection is configured with the given pragmas, e.g. {'journal_mode': 'WAL'}.
+    An in-memory SQLite database is held on one shared connection, as each connection would otherwise see its own
+    empty database.
+    """
+    url = make_url(database_uri)
+    options = dict(echo=echo)
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'check_same_thread': False}
+        if url.database in (None, '', ':memory:'):
+            options['poolclass'] = StaticPool
+        elif pool_size > 0:
+            options.update(poolclass=QueuePool, pool_size=pool_size, max_overflow=pool_size)
+        else:
+            options['poolclass'] = NullPool
+
+    engine = create_engine(database_uri, **options)
+    if url.get_backend_name() == 'sqlite' and pragmas:
+        event.listen(engine, 'connect', lambda connection, record: set_sqlite_pragmas(connection, pragmas))
+    return engine
+
+
+def set_sqlite_pragmas(connection, pragmas):
+    cursor = connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
@@ -1,20 +1,33 @@
 import csv
+import logging
 import os
+import time
 
-from datetime import date
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
 from typing import List
 
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, and_, func, cast, select, inspect, Integer, event
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
-from werkzeug.security import generate_password_hash
 
 from sqlalchemy.orm import scoped_session
 from flask import _app_ctx_stack
 
-from movie_web_app.datafilereaders.movie_file_csv_reader import MovieFileCSVReader
-from movie_web_app.domainmodel.model import User, Movie, Review, Genre, Director, Actor
-from movie_web_app.adapters.repository import AbstractRepository
+from movie_web_app.datafilereaders.movie_file_stream_reader import MovieFileStreamReader, COLUMNS
+from movie_web_app.domainmodel.model import User, Movie, Review, Genre, Director, Actor, normalise_user_name
+from movie_web_app.adapters.orm import PersistentMovie, PersistentGenre, PersistentActor, PersistentDirector, \
+    loader_options, metadata, create_indexes, watch_list, movie_tokens, data_versions, new_data_version, record_change
+from movie_web_app.adapters.repository import AbstractRepository, DataVersion, filter_order_key, change_user_names, \
+    CHANGE_KINDS
+from movie_web_app.adapters.collaboration_graph import CollaborationGraph
+from movie_web_app.adapters.search_index import tokenize, text_tokens, movie_tokens as tokens_of_movie
+from movie_web_app.adapters.similar_movies import SimilarMovies, movie_features
+from movie_web_app.adapters.user_import import read_users
+
+logger = logging.getLogger(__name__)
 
 genres = None
 
@@ -42,19 +55,40 @@ class SessionContextManager:
 
     def reset_session(self):
         # this method can be used e.g. to allow Flask to start a new session for each http request,
-        # via the 'before_request' callback
+        # via the 'before_request' callback. The scoped session registry is kept; only the current session is
+        # discarded, and the next use takes a fresh one (and a pooled connection) from the registry.
         self.close_current_session()
-        self.__session = scoped_session(self.__session_factory, scopefunc=_app_ctx_stack.__ident_func__)
 
     def close_current_session(self):
         if not self.__session is None:
-            self.__session.close()
+            self.__session.remove()
 
 
 class SqlAlchemyRepository(AbstractRepository):
 
-    def __init__(self, session_factory):
+    def __init__(self, session_factory, comment_writer=None):
+        super().__init__()
         self._session_cm = SessionContextManager(session_factory)
+        self._query_count = 0
+        # Optional CommentWriter; when given, comments are queued and written in batches in the background.
+        self._comment_writer = comment_writer
+        self._similar_movies = None
+        self._collaboration_graph = None
+
+        # Count every statement sent to the database, so tests can check how many queries a page costs.
+        engine = session_factory.kw.get('bind')
+        if engine is not None:
+            event.listen(engine, 'before_cursor_execute', self._count_query)
+
+    def _count_query(self, *args):
+        self._query_count += 1
+
+    @property
+    def query_count(self):
+        return self._query_count
+
+    def reset_query_count(self):
+        self._query_count = 0
 
     def close_session(self):
         self._session_cm.close_current_session()
@@ -62,15 +96,43 @@ class SqlAlchemyRepository(AbstractRepository):
     def reset_session(self):
         self._session_cm.reset_session()
 
+    def get_data_version(self, kind, user_name=None) -> DataVersion:
+        # Every write records the new versions of the data it changes in its own transaction, so a version never
+        # names data other than that committed with it.
+        query = select([data_versions.c.version, data_versions.c.changed]).where(data_versions.c.kind == kind).where(
+            data_versions.c.user_name == ('' if user_name is None else user_name))
+        row = self._session_cm.session.execute(query).first()
+        return DataVersion('', None) if row is None else DataVersion(*row)
+
+    def reuse(self, result):
+        # Entities kept from an earlier request are detached from the session they were loaded in. Merging without
+        # load copies their loaded state into the current session without querying the database again.
+        if isinstance(result, list):
+            return [self.reuse(item) for item in result]
+        if isinstance(result, (Movie, User, Review)):
+            return self._session_cm.session.merge(result, load=False)
+        return result
+
     def add_user(self, user: User):
         with self._session_cm as scm:
             scm.session.add(user)
+            record_change(scm.session, 'users', [user.user_name])
+            scm.commit()
+        self._changed('users', 'add_user', user)
+
+    def add_users(self, users):
+        users = list(users)
+        with self._session_cm as scm:
+            scm.session.add_all(users)
+            record_change(scm.session, 'users', change_user_names(users))
             scm.commit()
+        self._changed('users', 'add_users', *users)
 
     def get_user(self, username) -> User:
         user = None
         try:
-            user = self._session_cm.session.query(User).filter_by(_username=username).one()
+            user = self._session_cm.session.query(User).filter_by(
+                _User__user_name=normalise_user_name(username)).one()
         except NoResultFound:
             # Ignore any exception and return None.
             pass
@@ -79,32 +141,92 @@ class SqlAlchemyRepository(AbstractRepository):
 
     def add_movie(self, movie: Movie):
         with self._session_cm as scm:
-            scm.session.add(movie)
+            persistent = self._persistent_movie(scm.session, movie)
+            scm.session.add(persistent)
+            scm.session.flush()
+            scm.session.execute(movie_tokens.insert(), [
+                {'movie_id': persistent.id, 'token': token} for token in tokens_of_movie(persistent)])
+            record_change(scm.session, 'movies')
             scm.commit()
+        if movie.id is None:
+            movie.id = persistent.id
+        if self._similar_movies is not None:
+            self._similar_movies.add_movie(persistent.id, movie_features(persistent))
+        if self._collaboration_graph is not None:
+            self._collaboration_graph.add_cast(actor.actor_full_name for actor in persistent.actors)
+        self._changed('movies', 'add_movie', persistent)
 
     def add_genre(self, genre: Genre):
-        with self._session_cm as scm:
-            scm.session.add(genre)
-            scm.commit()
+        self._add_entity(PersistentGenre, genre.genre_name, 'add_genre')
 
     def add_actor(self, actor: Actor):
-        with self._session_cm as scm:
-            scm.session.add(actor)
-            scm.commit()
+        self._add_entity(PersistentActor, actor.actor_full_name, 'add_actor')
 
     def add_director(self, director: Director):
+        self._add_entity(PersistentDirector, director.director_full_name, 'add_director')
+
+    def _add_entity(self, persistent_class, name, operation):
+        # Genres, actors and directors are unique by name, as in the memory repository.
         with self._session_cm as scm:
-            scm.session.add(director)
+            if self._find_entity(scm.session, persistent_class, name) is not None:
+                return
+            entity = persistent_class(name)
+            scm.session.add(entity)
+            record_change(scm.session, 'movies')
             scm.commit()
+        self._changed('movies', operation, entity)
+
+    # Only the Persistent* subclasses are mapped, so domain objects are copied into them before they are added; the
+    # genres, actors and director of a movie are the stored ones of the same name where they exist.
+    @staticmethod
+    def _find_entity(session, persistent_class, name):
+        name_column = {PersistentGenre: PersistentGenre._Genre__genre_name,
+                       PersistentActor: PersistentActor._Actor__actor_full_name,
+                       PersistentDirector: PersistentDirector._Director__director_full_name}[persistent_class]
+        return session.query(persistent_class).filter(name_column == name).first()
+
+    def _persistent_entity(self, session, persistent_class, name, added):
+        entity = added.get((persistent_class, name))
+        if entity is None:
+            entity = self._find_entity(session, persistent_class, name) or persistent_class(name)
+            added[(persistent_class, name)] = entity
+        return entity
+
+    def _persistent_movie(self, session, movie: Movie) -> PersistentMovie:
+        if isinstance(movie, PersistentMovie):
+            return movie
+        # The movies columns are not nullable, so details the movie doesn't have are stored empty, as populate does.
+        persistent = PersistentMovie(movie.title, movie.year, movie.id, movie.hyperlink or '')
+        persistent._description = movie.description or ''
+        persistent._runtime_minutes = movie.runtime_minutes or 0
+        persistent.rating = movie.rating or 0
+        persistent.votes = movie.votes or 0
+
+        # Entities already made for this movie, so a name listed twice isn't inserted twice. Linking a stored entity
+        # cascades the movie into the session, so the lookups must not flush it half built.
+        added = {}
+        with session.no_autoflush:
+            for genre in movie.genres:
+                genre = self._persistent_entity(session, PersistentGenre, genre.genre_name, added)
+                if genre not in persistent.genres:
+                    persistent.add_genre(genre)
+            for actor in movie.actors:
+                actor = self._persistent_entity(session, PersistentActor, actor.actor_full_name, added)
+                if actor not in persistent.actors:
+                    persistent.add_actor(actor)
+            if movie.director is not None:
+                persistent.director = self._persistent_entity(
+                    session, PersistentDirector, movie.director.director_full_name, added)
+        return persistent
 
     def get_genre_list(self) -> List[Genre]:
-        genres_list = self._session_cm.session.query(Genre).all()
+        genres_list = self._session_cm.session.query(PersistentGenre).all()
         return genres_list
 
     def get_movie(self, id: int) -> Movie:
         movie = None
         try:
-            movie = self._session_cm.session.query(Movie).filter(Movie._id == id).one()
+            movie = self._session_cm.session.query(PersistentMovie).filter(PersistentMovie._id == id).one()
         except NoResultFound:
             # Ignore any exception and return None.
             pass
@@ -113,55 +235,55 @@ class SqlAlchemyRepository(AbstractRepository):
 
     def get_movies_by_year(self, target_year: int) -> List[Movie]:
         if target_year is None:
-            movies = self._session_cm.session.query(Movie).all()
+            movies = self._session_cm.session.query(PersistentMovie).all()
             return movies
         else:
             # Return articles matching target_date; return an empty list if there are no matches.
-            movies = self._session_cm.session.query(Movie).filter(Movie._year == target_year).all()
+            movies = self._session_cm.session.query(PersistentMovie).filter(PersistentMovie._year == target_year).all()
             return movies
 
     def get_number_of_movies(self):
-        number_of_movies = self._session_cm.session.query(Movie).count()
+        number_of_movies = self._session_cm.session.query(PersistentMovie).count()
         return number_of_movies
 
+    # Ordered by year like the memory repository, which within a year puts the most recently added movie first.
     def get_first_movie(self):
-        movie = self._session_cm.session.query(Movie).first()
+        movie = self._session_cm.session.query(PersistentMovie).order_by(
+            asc(PersistentMovie._Movie__year), desc(PersistentMovie._id)).first()
         return movie
 
     def get_last_movie(self):
-        movie = self._session_cm.session.query(Movie).order_by(desc(Movie._id)).first()
+        movie = self._session_cm.session.query(PersistentMovie).order_by(
+            desc(PersistentMovie._Movie__year), asc(PersistentMovie._id)).first()
         return movie
 
     def get_movies_by_id(self, id_list):
-        movies = self._session_cm.session.query(Movie).filter(Movie._id.in_(id_list)).all()
-        return movies
-
-    def get_movie_ids_for_genre(self, new_genre: str):
-        movie_ids = []
-
-        # Use native SQL to retrieve article ids, since there is no mapped class for the article_tags table.
-        row = self._session_cm.session.execute('SELECT id FROM tags WHERE name = :tag_name',
-                                               {'tag_name': new_genre}).fetchone()
-
-        if row is None:
-            # No tag with the name tag_name - create an empty list.
-            movie_ids = list()
-        else:
-            genre_id = row[0]
+        id_list = list(id_list)
+        if len(id_list) == 0:
+            return []
+        movies = self._session_cm.session.query(PersistentMovie).options(*loader_options['movie_listing']).filter(
+            PersistentMovie._id.in_(id_list)).all()
 
-            # Retrieve article ids of articles associated with the tag.
-            movie_ids = self._session_cm.session.execute(
-                'SELECT article_id FROM article_tags WHERE tag_id = :tag_id ORDER BY article_id ASC',
-                {'genre_id': genre_id}
-            ).fetchall()
-            movie_ids = [id[0] for id in movie_ids]
+        # Return the movies in the order of id_list, as the memory repository does.
+        movies_by_id = {movie.id: movie for movie in movies}
+        return [movies_by_id[movie_id] for movie_id in id_list if movie_id in movies_by_id]
 
-        return movie_ids
+    def get_movie_ids_for_genre(self, new_genre: str):
+        # Use native SQL to retrieve movie ids, since there is no mapped class for the movie_genres table.
+        movie_ids = self._session_cm.session.execute(
+            'SELECT movies.id FROM movies '
+            'JOIN movie_genres ON movie_genres.movie_id = movies.id '
+            'JOIN genres ON genres.id = movie_genres.genre_id '
+            'WHERE genres.name = :genre_name ORDER BY movies.rating DESC, movies.id ASC',
+            {'genre_name': new_genre}
+        ).fetchall()
+        return tuple(id[0] for id in movie_ids)
 
     def get_year_of_previous_movie(self, movie: Movie):
         result = None
-        prev = self._session_cm.session.query(Movie).filter(Movie._Movie__year < movie.year).order_by(
-            desc(Movie._Movie__year)).first()  # might have problem
+        prev = self._session_cm.session.query(PersistentMovie).filter(
+            PersistentMovie._Movie__year < movie.year).order_by(
+            desc(PersistentMovie._Movie__year)).first()  # might have problem
 
         if prev is not None:
             result = prev.year
@@ -170,8 +292,9 @@ class SqlAlchemyRepository(AbstractRepository):
 
     def get_year_of_next_movie(self, movie: Movie):
         result = None
-        next = self._session_cm.session.query(Movie).filter(Movie._Movie__year > movie.year).order_by(
-            asc(Movie._Movie__year)).first()
+        next = self._session_cm.session.query(PersistentMovie).filter(
+            PersistentMovie._Movie__year > movie.year).order_by(
+            asc(PersistentMovie._Movie__year)).first()
 
         if next is not None:
             result = next.year
@@ -179,14 +302,40 @@ class SqlAlchemyRepository(AbstractRepository):
         return result
 
     def get_comments(self):
+        if self._comment_writer is not None:
+            self._comment_writer.flush()
         comments = self._session_cm.session.query(Review).all()
         return comments
 
     def add_comment(self, review: Review):
         super().add_comment(review)
+        if self._comment_writer is not None:
+            # The comment was cascaded into the session when it was attached to its user and movie; leaving the
+            # context manager rolls the session back, so only the comment writer inserts it.
+            # The change is published from the writer thread once the comment is in the database, so nothing that
+            # reacts to it can read the comments from before it. The writer records the new version in the same
+            # transaction as the comment.
+            with self._session_cm:
+                self._comment_writer.add(review, lambda: self._changed('comments', 'add_comment', review))
+            return
+
         with self._session_cm as scm:
             scm.session.add(review)
+            record_change(scm.session, 'comments')
             scm.commit()
+        self._changed('comments', 'add_comment', review)
+
+    def close(self):
+        # Writes any queued comments and stops the comment writer.
+        if self._comment_writer is not None:
+            self._comment_writer.close()
+
+    def wait_for_comments(self, username, timeout=None) -> bool:
+        # Read-your-writes: blocks until the comments username has posted are in the database. Returns False if some
+        # were still waiting to be written after timeout seconds.
+        if self._comment_writer is not None:
+            return self._comment_writer.wait_for(normalise_user_name(username), timeout)
+        return True
 
     def __iter__(self):
         self._current = 0
@@ -195,6 +344,20 @@ class SqlAlchemyRepository(AbstractRepository):
     def __next__(self):
         pass
 
+    def get_movie_ids_for_search(self, query):
+        terms = tokenize(query)
+        if len(terms) == 0:
+            return []
+
+        # Each term must be a prefix of one of the movie's tokens, as in the memory repository's SearchIndex.
+        movies = metadata.tables['movies']
+        query = select([movies.c.id])
+        for term in set(terms):
+            query = query.where(movies.c.id.in_(
+                select([movie_tokens.c.movie_id]).where(prefix_range(movie_tokens.c.token, term))))
+        query = query.order_by(desc(movies.c.rating), asc(movies.c.id))
+        return [row[0] for row in self._session_cm.session.execute(query)]
+
     def get_movies(self, movie_name):
         pass
 
@@ -207,17 +370,62 @@ class SqlAlchemyRepository(AbstractRepository):
     def get_movies_for_director(self, name):
         pass
 
+    @staticmethod
+    def _user_id(user: User):
+        # Selects the user's id inside the watch list statements, rather than with a query of its own.
+        users = metadata.tables['users']
+        return select([users.c.id]).where(users.c.username == user.user_name).as_scalar()
+
     def add_to_watch_list(self, user: User, movie: Movie):
-        pass
+        if len(self.get_watch_list_ids_among(user, [movie.id])) > 0:
+            return
+        with self._session_cm as scm:
+            try:
+                scm.session.execute(watch_list.insert().values(user_id=self._user_id(user), movie_id=movie.id))
+                record_change(scm.session, 'watch_lists', [user.user_name])
+                scm.commit()
+            except IntegrityError:
+                # Another request added the movie between the check and the insert, which leaves the watch list as
+                # asked, so there's nothing to do. Anything else the constraints refused is still an error.
+                scm.rollback()
+                if len(self.get_watch_list_ids_among(user, [movie.id])) == 0:
+                    raise
+                return
+        self._changed('watch_lists', 'add_to_watch_list', user, movie)
 
     def get_watch_list(self):
         pass
 
+    def get_watch_list_ids(self, user: User, cursor=0, limit=None):
+        movies = metadata.tables['movies']
+        query = select([watch_list.c.movie_id]).select_from(
+            watch_list.join(movies, movies.c.id == watch_list.c.movie_id)).where(
+            watch_list.c.user_id == self._user_id(user)).order_by(
+            desc(movies.c.rating), asc(watch_list.c.id)).offset(cursor).limit(limit)
+        return [row[0] for row in self._session_cm.session.execute(query)]
+
+    def get_watch_list_size(self, user: User) -> int:
+        query = select([func.count()]).select_from(watch_list).where(watch_list.c.user_id == self._user_id(user))
+        return self._session_cm.session.execute(query).scalar()
+
+    def get_watch_list_ids_among(self, user: User, id_list):
+        id_list = list(id_list)
+        if len(id_list) == 0:
+            return set()
+        query = select([watch_list.c.movie_id]).where(watch_list.c.user_id == self._user_id(user)).where(
+            watch_list.c.movie_id.in_(id_list))
+        return {row[0] for row in self._session_cm.session.execute(query)}
+
     def movie_index(self, movie: Movie):
         pass
 
     def remove_from_watch_list(self, user: User, movie: Movie):
-        pass
+        with self._session_cm as scm:
+            scm.session.execute(watch_list.delete().where(watch_list.c.user_id == self._user_id(user)).where(
+                watch_list.c.movie_id == movie.id))
+            record_change(scm.session, 'watch_lists', [user.user_name])
+            scm.commit()
+        self._changed('watch_lists', 'remove_from_watch_list', user, movie)
 
     def get_movie_index(self, new_id):
         pass
@@ -250,10 +458,120 @@ class SqlAlchemyRepository(AbstractRepository):
         pass
 
     def get_movie_ids_for_year(self, new_year):
-        pass
+        rows = self._session_cm.session.query(PersistentMovie._id).filter(
+            PersistentMovie._Movie__year == new_year).order_by(
+            desc(PersistentMovie._rating), asc(PersistentMovie._id)).all()
+        return tuple(row[0] for row in rows)
+
+    def get_movie_ids_for_filter(self, genre=None, first_year=None, last_year=None, min_rating=None, max_rating=None,
+                                 order_by='rating'):
+        filter_order_key(order_by)
+        order_columns = {
+            'rating': PersistentMovie._rating,
+            'votes': PersistentMovie._votes,
+            'year': PersistentMovie._Movie__year,
+            'runtime': PersistentMovie._runtime_minutes,
+        }
+
+        query = self._filter_movies(self._session_cm.session.query(PersistentMovie._id), genre=genre,
+                                    first_year=first_year, last_year=last_year, min_rating=min_rating,
+                                    max_rating=max_rating)
+        rows = query.order_by(desc(order_columns[order_by]), asc(PersistentMovie._id)).all()
+        return [row[0] for row in rows]
+
+    def get_movie_ids_for_facets(self, genre=None, first_year=None, last_year=None, director=None, actor=None,
+                                 min_rating=None, max_rating=None):
+        query = self._filter_movies(self._session_cm.session.query(PersistentMovie._id), genre, first_year, last_year,
+                                    director, actor, min_rating, max_rating)
+        rows = query.order_by(desc(PersistentMovie._rating), asc(PersistentMovie._id)).all()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def _filter_movies(query, genre=None, first_year=None, last_year=None, director=None, actor=None,
+                       min_rating=None, max_rating=None):
+        if genre is not None:
+            query = query.filter(PersistentMovie._genres.any(PersistentGenre._Genre__genre_name == genre))
+        if director is not None:
+            query = query.filter(PersistentMovie._director.has(PersistentDirector._Director__director_full_name ==
+                                                               director))
+        if actor is not None:
+            query = query.filter(PersistentMovie._actors.any(PersistentActor._Actor__actor_full_name == actor))
+        if first_year is not None:
+            query = query.filter(PersistentMovie._Movie__year >= first_year)
+        if last_year is not None:
+            query = query.filter(PersistentMovie._Movie__year <= last_year)
+        if min_rating is not None:
+            query = query.filter(PersistentMovie._rating >= min_rating)
+        if max_rating is not None:
+            query = query.filter(PersistentMovie._rating <= max_rating)
+        return query
+
+    def get_facet_counts(self, id_list):
+        # One GROUP BY query per dimension, each restricted to the given movies.
+        session = self._session_cm.session
+        in_list = PersistentMovie._id.in_(list(id_list))
+        counts = {
+            'year': session.query(PersistentMovie._Movie__year, func.count()).filter(in_list).group_by(
+                PersistentMovie._Movie__year),
+            'rating': session.query(cast(PersistentMovie._rating, Integer), func.count()).filter(in_list).group_by(
+                cast(PersistentMovie._rating, Integer)),
+            'genre': session.query(PersistentGenre._Genre__genre_name, func.count()).join(
+                PersistentGenre._movie).filter(in_list).group_by(PersistentGenre._Genre__genre_name),
+            'actor': session.query(PersistentActor._Actor__actor_full_name, func.count()).join(
+                PersistentActor._movies).filter(in_list).group_by(PersistentActor._Actor__actor_full_name),
+            'director': session.query(PersistentDirector._Director__director_full_name, func.count()).join(
+                PersistentDirector._movies).filter(in_list).group_by(PersistentDirector._Director__director_full_name),
+        }
+        return {facet: dict(query.all()) for facet, query in counts.items()}
+
+    def build_similar_movies(self):
+        # Read the genre, actor and director links once, with each genre's movies in rating order as in the memory
+        # repository's genre index. create_app builds the table at startup and added movies are folded in, so it is
+        # kept for the life of the repository.
+        tables = metadata.tables
+        movies, genres, actors, directors = tables['movies'], tables['genres'], tables['actors'], tables['directors']
+        movie_genres, movie_actors = tables['movie_genres'], tables['movie_actors']
+        queries = {
+            'genre': select([genres.c.name, movies.c.id]).select_from(
+                movie_genres.join(genres).join(movies)).order_by(desc(movies.c.rating), asc(movies.c.id)),
+            'actor': select([actors.c.name, movie_actors.c.movie_id]).select_from(
+                movie_actors.join(actors)).order_by(asc(movie_actors.c.id)),
+            'director': select([directors.c.name, movies.c.id]).select_from(
+                movies.join(directors)).order_by(asc(movies.c.id)),
+        }
+        postings = {}
+        for kind, query in queries.items():
+            for name, movie_id in self._session_cm.session.execute(query):
+                postings.setdefault((kind, name), []).append(movie_id)
+        self._similar_movies = SimilarMovies(postings)
+
+    @property
+    def similar_movies(self) -> SimilarMovies:
+        if self._similar_movies is None:
+            self.build_similar_movies()
+        return self._similar_movies
+
+    def get_similar_movie_ids(self, movie_id):
+        return self.similar_movies.get(movie_id)
+
+    def build_collaboration_graph(self):
+        # Built from one pass over the movie_actors links, ordered by movie so each cast is a run of rows. Movies
+        # added later are added to it as they arrive.
+        movie_actors, actors = metadata.tables['movie_actors'], metadata.tables['actors']
+        rows = self._session_cm.session.execute(select([movie_actors.c.movie_id, actors.c.name]).select_from(
+            movie_actors.join(actors)).order_by(asc(movie_actors.c.movie_id), asc(movie_actors.c.id)))
+        self._collaboration_graph = CollaborationGraph.from_casts(
+            [name for _, name in cast] for _, cast in groupby(rows, key=itemgetter(0)))
+
+    def get_collaboration_graph(self) -> CollaborationGraph:
+        if self._collaboration_graph is None:
+            self.build_collaboration_graph()
+        return self._collaboration_graph
 
     def get_year_list(self):
-        pass
+        rows = self._session_cm.session.query(PersistentMovie._Movie__year).distinct().order_by(
+            asc(PersistentMovie._Movie__year)).all()
+        return tuple(row[0] for row in rows)
 
     def get_genre_dict(self):
         pass
@@ -276,47 +594,146 @@ def generic_generator(filename, post_process=None):
             yield row
 
 
-def process_user(user_row):
-    user_row[2] = generate_password_hash(user_row[2])
-    return user_row
-
-
-def populate(engine: Engine, session_factory, data_path, data_filename):
-    conn = engine.raw_connection()
-    cursor = conn.cursor()
-    conn.commit()
-    conn.close()
-    insert_users = """
-        INSERT INTO users (
-        id, username, password)
-        VALUES (?, ?, ?)"""
-    cursor.executemany(insert_users, generic_generator(os.path.join(data_path, 'users.csv'), process_user))
-
-    insert_comments = """
-        INSERT INTO comments (
-        id, user_id, movie_id, comment, timestamp)
-        VALUES (?, ?, ?, ?, ?)"""
-    cursor.executemany(insert_comments, generic_generator(os.path.join(data_path, 'comments.csv')))
-    conn.commit()
-    conn.close()
-
-    filename = os.path.join(data_path, data_filename)
-    movie_file_reader = MovieFileCSVReader(filename)
-    movie_file_reader.read_csv_file()
-    session = session_factory()
-
-    for movie in movie_file_reader.dataset_of_movies:
-        print(movie)
-        session.add(movie)
-
-    for actor in movie_file_reader.dataset_of_actors:
-        session.add(actor)
-
-    for genre in movie_file_reader.dataset_of_genres:
-        session.add(genre)
-
-    for director in movie_file_reader.dataset_of_directors:
-        session.add(director)
-
-    session.commit()
-    # pass
+def process_comment(comment_row):
+    comment_row[4] = datetime.fromisoformat(comment_row[4])
+    return comment_row
+
+
+def movie_rows(chunk, genre_ids, actor_ids, director_ids, link_ids):
+    # Turns one chunk from MovieFileStreamReader.read_chunks into rows for each table, as tuples in table column order.
+    # Genres, actors and directors get the next free id the first time they are seen; only those new ones are returned
+    # for inserting.
+    new_entities = {'genres': [], 'actors': [], 'directors': []}
+
+    def entity_id(ids, table, name):
+        entity = ids.get(name)
+        if entity is None:
+            entity = ids[name] = len(ids) + 1
+            new_entities[table].append((entity, name))
+        return entity
+
+    movies, genre_links, actor_links = [], [], []
+    for rank, title, genre_names, description, director_name, actor_names, year, runtime, rating, votes in zip(
+            *(chunk[column] for column in COLUMNS)):
+        movie_id = int(rank)
+        movies.append((movie_id, int(year), title.strip(), description.strip(), '', float(rating), int(votes),
+                       entity_id(director_ids, 'directors', director_name.strip()), int(runtime)))
+        for name in dict.fromkeys(name.strip() for name in genre_names.split(',')):
+            link_ids['movie_genres'] += 1
+            genre_links.append((link_ids['movie_genres'], movie_id, entity_id(genre_ids, 'genres', name)))
+        for name in dict.fromkeys(name.strip() for name in actor_names.split(',')):
+            link_ids['movie_actors'] += 1
+            actor_links.append((link_ids['movie_actors'], movie_id, entity_id(actor_ids, 'actors', name)))
+
+    return dict(new_entities, movies=movies, movie_genres=genre_links, movie_actors=actor_links)
+
+
+def bulk_insert(connection, table, rows):
+    # Core compiles the INSERT for the connection's dialect. With a positional driver such as sqlite3 the row tuples
+    # go straight to the DBAPI executemany, skipping SQLAlchemy's per-row parameter processing.
+    statement = table.insert().compile(dialect=connection.dialect)
+    if statement.positional and list(statement.positiontup) == [column.key for column in table.columns]:
+        cursor = connection.connection.cursor()
+        cursor.executemany(str(statement), rows)
+        cursor.close()
+    else:
+        keys = [column.key for column in table.columns]
+        connection.execute(table.insert(), [dict(zip(keys, row)) for row in rows])
+
+
+def prefix_range(column, prefix):
+    # The values starting with prefix sort from prefix up to, but excluding, prefix with its last character incremented,
+    # so the match is a range scan of an index on column.
+    return and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def index_search_tokens(connection):
+    # Rebuilds the movie_tokens table from the movies and their genres, actors and directors.
+    tables = metadata.tables
+    movies, directors = tables['movies'], tables['directors']
+    names = {}
+    for movie_id, title, description, director in connection.execute(
+            select([movies.c.id, movies.c.title, movies.c.description, directors.c.name]).select_from(
+                movies.outerjoin(directors, directors.c.id == movies.c.director_id))):
+        names[movie_id] = [title, description, director]
+    for link_table, table, column in (('movie_genres', 'genres', 'genre_id'), ('movie_actors', 'actors', 'actor_id')):
+        links, entities = tables[link_table], tables[table]
+        for movie_id, name in connection.execute(select([links.c.movie_id, entities.c.name]).select_from(
+                links.join(entities, entities.c.id == links.c[column]))):
+            names[movie_id].append(name)
+
+    connection.execute(movie_tokens.delete())
+    rows = [(movie_id, token) for movie_id, texts in names.items() for token in text_tokens(*texts)]
+    if len(rows) > 0:
+        bulk_insert(connection, movie_tokens, rows)
+
+
+def seed_data_versions(connection):
+    # Gives every kind of data a new version, and drops the versions of users' shares of them.
+    connection.execute(data_versions.delete())
+    changed = time.time()
+    connection.execute(data_versions.insert(), [
+        {'kind': kind, 'user_name': '', 'version': new_data_version(), 'changed': changed} for kind in CHANGE_KINDS])
+
+
+def ensure_data_versions(engine: Engine):
+    # Databases populated before data_versions existed, or before it recorded when the data changed, get a new table,
+    # with new versions.
+    if data_versions.name in engine.table_names():
+        columns = {column['name'] for column in inspect(engine).get_columns(data_versions.name)}
+        if columns >= set(data_versions.c.keys()):
+            return
+        data_versions.drop(engine)
+    data_versions.create(engine)
+    with engine.begin() as connection:
+        seed_data_versions(connection)
+
+
+def ensure_search_tokens(engine: Engine):
+    # Databases populated before movie_tokens existed get the table, filled from the tables already loaded.
+    if movie_tokens.name in engine.table_names():
+        return
+    movie_tokens.create(engine)
+    with engine.begin() as connection:
+        index_search_tokens(connection)
+    create_indexes(engine)
+
+
+def populate(engine: Engine, session_factory, data_path, data_filename, chunk_size=10000):
+    # Bulk-loads the CSV files with Core executemany inserts, one chunk of movies at a time, assigning every id
+    # explicitly so that the link tables can be filled in the same pass. The secondary indexes are built afterwards.
+    # session_factory is not needed for the load and is kept for existing callers.
+    tables = metadata.tables
+    movie_file_reader = MovieFileStreamReader(os.path.join(data_path, data_filename), chunk_size)
+    genre_ids, actor_ids, director_ids = {}, {}, {}
+    link_ids = {'movie_genres': 0, 'movie_actors': 0}
+
+    start = time.perf_counter()
+    with engine.begin() as connection:
+        for chunk in movie_file_reader.read_chunks():
+            rows = movie_rows(chunk, genre_ids, actor_ids, director_ids, link_ids)
+            for table in ('genres', 'actors', 'directors', 'movies', 'movie_genres', 'movie_actors'):
+                if len(rows[table]) > 0:
+                    bulk_insert(connection, tables[table], rows[table])
+            logger.info("Inserted %d movies (%.0f movies/sec)", movie_file_reader.rows_read,
+                        movie_file_reader.rows_read / (time.perf_counter() - start))
+
+        users = [dict(zip(('id', 'username', 'password'), row))
+                 for row in read_users(os.path.join(data_path, 'users.csv'))]
+        for user in users:
+            user['username'] = normalise_user_name(user['username'])
+        if len(users) > 0:
+            connection.execute(tables['users'].insert(), users)
+
+        comments = [dict(zip(('id', 'user_id', 'movie_id', 'comment', 'timestamp'), row))
+                    for row in generic_generator(os.path.join(data_path, 'comments.csv'), process_comment)]
+        if len(comments) > 0:
+            connection.execute(tables['comments'].insert(), comments)
+
+        index_search_tokens(connection)
+        seed_data_versions(connection)
+
+    create_indexes(engine)
+    logger.info("Populated database with %d movies in %.2fs", movie_file_reader.rows_read,
+                time.perf_counter() - start)
+    return movie_file_reader
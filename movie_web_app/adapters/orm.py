@@ -1,8 +1,11 @@
+import time
+import uuid
+
 from sqlalchemy import (
-    Table, MetaData, Column, Integer, String, DateTime,
-    ForeignKey
+    Table, MetaData, Column, Integer, Float, String, DateTime,
+    ForeignKey, UniqueConstraint
 )
-from sqlalchemy.orm import mapper, relationship
+from sqlalchemy.orm import mapper, relationship, configure_mappers, selectinload, joinedload
 
 from movie_web_app.domainmodel import model
 
@@ -70,39 +73,132 @@ movie_actors = Table(
     Column('actor_id', ForeignKey('actors.id'))
 )
 
+# One row per movie in a user's watch list; id keeps the order the movies were added in. The unique (user_id, movie_id)
+# constraint is the composite index that serves both a user's whole list and "is this movie in it" lookups.
+watch_list = Table(
+    'watch_list', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('user_id', ForeignKey('users.id'), nullable=False),
+    Column('movie_id', ForeignKey('movies.id'), nullable=False),
+    UniqueConstraint('user_id', 'movie_id', name='watch_list_user_movie')
+)
+
+# One row per distinct word of a movie's title, description, and genre, actor and director names, tokenized as the
+# memory repository's SearchIndex does. The (token, movie_id) index turns a word-prefix search into a range scan.
+movie_tokens = Table(
+    'movie_tokens', metadata,
+    Column('movie_id', ForeignKey('movies.id'), nullable=False),
+    Column('token', String(255), nullable=False)
+)
+
+# The version of each kind of repository data, under user_name '', and of each user's share of it, such as their watch
+# list, with when it last changed in seconds since the epoch. Every change replaces the versions it affects with new
+# random ones, so all processes using the database see the same versions, and a repopulated database doesn't repeat
+# old ones.
+data_versions = Table(
+    'data_versions', metadata,
+    Column('kind', String(32), primary_key=True),
+    Column('user_name', String(255), primary_key=True),
+    Column('version', String(32), nullable=False),
+    Column('changed', Float, nullable=False)
+)
+
+
+def new_data_version() -> str:
+    return uuid.uuid4().hex
+
+
+def record_change(connection, kind, user_names=()):
+    # Gives kind, and each named user's share of it, a new version. connection may be a Connection or a Session.
+    changed = time.time()
+    connection.execute(data_versions.update().where(data_versions.c.kind == kind).where(
+        data_versions.c.user_name == '').values(version=new_data_version(), changed=changed))
+    if len(user_names) > 0:
+        connection.execute(data_versions.delete().where(data_versions.c.kind == kind).where(
+            data_versions.c.user_name.in_(user_names)))
+        connection.execute(data_versions.insert(), [
+            {'kind': kind, 'user_name': user_name, 'version': new_data_version(), 'changed': changed}
+            for user_name in set(user_names)])
+
+
+# Secondary indexes as (name, table, columns). They are created by create_indexes once the tables have been loaded,
+# which is much faster than maintaining them row by row during a bulk load.
+indexes = (
+    ('movies_year_rating', 'movies', ('year', 'rating')),
+    ('movies_rating', 'movies', ('rating',)),
+    ('movies_director', 'movies', ('director_id',)),
+    ('movie_genres_genre', 'movie_genres', ('genre_id', 'movie_id')),
+    ('movie_genres_movie', 'movie_genres', ('movie_id',)),
+    ('movie_actors_actor', 'movie_actors', ('actor_id', 'movie_id')),
+    ('movie_actors_movie', 'movie_actors', ('movie_id',)),
+    ('genres_name', 'genres', ('name',)),
+    ('actors_name', 'actors', ('name',)),
+    ('directors_name', 'directors', ('name',)),
+    ('comments_movie', 'comments', ('movie_id',)),
+    ('movie_tokens_token', 'movie_tokens', ('token', 'movie_id')),
+)
+
+
+def create_indexes(engine):
+    with engine.begin() as connection:
+        for name, table, columns in indexes:
+            connection.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(name, table, ', '.join(columns)))
+
+
+# The slotted domain classes have no instance __dict__, which SQLAlchemy needs for its instrumentation, so the
+# database maps these plain subclasses instead. They behave exactly like the domain classes.
+class PersistentMovie(model.Movie):
+    pass
+
+
+class PersistentGenre(model.Genre):
+    pass
+
+
+class PersistentActor(model.Actor):
+    pass
+
+
+class PersistentDirector(model.Director):
+    pass
+
+
+# Loader options for each way the repository reads movies, filled in by map_model_to_tables.
+loader_options = {}
+
 
 def map_model_to_tables():
     mapper(model.User, users, properties={
-        '_User__user_name': users.column.username,
-        '_User__password': users.column.password,
+        '_User__user_name': users.c.username,
+        '_User__password': users.c.password,
         '_reviews': relationship(model.Review, backref='_user')
-        # _watch_list # add later
+        # The watch list is kept in the watch_list table and read through the repository.
     })
     mapper(model.Review, comments, properties={
-        '_Review__review_text': comments.column.comment, # what is the difference of c and column
-        '_Review__timestamp': comments.column.timestamp
+        '_Review__review_text': comments.c.comment, # what is the difference of c and column
+        '_Review__timestamp': comments.c.timestamp
     })
 
-    mapper(model.Director, directors, properties={
+    mapper(PersistentDirector, directors, properties={
         '_Director__director_full_name': directors.c.name,
-        '_movies': relationship(model.Movie, backref='_director')
+        '_movies': relationship(PersistentMovie, backref='_director')
     })
 
-    movies_mapper = mapper(model.Movie, movies, properties={
-        '_id': movies.column.id,
-        '_Movie__year': movies.column.year,
-        '_Movie__movie_name': movies.column.title,
-        '_description': movies.column.description,
-        '_hyperlink': movies.column.hyperlink,
-        '_review': relationship(model.Review, backref='_movie'),
-        '_rating': movies.column.rating,
-        '_voting': movies.column.voting,
-        '_runtime_minutes': movies.column.running_time,
+    movies_mapper = mapper(PersistentMovie, movies, properties={
+        '_id': movies.c.id,
+        '_Movie__year': movies.c.year,
+        '_Movie__movie_name': movies.c.title,
+        '_description': movies.c.description,
+        '_hyperlink': movies.c.hyperlink,
+        '_review': relationship(model.Review, backref='_Review__movie'),
+        '_rating': movies.c.rating,
+        '_votes': movies.c.voting,
+        '_runtime_minutes': movies.c.running_time,
         # _runtime_minutes
     })
 
-    mapper(model.Genre, genres, properties={
-        '_Genre__genre_name': genres.column.name,
+    mapper(PersistentGenre, genres, properties={
+        '_Genre__genre_name': genres.c.name,
         '_movie': relationship(
             movies_mapper,
             secondary=movie_genres,
@@ -110,11 +206,23 @@ def map_model_to_tables():
         )
     })
 
-    mapper(model.Actor, actors, properties={
-        '_Actor__actor_full_name': actors.column.name,
+    mapper(PersistentActor, actors, properties={
+        '_Actor__actor_full_name': actors.c.name,
         '_movies': relationship(
             movies_mapper,
             secondary=movie_actors,
             backref="_actors"
         )
     })
+
+    # Create the backref attributes (such as PersistentMovie._director) now rather than on first query, so they can
+    # be used to build filters straight away instead of resolving to the domain model's slots.
+    configure_mappers()
+
+    # Listing pages render each movie's genres, director and comments with their authors. Load those for the whole
+    # page with one query per relationship, rather than lazily with one query per movie.
+    loader_options['movie_listing'] = (
+        selectinload(PersistentMovie._genres),
+        joinedload(PersistentMovie._director),
+        selectinload(PersistentMovie._review).joinedload(model.Review._user),
+    )
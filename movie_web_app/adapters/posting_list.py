@@ -0,0 +1,43 @@
+from bisect import bisect_left, bisect_right
+
+from movie_web_app.adapters.repository import rating_key
+from movie_web_app.domainmodel.model import Movie
+
+
+class PostingList:
+    """ Movie ids kept in rating order, highest first, with ties broken by id.
+
+    Added movies are appended and the list is re-sorted the next time it is read, which is a near-linear merge for an
+    already sorted list. Readers get an immutable tuple that is only rebuilt after the list changes, so paging through
+    it is a plain slice.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._snapshot = ()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, movie: Movie):
+        self._keys.append((-rating_key(movie), movie.id))
+        self._snapshot = None
+
+    def extend(self, movies):
+        self._keys += [(-rating_key(movie), movie.id) for movie in movies]
+        self._snapshot = None
+
+    @property
+    def ids(self):
+        if self._snapshot is None:
+            self._keys.sort()
+            self._keys = list(dict.fromkeys(self._keys))
+            self._snapshot = tuple(key[1] for key in self._keys)
+        return self._snapshot
+
+    def ids_for_rating_range(self, min_rating=None, max_rating=None):
+        # Keys are ordered by negated rating, so an inclusive rating range is one contiguous slice of the list.
+        ids = self.ids
+        start = 0 if max_rating is None else bisect_left(self._keys, (-max_rating, float('-inf')))
+        stop = len(ids) if min_rating is None else bisect_right(self._keys, (-min_rating, float('inf')))
+        return ids[start:stop]
@@ -1,8 +1,15 @@
 import abc
-from typing import List
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import List, Iterable
 
 from movie_web_app.domainmodel.model import Movie, Actor, Director, User, Review, Genre
 
+logger = logging.getLogger(__name__)
+
 repo_instance = None
 
 
@@ -12,12 +19,170 @@ class RepositoryException(Exception):
         pass
 
 
+# Kinds of data whose changes a repository counts: the catalogue of movies and their genres, actors and directors,
+# comments, users, and watch lists.
+CHANGE_KINDS = ('movies', 'comments', 'users', 'watch_lists')
+
+# One change: the write method that made it, the entities it was given, the version of kind it produced, and when it
+# was made (seconds since the epoch).
+RepositoryChange = namedtuple('RepositoryChange', ('kind', 'operation', 'subjects', 'version', 'timestamp'))
+
+# The version of some data, an opaque string, and when it last changed (seconds since the epoch), or None if that
+# isn't known.
+DataVersion = namedtuple('DataVersion', ('version', 'changed'))
+
+
+def change_user_names(subjects):
+    # The names of the users among a change's subjects.
+    return [subject.user_name for subject in subjects if isinstance(subject, User)]
+
+
+class ChangeFeed:
+    """ Version counters for each of CHANGE_KINDS and the in-process subscribers told about every change.
+
+    A version starts at 0 and goes up by one with each change of its kind, so anything derived from a kind of data is
+    current while the version it was built at is. Each user has versions of their own too, counting the changes that
+    have the user among their subjects, such as the changes to their watch list. Subscribers are called in the writing
+    thread, after the change was made and in the order the changes were made; a subscriber that raises is logged and
+    doesn't affect the write.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        # Versions count from 0 in every process, so anything that outlives the process, like an HTTP validator,
+        # qualifies them with the epoch of the feed that issued them.
+        self.epoch = uuid.uuid4().hex
+        self._versions = dict.fromkeys(CHANGE_KINDS, 0)
+        self._user_versions = {}
+        self._timestamps = dict.fromkeys(CHANGE_KINDS, clock())
+        self._user_timestamps = {}
+        self._subscribers = ()
+        self._lock = threading.Lock()
+
+    def version(self, kind, user_name=None) -> int:
+        # The version of kind, or of the named user's share of it.
+        if user_name is None:
+            return self._versions[kind]
+        return self._user_versions.get((kind, user_name), 0)
+
+    def versions(self):
+        with self._lock:
+            return dict(self._versions)
+
+    def last_changed(self, kind, user_name=None) -> float:
+        # When kind last changed, or when the feed was created if it hasn't; for the named user's share of kind, None
+        # if it hasn't changed.
+        if user_name is None:
+            return self._timestamps[kind]
+        return self._user_timestamps.get((kind, user_name))
+
+    def subscribe(self, subscriber):
+        # subscriber is called with each RepositoryChange.
+        with self._lock:
+            self._subscribers += (subscriber,)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers = tuple(known for known in self._subscribers if known != subscriber)
+
+    def publish(self, kind, operation, subjects=()) -> RepositoryChange:
+        with self._lock:
+            self._versions[kind] += 1
+            self._timestamps[kind] = self._clock()
+            for user_name in change_user_names(subjects):
+                self._user_versions[kind, user_name] = self._user_versions.get((kind, user_name), 0) + 1
+                self._user_timestamps[kind, user_name] = self._timestamps[kind]
+            change = RepositoryChange(kind, operation, tuple(subjects), self._versions[kind], self._timestamps[kind])
+            subscribers = self._subscribers
+        for subscriber in subscribers:
+            try:
+                subscriber(change)
+            except Exception:
+                logger.exception("Change subscriber %r failed on %s", subscriber, operation)
+        return change
+
+
+# Ratings and votes are read from the CSV as strings, so normalise them before comparing.
+def rating_key(movie: Movie):
+    try:
+        return float(movie.rating)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def votes_key(movie: Movie):
+    try:
+        return int(movie.votes)
+    except (TypeError, ValueError):
+        return 0
+
+
+def year_key(movie: Movie):
+    return movie.year or 0
+
+
+def runtime_key(movie: Movie):
+    return movie.runtime_minutes or 0
+
+
+# Orderings accepted by get_movie_ids_for_filter, with the key each one sorts by.
+FILTER_ORDERS = {
+    'rating': rating_key,
+    'votes': votes_key,
+    'year': year_key,
+    'runtime': runtime_key,
+}
+
+
+# Dimensions counted by get_facet_counts. Ratings are counted in whole-point buckets, e.g. 7 for 7.0 to 7.9.
+FACETS = ('genre', 'year', 'director', 'actor', 'rating')
+
+
+def filter_order_key(order_by):
+    if order_by not in FILTER_ORDERS:
+        raise ValueError(f'Cannot order movies by {order_by!r}')
+    return FILTER_ORDERS[order_by]
+
+
 class AbstractRepository(abc.ABC):
 
+    def __init__(self):
+        self._changes = ChangeFeed()
+
+    @property
+    def changes(self) -> ChangeFeed:
+        """ The version counters of this repository's data, and the feed of changes made through its write methods. """
+        return self._changes
+
+    def _changed(self, kind, operation, *subjects):
+        self._changes.publish(kind, operation, subjects)
+
+    @abc.abstractmethod
+    def get_data_version(self, kind, user_name=None) -> DataVersion:
+        """ Returns the DataVersion of kind of data, or of the named user's share of it, such as their watch list.
+
+        A version is an opaque string that changes with every change to the data and is never reused, so it can
+        stand for the data in an HTTP validator.
+        """
+        raise NotImplementedError
+
+    def reuse(self, result):
+        """ Returns result, a value this repository returned for an earlier request, ready to be used again.
+
+        Repositories whose entities belong to a unit of work, such as a database session, attach them to the current
+        one.
+        """
+        return result
+
     @abc.abstractmethod
     def add_user(self, new_user: User):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def add_users(self, new_users: Iterable[User]):
+        """ Adds several Users to the repository in one batch. """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_movie_index(self, new_id: int):
         raise NotImplementedError
@@ -26,6 +191,7 @@ class AbstractRepository(abc.ABC):
     def get_user(self, username) -> User:
         """ Returns the User named username from the repository.
 
+        The username is matched case-insensitively, in the same way User names are normalised.
         If there is no User with the given username, this method returns None.
         """
         raise NotImplementedError
@@ -78,6 +244,7 @@ class AbstractRepository(abc.ABC):
 
     @abc.abstractmethod
     def get_year_list(self) -> List[int]:
+        """ Returns the distinct release years of Movies in the repository, in ascending order. """
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -192,6 +359,58 @@ class AbstractRepository(abc.ABC):
         """ Returns the Comments stored in the repository. """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_movie_ids_for_search(self, query):
+        """ Returns the ids of Movies matching every term of query, ordered by rating.
+
+        Each term matches as a prefix of a word in a Movie's title, description, or actor, director or genre names.
+        If nothing matches, this method returns an empty list.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_movie_ids_for_filter(self, genre=None, first_year=None, last_year=None, min_rating=None, max_rating=None,
+                                 order_by='rating'):
+        """ Returns the ids of Movies matching every given criterion, highest order_by value first.
+
+        genre is a genre name, the year and rating bounds are inclusive and criteria left as None are not applied.
+        order_by is one of FILTER_ORDERS; ties are broken by id. If nothing matches, this method returns an empty list.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_movie_ids_for_facets(self, genre=None, first_year=None, last_year=None, director=None, actor=None,
+                                 min_rating=None, max_rating=None):
+        """ Returns the ids of Movies matching every given criterion, highest rating first with ties broken by id.
+
+        genre, director and actor are names, the year and rating bounds are inclusive and criteria left as None are
+        not applied. If nothing matches, this method returns an empty list.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_facet_counts(self, id_list):
+        """ Returns, for each dimension in FACETS, a dict that maps each value to the number of Movies in id_list
+        with that value.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_similar_movie_ids(self, movie_id):
+        """ Returns the ids of the Movies most like the Movie with movie_id, most similar first.
+
+        Similarity comes from the genres, actors and director two Movies share. If the Movie is not in the repository
+        or shares nothing with any other Movie, this method returns an empty list.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_collaboration_graph(self):
+        """ Returns a CollaborationGraph of the actors in the repository, linking actors who appeared in a Movie
+        together.
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def add_to_watch_list(self, user: User, movie: Movie):
         raise NotImplementedError
@@ -204,15 +423,35 @@ class AbstractRepository(abc.ABC):
     def get_watch_list(self):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_watch_list_ids(self, user: User, cursor=0, limit=None):
+        """ Returns the ids of the Movies in user's watch list, highest rated first (ties in the order they were
+        added), skipping the first cursor Movies and returning at most limit ids.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_watch_list_size(self, user: User) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_watch_list_ids_among(self, user: User, id_list):
+        """ Returns the set of ids in id_list that are in user's watch list. """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_movie_ids_for_year(self, year):
+        """ Returns an immutable sequence of ids of Movies released in year, ordered by rating.
+
+        If there are no Movies released in year, this method returns an empty sequence.
+        """
         raise NotImplementedError
 
     @abc.abstractmethod
     def get_movie_ids_for_genre(self, new_genre: str):
-        """ Returns a list of ids representing Articles that are tagged by tag_name.
+        """ Returns an immutable sequence of ids of Movies classified by new_genre, ordered by rating.
 
-        If there are Articles that are tagged by tag_name, this method returns an empty list.
+        If there are no Movies classified by new_genre, this method returns an empty sequence.
         """
         raise NotImplementedError
 
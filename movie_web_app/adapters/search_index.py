@@ -0,0 +1,88 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from movie_web_app.adapters.repository import rating_key
+from movie_web_app.domainmodel.model import Movie
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    if text is None:
+        return []
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def text_tokens(*texts):
+    # The distinct tokens of the given texts; None texts are skipped.
+    return set(TOKEN_PATTERN.findall(" ".join(text for text in texts if text is not None).lower()))
+
+
+def movie_tokens(movie: Movie):
+    names = [movie.title, movie.description]
+    names += [actor.actor_full_name for actor in movie.actors]
+    names += [genre.genre_name for genre in movie.genres]
+    if movie.director is not None:
+        names.append(movie.director.director_full_name)
+    return text_tokens(*names)
+
+
+class SearchIndex:
+    """ Inverted token index over movie titles, descriptions and actor, director and genre names.
+
+    Each query term is matched as a prefix of the indexed tokens, and a movie must match every term. Results are
+    ranked by rating, highest first, with ties broken by id.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(list)
+        self._vocabulary = []
+        self._vocabulary_sorted = True
+        self._ratings = {}
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def add_movie(self, movie: Movie):
+        self.add_movies([movie])
+
+    def add_movies(self, movies):
+        postings = self._postings
+        vocabulary_size = len(postings)
+        for movie in movies:
+            movie_id = movie.id
+            for token in movie_tokens(movie):
+                postings[token].append(movie_id)
+            self._ratings[movie_id] = rating_key(movie)
+
+        if len(postings) != vocabulary_size:
+            self._vocabulary_sorted = False
+
+    def ids_for_term(self, term):
+        # Union the postings of every indexed token that starts with term. The sorted vocabulary is only rebuilt when
+        # new tokens have been added since the last query.
+        if not self._vocabulary_sorted:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_sorted = True
+        matches = set()
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            matches.update(self._postings[self._vocabulary[position]])
+            position += 1
+        return matches
+
+    def search(self, query):
+        terms = tokenize(query)
+        if len(terms) == 0:
+            return []
+
+        # Intersect from the rarest term upwards so the working set stays small.
+        candidates = sorted((self.ids_for_term(term) for term in set(terms)), key=len)
+        result = set(candidates[0])
+        for ids in candidates[1:]:
+            if len(result) == 0:
+                break
+            result &= ids
+
+        return sorted(result, key=lambda movie_id: (-self._ratings[movie_id], movie_id))
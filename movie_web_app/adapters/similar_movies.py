@@ -0,0 +1,98 @@
+import heapq
+import math
+from bisect import insort
+from itertools import islice
+
+from movie_web_app.domainmodel.model import Movie
+
+# Number of neighbours kept for each movie.
+SIMILAR_MOVIES = 10
+
+# Features shared by more movies than this only link each movie to the first MAX_POSTINGS movies of their posting list,
+# so a genre held by a large part of the catalogue doesn't make the build quadratic in the catalogue size.
+MAX_POSTINGS = 2000
+
+
+def movie_features(movie: Movie):
+    features = [('genre', genre.genre_name) for genre in movie.genres]
+    features += [('actor', actor.actor_full_name) for actor in movie.actors]
+    if movie.director is not None:
+        features.append(('director', movie.director.director_full_name))
+    return tuple(dict.fromkeys(features))
+
+
+class SimilarMovies:
+    """ The most similar movies to each movie, precomputed from the genres, actors and director they share.
+
+    Each genre, actor and director is a feature weighted by its inverse document frequency, so sharing a director or a
+    rarely cast actor counts for more than sharing a common genre. The similarity of two movies is the cosine of their
+    weighted feature vectors, which is non-zero only for movies that share a feature, so the item-item matrix is
+    sparse and is built by accumulating each movie's row over the posting lists of its features. Only the top
+    `neighbours` entries of each row are kept, so a lookup is a dictionary access.
+
+    postings maps each feature, a (kind, name) pair, to the ids of its movies in order of preference (the genre
+    indexes are in rating order). A movie added later is scored against the catalogue and inserted into the rows it
+    ranks in, using the feature weights of the last full build.
+    """
+
+    def __init__(self, postings, neighbours=SIMILAR_MOVIES, max_postings=MAX_POSTINGS):
+        self._neighbours = neighbours
+        self._max_postings = max_postings
+        self._postings = {feature: list(dict.fromkeys(ids)) for feature, ids in postings.items() if len(ids) > 0}
+        self._features = {}
+        for feature, ids in self._postings.items():
+            for movie_id in ids:
+                self._features.setdefault(movie_id, []).append(feature)
+
+        count = len(self._features)
+        self._weights = {feature: math.log(count / len(ids)) for feature, ids in self._postings.items()}
+        self._norms = {movie_id: self._norm(features) for movie_id, features in self._features.items()}
+        # _rows[movie_id] is the kept part of the movie's row as (-score, id) pairs, most similar first.
+        self._rows = self._build_rows()
+
+    def __len__(self):
+        return len(self._features)
+
+    def _norm(self, features):
+        return math.sqrt(sum(self._weights[feature] ** 2 for feature in features))
+
+    def _build_rows(self):
+        return {movie_id: self._top(self._scores(movie_id)) for movie_id in self._features}
+
+    def _scores(self, movie_id):
+        # One row of the similarity matrix as (-score, id) pairs: the dot products with every movie sharing a feature,
+        # then normalised.
+        dots = {}
+        get = dots.get
+        for feature in self._features[movie_id]:
+            weight = self._weights[feature] ** 2
+            if weight > 0:
+                for other in islice(self._postings[feature], self._max_postings):
+                    dots[other] = get(other, 0.0) + weight
+        dots.pop(movie_id, None)
+        norm, norms = self._norms[movie_id], self._norms
+        return [(-dot / (norm * norms[other]), other) for other, dot in dots.items()]
+
+    def _top(self, scores):
+        return heapq.nsmallest(self._neighbours, scores)
+
+    def add_movie(self, movie_id, features):
+        if movie_id in self._features or len(features) == 0:
+            return
+        self._features[movie_id] = list(features)
+        for feature in features:
+            self._postings.setdefault(feature, []).append(movie_id)
+            if feature not in self._weights:
+                self._weights[feature] = math.log(len(self._features))
+        self._norms[movie_id] = self._norm(features)
+
+        scores = self._scores(movie_id)
+        self._rows[movie_id] = self._top(scores)
+        for score, other in scores:
+            row = self._rows[other]
+            if len(row) < self._neighbours or (score, movie_id) < row[-1]:
+                insort(row, (score, movie_id))
+                del row[self._neighbours:]
+
+    def get(self, movie_id):
+        return [other for _, other in self._rows.get(movie_id, ())]
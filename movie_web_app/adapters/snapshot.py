@@ -0,0 +1,78 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+
+from movie_web_app.adapters.Movie_repo import MovieRepo
+
+SNAPSHOT_VERSION = 5
+SOURCE_FILES = ('Data1000Movies.csv', 'users.csv', 'comments.csv')
+
+# Magic bytes, format version, SHA-256 digest of the source CSV files and payload length.
+HEADER = struct.Struct('>8sH32sQ')
+MAGIC = b'MOVIEREP'
+
+
+class SnapshotException(Exception):
+    pass
+
+
+def source_checksum(data_path):
+    digest = hashlib.sha256()
+    for filename in SOURCE_FILES:
+        digest.update(filename.encode('utf-8'))
+        with open(os.path.join(data_path, filename), 'rb') as source:
+            for block in iter(lambda: source.read(1 << 20), b''):
+                digest.update(block)
+    return digest.digest()
+
+
+def save_snapshot(repo: MovieRepo, snapshot_path, data_path):
+    payload = pickle.dumps(repo.snapshot_state(), protocol=pickle.HIGHEST_PROTOCOL)
+    header = HEADER.pack(MAGIC, SNAPSHOT_VERSION, source_checksum(data_path), len(payload))
+
+    # Write beside the target and swap it in, so a running worker never maps a half-written file.
+    temporary_path = snapshot_path + '.tmp'
+    with open(temporary_path, 'wb') as snapshot:
+        snapshot.write(header)
+        snapshot.write(payload)
+    os.replace(temporary_path, snapshot_path)
+
+
+def read_snapshot(snapshot_path, data_path, repo_class=MovieRepo) -> MovieRepo:
+    """ Returns the repository stored at snapshot_path, rebuilt as an instance of repo_class.
+
+    Raises SnapshotException if the file is not a snapshot of the current format version, is truncated, or was built
+    from source CSV files that differ from those in data_path.
+    """
+    if os.path.getsize(snapshot_path) < HEADER.size:
+        raise SnapshotException('Snapshot is truncated')
+
+    with open(snapshot_path, 'rb') as snapshot:
+        with mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, checksum, length = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise SnapshotException('Not a repository snapshot')
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotException(f'Snapshot version {version} is not supported')
+            if len(mapped) != HEADER.size + length:
+                raise SnapshotException('Snapshot is truncated')
+            if checksum != source_checksum(data_path):
+                raise SnapshotException('Snapshot is stale')
+
+            # Unpickle straight from the mapped pages; the views must be released before the map is closed.
+            with memoryview(mapped) as view, view[HEADER.size:] as payload:
+                state = pickle.loads(payload)
+
+    return repo_class.from_snapshot_state(state)
+
+
+def load_snapshot(snapshot_path, data_path, repo_class=MovieRepo):
+    # Returns None, rather than raising, when there is no usable snapshot, so callers can fall back to the CSV files.
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        return read_snapshot(snapshot_path, data_path, repo_class)
+    except SnapshotException:
+        return None
@@ -0,0 +1,54 @@
+import csv
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+# Matches the hashes written by werkzeug's generate_password_hash, e.g. 'pbkdf2:sha256:150000$salt$hex'.
+PASSWORD_HASH_PATTERN = re.compile(r'^(pbkdf2:\w+(:\d+)?|scrypt:\d+:\d+:\d+)\$[^$]+\$[0-9a-f]+$')
+
+# Below this many plaintext passwords, starting worker processes costs more than it saves.
+MIN_PARALLEL_HASHES = 8
+
+
+def is_password_hash(password):
+    return PASSWORD_HASH_PATTERN.match(password) is not None
+
+
+def hash_passwords(passwords, workers=None, min_parallel=MIN_PARALLEL_HASHES):
+    # Returns the hash of each password, in order. Passwords that are already hashed are kept as they are, and the
+    # remaining ones are hashed across a pool of worker processes when there are enough of them.
+    passwords = list(passwords)
+    plaintext = [position for position, password in enumerate(passwords) if not is_password_hash(password)]
+    values = [passwords[position] for position in plaintext]
+
+    if len(values) >= min_parallel and workers != 1:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = list(pool.map(generate_password_hash, values, chunksize=max(1, len(values) // (workers * 4))))
+    else:
+        hashes = [generate_password_hash(value) for value in values]
+
+    for position, password_hash in zip(plaintext, hashes):
+        passwords[position] = password_hash
+    return passwords
+
+
+def read_users(filename, workers=None):
+    # Returns the (id, username, password hash) rows of a users.csv file, which may hold plaintext passwords,
+    # hashes, or a mix of both.
+    with open(filename, encoding='utf-8-sig', newline='') as infile:
+        reader = csv.reader(infile)
+        next(reader)
+        rows = [[item.strip() for item in row] for row in reader if len(row) > 0]
+
+    hashes = hash_passwords((row[2] for row in rows), workers)
+    return [(row[0], row[1], password_hash) for row, password_hash in zip(rows, hashes)]
+
+
+def write_users(filename, rows):
+    with open(filename, 'w', encoding='utf-8', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['id', 'username', 'password'])
+        writer.writerows(rows)
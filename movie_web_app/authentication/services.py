@@ -55,7 +55,6 @@ def authenticate_user(username: str, password: str, repo: AbstractRepository):
 def user_to_dict(user: User):
     user_dict = {
         'username': user.user_name,
-        'password': user.password,
-        'watch_list': user.watch_list
+        'password': user.password
     }
     return user_dict
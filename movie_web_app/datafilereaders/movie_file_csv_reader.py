@@ -1,6 +1,4 @@
-import csv
-
-from movie_web_app.domainmodel.model import Movie, Director, Actor, Genre
+from movie_web_app.datafilereaders.movie_file_stream_reader import MovieFileStreamReader, build_movies
 
 
 class MovieFileCSVReader:
@@ -19,50 +17,24 @@ class MovieFileCSVReader:
         self._director_dict = {}
 
     def read_csv_file(self):
-        with open(self.__file_name, mode='r', encoding='utf-8-sig') as csvfile:
-            movie_file_reader = csv.DictReader(csvfile)
-            for row in movie_file_reader:
-                title = row['Title']
-                release_year = int(row['Year'])
-                movie = Movie(title, release_year)
-                movie.director = Director(row["Director"])
-                actor_list = row["Actors"].split(',')
-                movie.actors = actor_list
-                self._dataset_of_movies.append(movie)
-                genre_list = row['Genre'].split(",")
-                description= row['Description']
-                movie.description = description
-                for genre in genre_list:
-                    new_g = Genre(genre)
-                    new_g.add_movie(movie)
-                    self._dataset_of_genres.add(new_g)
-                    if new_g in self._genre_dict:
-                        if movie not in self._genre_dict[new_g]:
-                            self._genre_dict[new_g] += [movie]
-                    else:
-                        self._genre_dict[new_g] = [movie]
-                movie.genres = genre_list
-                self._actor_list += actor_list
-                for actor in actor_list:
-                    new_a = Actor(actor)
-                    if new_a not in self._actor_dict:
-                        self._actor_dict[new_a] = [movie]
-                    else:
-                        if movie not in self._actor_dict[new_a]:
-                            self._actor_dict[new_a] += [movie]
-                    self._dataset_of_actors.add(new_a)
-                    new_a.movies = movie
-
-                director_list = row["Director"].split(',')
-                for director in director_list:
-                    new_d = Director(director)
-                    if new_d not in self._director_dict:
-                        self._director_dict[new_d] = [movie]
-                    else:
-                        if movie not in self._director_dict:
-                            self._director_dict[new_d] += [movie]
-                    self._dataset_of_directors.add(new_d)
-                    new_d.movies = movie
+        genres = {}
+        actors = {}
+        directors = {}
+        for chunk in MovieFileStreamReader(self.__file_name).read_chunks():
+            movies = build_movies(chunk, genres, actors, directors)
+            self._dataset_of_movies += movies
+            for movie in movies:
+                self._actor_list += [actor.actor_full_name for actor in movie.actors]
+                for genre in movie.genres:
+                    self._genre_dict.setdefault(genre, []).append(movie)
+                for actor in movie.actors:
+                    self._actor_dict.setdefault(actor, []).append(movie)
+                self._director_dict.setdefault(movie.director, []).append(movie)
+
+        # The interning pools already hold exactly one instance of every entity.
+        self._dataset_of_genres.update(genres.values())
+        self._dataset_of_actors.update(actors.values())
+        self._dataset_of_directors.update(directors.values())
 
     @property
     def dataset_of_movies(self):
@@ -0,0 +1,98 @@
+import csv
+import logging
+import time
+from itertools import islice
+
+from movie_web_app.domainmodel.model import Movie, Director, Actor, Genre
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('Rank', 'Title', 'Genre', 'Description', 'Director', 'Actors', 'Year', 'Runtime (Minutes)', 'Rating',
+           'Votes')
+
+
+class MovieFileStreamReader:
+    """ Reads a Data1000Movies-style CSV file in fixed-size chunks of columns.
+
+    Only one chunk of raw rows is held at a time, so memory stays bounded however large the file is.
+    """
+
+    def __init__(self, file_name: str, chunk_size: int = 10000):
+        self.__file_name = file_name
+        self._chunk_size = chunk_size
+        self._rows_read = 0
+        self._elapsed = 0.0
+
+    @property
+    def rows_read(self):
+        return self._rows_read
+
+    @property
+    def elapsed(self):
+        return self._elapsed
+
+    @property
+    def rows_per_second(self):
+        if self._elapsed == 0:
+            return 0.0
+        return self._rows_read / self._elapsed
+
+    def report(self):
+        return f"{self._rows_read} rows in {self._elapsed:.2f}s ({self.rows_per_second:.0f} rows/sec)"
+
+    def read_chunks(self):
+        # Yields dicts that map each column name in COLUMNS to a tuple of that column's raw values.
+        start = time.perf_counter()
+        with open(self.__file_name, mode='r', encoding='utf-8-sig', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            positions = [header.index(column) for column in COLUMNS]
+            while True:
+                rows = list(islice(reader, self._chunk_size))
+                if len(rows) == 0:
+                    break
+                columns = list(zip(*rows))
+                self._rows_read += len(rows)
+                self._elapsed = time.perf_counter() - start
+                yield {name: columns[position] for name, position in zip(COLUMNS, positions)}
+        self._elapsed = time.perf_counter() - start
+        logger.info("Loaded %s: %s", self.__file_name, self.report())
+
+
+def intern_entity(pool: dict, factory, name: str):
+    # Returns the single shared entity for name, creating it on first sight.
+    name = name.strip()
+    entity = pool.get(name)
+    if entity is None:
+        entity = pool[name] = factory(name)
+    return entity
+
+
+def build_movies(chunk: dict, genres: dict, actors: dict, directors: dict):
+    # Turns one chunk from MovieFileStreamReader.read_chunks into Movies that share interned entities. The pools are
+    # kept by the caller across chunks, so every Genre, Actor and Director exists exactly once.
+    movies = []
+    for rank, title, genre_names, description, director_name, actor_names, year, runtime, rating, votes in zip(
+            *(chunk[column] for column in COLUMNS)):
+        movie = Movie(title, int(year), new_id=int(rank))
+        movie.description = description
+        movie.runtime_minutes = int(runtime)
+        movie.rating = rating
+        movie.votes = votes
+
+        director = intern_entity(directors, Director, director_name)
+        movie.director = director
+        director.movies = movie
+
+        for name in dict.fromkeys(name.strip() for name in actor_names.split(',')):
+            actor = intern_entity(actors, Actor, name)
+            movie.add_actor(actor)
+            actor.movies = movie
+
+        for name in dict.fromkeys(name.strip() for name in genre_names.split(',')):
+            genre = intern_entity(genres, Genre, name)
+            movie.add_genre(genre)
+            genre.movie_list.append(movie)
+
+        movies.append(movie)
+    return movies
@@ -1,3 +1,4 @@
+from bisect import bisect_left, insort
 from datetime import datetime
 from typing import List
 
@@ -7,12 +8,15 @@ class ModelException(Exception):
 
 
 class Actor:
+    __slots__ = ('__actor_full_name', '_colleagues', '_movies')
+
     def __init__(self, actor_full_name: str):
         if actor_full_name == "" or type(actor_full_name) is not str:
             self.__actor_full_name = None
         else:
             self.__actor_full_name = actor_full_name.strip()
-        self.colleague = []
+        # Most actors never get colleagues, so the list is only created when first needed.
+        self._colleagues = None
         self._movies = []
 
     @property
@@ -34,6 +38,12 @@ class Actor:
     def movies(self, movie):
         self._movies.append(movie)
 
+    @property
+    def colleague(self):
+        if self._colleagues is None:
+            self._colleagues = []
+        return self._colleagues
+
     def __repr__(self):
         return f"<Actor {self.actor_full_name}>"
 
@@ -53,10 +63,11 @@ class Actor:
         self.colleague.append(colleague)
 
     def check_if_this_actor_worked_with(self, colleague: "Actor"):
-        return colleague in self.colleague
+        return self._colleagues is not None and colleague in self._colleagues
 
 
 class Director:
+    __slots__ = ('__director_full_name', '_movies')
 
     def __init__(self, director_full_name: str):
         if director_full_name == "" or type(director_full_name) is not str:
@@ -94,6 +105,9 @@ class Director:
 
 
 class Movie:
+    __slots__ = ('__movie_name', '__year', '_description', '_director', '_actors', '_genres', '_runtime_minutes', '_id',
+                 '_review', '_hyperlink', '_rating', '_votes')
+
     def __init__(self, movie_name, release_year=None, new_id=None, hyperlink=None):
         if movie_name == "" or type(movie_name) is not str:
             self.__movie_name = None
@@ -180,9 +194,10 @@ class Movie:
 
     @actors.setter
     def actors(self, new_actor_list):
+        # Shared Actor instances are referenced as they are; names get a new Actor.
         actor_list = []
         for actor in new_actor_list:
-            actor_list += [Actor(actor)]
+            actor_list += [actor if isinstance(actor, Actor) else Actor(actor)]
         self._actors = actor_list
 
     @property
@@ -191,9 +206,10 @@ class Movie:
 
     @genres.setter
     def genres(self, new_genre_list):
+        # Shared Genre instances are referenced as they are; names get a new Genre.
         genre_list = []
         for genre in new_genre_list:
-            genre_list += [Genre(genre)]
+            genre_list += [genre if isinstance(genre, Genre) else Genre(genre)]
         self._genres = genre_list
 
     @property
@@ -267,7 +283,7 @@ class Movie:
 
 class Review:
     def __init__(self, movie1: Movie, text, rating_number, user):
-        if movie1 == "" or type(movie1) is not Movie:
+        if movie1 == "" or not isinstance(movie1, Movie):
             self.__movie = None
         else:
             self.__movie = movie1
@@ -320,6 +336,8 @@ class Review:
 
 
 class Genre:
+    __slots__ = ('__genre_name', '_movie')
+
     def __init__(self, genre_name: str):
         if genre_name == "" or type(genre_name) is not str:
             self.__genre_name = None
@@ -364,10 +382,7 @@ class Genre:
 
 class User:
     def __init__(self, name: str, password: str):
-        if name == "" or type(name) is not str:
-            self.__user_name = None
-        else:
-            self.__user_name = name.strip().lower()
+        self.__user_name = normalise_user_name(name)
         if password == "" or type(password) is not str:
             self.__password = None
         else:
@@ -448,63 +463,101 @@ class User:
 
 
 class WatchList:
+    """ Insertion-ordered set of movies keyed by movie id.
+
+    Membership tests are a dict lookup, and the movies are also kept sorted by rating (highest first, ties in the
+    order they were added) so the watch list page never has to sort.
+    """
+
     def __init__(self):
-        self.__watchlist: List[Movie] = []
+        self.__movies = dict()
+        self.__rating_keys = dict()
+        self.__by_rating = []
+        self.__added = 0
         self.__user = None
 
     @property
-    def watch_list(self):
-        return self.__watchlist
+    def watch_list(self) -> List[Movie]:
+        return list(self.__movies.values())
 
     @property
     def user(self):
         return self.__user
 
+    @property
+    def movie_ids(self):
+        # A set-like view, so `movie_id in watch_list.movie_ids` is O(1).
+        return self.__movies.keys()
+
     @watch_list.setter
     def watch_list(self, new_list: list):
-        self.__watchlist = new_list
+        self.__movies = dict()
+        self.__rating_keys = dict()
+        self.__by_rating = []
+        for movie in new_list:
+            self.add_movie(movie)
 
     @user.setter
     def user(self, new_user: User):
         self.__user = new_user
 
+    def contains(self, movie_id) -> bool:
+        return movie_id in self.__movies
+
     def add_movie(self, movie: Movie):
-        if isinstance(movie, Movie):
-            self.__watchlist.append(movie)
+        if isinstance(movie, Movie) and movie.id not in self.__movies:
+            try:
+                rating = float(movie.rating)
+            except (TypeError, ValueError):
+                rating = 0.0
+            self.__added += 1
+            rating_key = (-rating, self.__added)
+            self.__movies[movie.id] = movie
+            self.__rating_keys[movie.id] = rating_key
+            insort(self.__by_rating, (rating_key, movie.id))
 
     def remove_movie(self, movie: Movie):
-        if isinstance(movie, Movie) and movie in self.__watchlist:
-            self.__watchlist.remove(movie)
+        if isinstance(movie, Movie) and movie.id in self.__movies:
+            rating_key = self.__rating_keys.pop(movie.id)
+            del self.__movies[movie.id]
+            del self.__by_rating[bisect_left(self.__by_rating, (rating_key, movie.id))]
+
+    def by_rating(self, start=0, stop=None) -> List[Movie]:
+        return [self.__movies[movie_id] for _, movie_id in self.__by_rating[start:stop]]
 
     def select_movie_to_watch(self, index):
-        if type(index) is not int or index >= len(self.__watchlist):
+        if type(index) is not int or index >= len(self.__movies):
             return None
         else:
-            return self.__watchlist[index]
+            return self.watch_list[index]
 
     def size(self):
-        return len(self.__watchlist)
+        return len(self.__movies)
 
     def first_movie_in_watchlist(self):
-        if len(self.__watchlist) == 0:
+        if len(self.__movies) == 0:
             return None
         else:
-            return self.__watchlist[0]
+            return next(iter(self.__movies.values()))
 
     def __repr__(self):
-        return ", ".join(str(x) for x in self.__watchlist)
+        return ", ".join(str(x) for x in self.__movies.values())
+
+    def __len__(self):
+        return len(self.__movies)
+
+    def __contains__(self, movie):
+        return isinstance(movie, Movie) and movie.id in self.__movies
 
     def __iter__(self):
-        self.n = 0
-        return self
-
-    def __next__(self):
-        if self.n < len(self.__watchlist):
-            result = self.__watchlist[self.n]
-            self.n += 1
-            return result
-        else:
-            raise StopIteration
+        return iter(list(self.__movies.values()))
+
+
+def normalise_user_name(name):
+    # User names are stored stripped and lower-cased; lookups must normalise the same way.
+    if name == "" or type(name) is not str:
+        return None
+    return name.strip().lower()
 
 
 def make_review(comment_text: str, user: User, movie: Movie, timestamp: datetime = datetime.today()):
@@ -3,7 +3,6 @@ from datetime import date
 from flask import Blueprint
 from flask import request, render_template, redirect, url_for, session
 
-from better_profanity import profanity
 from flask_wtf import FlaskForm
 from wtforms import TextAreaField, HiddenField, SubmitField, IntegerField, StringField
 from wtforms.validators import DataRequired, Length, ValidationError
@@ -13,6 +12,9 @@ import movie_web_app.utilities.utilities as utilities
 import movie_web_app.movie.services as services
 
 from movie_web_app.authentication.authentication import login_required
+from movie_web_app.utilities.conditional import conditional_get
+from movie_web_app.movie.profanity_filter import profanity_filter
+from movie_web_app.movie.search_results import SearchResultCache
 
 # Configure Blueprint.
 from movie_web_app.domainmodel.model import Actor, Director, Genre, Movie
@@ -20,6 +22,9 @@ from movie_web_app.domainmodel.model import Actor, Director, Genre, Movie
 movies_blueprint = Blueprint(
     'movies_bp', __name__)
 
+# Recent search results, shared by all requests handled by this process.
+search_results = SearchResultCache()
+
 
 # @movies_blueprint.route('/movies_by_date', methods=['GET'])
 # def movies_by_date():
@@ -118,19 +123,15 @@ movies_blueprint = Blueprint(
 
 
 @movies_blueprint.route('/movies_by_date', methods=['GET'])
+@conditional_get('movies', 'comments')
 def movies_by_date():
     if 'username' not in session:
         username = None
     else:
         username = session['username']
 
-    id_list = []
-    # print("usernmae", username)
     if username is not None:
         user = services.get_user(username, repo.repo_instance)
-
-        for movie in user['watch_list']:
-            id_list.append(movie.id)
     else:
         user = None
     movies_per_page = 10
@@ -167,6 +168,12 @@ def movies_by_date():
     # Retrieve the batch of movies to display on the Web page.
     movies = services.get_movies_by_id(movie_ids[cursor:cursor + movies_per_page], repo.repo_instance)
 
+    # Find which of the batch are in the user's watch list, with one lookup for the whole page.
+    watch_list_ids = set()
+    if user is not None:
+        watch_list_ids = services.get_watch_list_ids_among(username, movie_ids[cursor:cursor + movies_per_page],
+                                                           repo.repo_instance)
+
     first_movie_url = None
     last_movie_url = None
     next_movie_url = None
@@ -193,9 +200,10 @@ def movies_by_date():
         movie['view_comment_url'] = url_for('movies_bp.movies_by_date', year=target_year, cursor=cursor,
                                             view_comments_for=movie['id'])
         movie['add_comment_url'] = url_for('movies_bp.comment_on_movies', movie=movie['id'], cursor=cursor, page='date')
+        movie['similar_movies_url'] = url_for('movies_bp.similar_movies', movie=movie['id'])
         # movie['add_to_watch_list_url'] =
         if user is not None:
-            if movie['id'] not in id_list:
+            if movie['id'] not in watch_list_ids:
                 movie['add_to_watch_list_url'] = url_for('movies_bp.watch_list_dates', movie_id=movie['id'],
                                                          cursor=cursor,
                                                          show=movies_to_show_comments)
@@ -221,24 +229,20 @@ def movies_by_date():
         prev_movie_url=prev_movie_url,
         next_movie_url=next_movie_url,
         show_comments_for_movies=movies_to_show_comments,
-        id_list=id_list
+        watch_list_ids=watch_list_ids
     )
 
 
 @movies_blueprint.route('/movies_by_genre', methods=['GET'])
+@conditional_get('movies', 'comments')
 def movies_by_genre():
     if 'username' not in session:
         username = None
     else:
         username = session['username']
 
-    id_list = []
-    # print("usernmae", username)
     if username is not None:
         user = services.get_user(username, repo.repo_instance)
-
-        for movie in user['watch_list']:
-            id_list.append(movie.id)
     else:
         user = None
     movies_per_page = 10
@@ -267,6 +271,12 @@ def movies_by_genre():
     # Retrieve the batch of movies to display on the Web page.
     movies = services.get_movies_by_id(movie_ids[cursor:cursor + movies_per_page], repo.repo_instance)
 
+    # Find which of the batch are in the user's watch list, with one lookup for the whole page.
+    watch_list_ids = set()
+    if user is not None:
+        watch_list_ids = services.get_watch_list_ids_among(username, movie_ids[cursor:cursor + movies_per_page],
+                                                           repo.repo_instance)
+
     first_movie_url = None
     last_movie_url = None
     next_movie_url = None
@@ -292,10 +302,11 @@ def movies_by_genre():
                                             view_comments_for=movie['id'])
         movie['add_comment_url'] = url_for('movies_bp.comment_on_movies', movie=movie['id'], cursor=cursor,
                                            page='genre')
+        movie['similar_movies_url'] = url_for('movies_bp.similar_movies', movie=movie['id'])
         # if movie not in;
         # print("movie id", movie['id'])
         if user is not None:
-            if movie['id'] not in id_list:
+            if movie['id'] not in watch_list_ids:
                 movie['add_to_watch_list_url'] = url_for('movies_bp.watch_list_genres', movie_id=movie['id'],
                                                          genre=genre_name, cursor=cursor, show=movies_to_show_comments)
             else:
@@ -318,7 +329,7 @@ def movies_by_genre():
         prev_movie_url=prev_movie_url,
         next_movie_url=next_movie_url,
         show_comments_for_movies=movies_to_show_comments,
-        id_list=id_list
+        watch_list_ids=watch_list_ids
     )
 
 
@@ -346,15 +357,11 @@ def show_watchlist():
         # Convert cursor from string to int.
         cursor = int(cursor)
 
-    # Retrieve movies ids for movies that are classified with genre_name.
-    # Retrieve the batch of movies to display on the Web page.
-    watch_list = services.get_watch_list_for_user(username, repo.repo_instance)
-
-    movie_ids = []
-    for movie in watch_list:
-        movie_ids.append(int(movie['id']))
+    # Retrieve only the ids of this batch of watch list movies; the repository pages the watch list itself.
+    number_of_movies = services.get_watch_list_size(username, repo.repo_instance)
+    movie_ids = services.get_watch_list_ids_for_user(username, repo.repo_instance, cursor, movies_per_page)
     # Retrieve the batch of movies to display on the Web page.
-    movies = services.get_movies_by_id(movie_ids[cursor:cursor + movies_per_page], repo.repo_instance)
+    movies = services.get_movies_by_id(movie_ids, repo.repo_instance)
 
     first_movie_url = None
     last_movie_url = None
@@ -366,12 +373,12 @@ def show_watchlist():
         prev_movie_url = url_for('movies_bp.show_watchlist', cursor=cursor - movies_per_page)
         first_movie_url = url_for('movies_bp.show_watchlist')
 
-    if cursor + movies_per_page < len(movie_ids):
+    if cursor + movies_per_page < number_of_movies:
         # There are further movies, so generate URLs for the 'next' and 'last' navigation buttons.
         next_movie_url = url_for('movies_bp.show_watchlist', cursor=cursor + movies_per_page)
 
-        last_cursor = movies_per_page * int(len(movie_ids) / movies_per_page)
-        if len(movie_ids) % movies_per_page == 0:
+        last_cursor = movies_per_page * int(number_of_movies / movies_per_page)
+        if number_of_movies % movies_per_page == 0:
             last_cursor -= movies_per_page
         last_movie_url = url_for('movies_bp.show_watchlist', cursor=last_cursor)
 
@@ -530,6 +537,7 @@ def comment_on_movies():
 
 
 @movies_blueprint.route('/search_by_genre', methods=['GET'])
+@conditional_get('movies')
 def search_by_genre():
     return render_template('movies/genre_search.html',
                            genre_urls=utilities.get_genres_and_urls(),
@@ -538,6 +546,7 @@ def search_by_genre():
 
 
 @movies_blueprint.route('/search_by_year', methods=['GET'])
+@conditional_get('movies')
 def search_by_year():
     return render_template('movies/year_search.html',
                            year_urls=utilities.get_year_and_urls(),
@@ -549,12 +558,14 @@ def search_by_year():
 def movies_by_search():
     movies_per_page = 10
 
-    # Read query parameters.
-    movie_ids = request.args.getlist('movies')
-    for i in range(len(movie_ids)):
-        movie_ids[i] = int(movie_ids[i])
-    #
-    # print("movies id", movie_ids)
+    # Read query parameters. The result ids are kept server-side and addressed by the results token, which encodes
+    # the query, so a worker that doesn't hold them searches again.
+    results_token = request.args.get('results')
+    movie_ids = search_results.get(
+        results_token, lambda query: services.get_movie_ids_for_search(query, repo.repo_instance))
+    if movie_ids is None:
+        # Not a results token, or its search now finds nothing, so ask for the search again.
+        return redirect(url_for('movies_bp.search_movies'))
 
     cursor = request.args.get('cursor')
     if cursor is None:
@@ -565,7 +576,6 @@ def movies_by_search():
         cursor = int(cursor)
 
     movies_to_show = services.get_movies_by_id(movie_ids[cursor:cursor + movies_per_page], repo.repo_instance)
-    print(movies_to_show)
     first_movie_url = None
     last_movie_url = None
     next_movie_url = None
@@ -573,17 +583,17 @@ def movies_by_search():
 
     if cursor > 0:
         # There are preceding movies, so generate URLs for the 'previous' and 'first' navigation buttons.
-        prev_movie_url = url_for('movies_bp.movies_by_search', movies=movie_ids, cursor=cursor - movies_per_page)
-        first_movie_url = url_for('movies_bp.movies_by_search', movies=movie_ids)
+        prev_movie_url = url_for('movies_bp.movies_by_search', results=results_token, cursor=cursor - movies_per_page)
+        first_movie_url = url_for('movies_bp.movies_by_search', results=results_token)
 
     if cursor + movies_per_page < len(movie_ids):
         # There are further movies, so generate URLs for the 'next' and 'last' navigation buttons.
-        next_movie_url = url_for('movies_bp.movies_by_search', movies=movie_ids, cursor=cursor + movies_per_page)
+        next_movie_url = url_for('movies_bp.movies_by_search', results=results_token, cursor=cursor + movies_per_page)
 
         last_cursor = movies_per_page * int(len(movie_ids) / movies_per_page)
         if len(movie_ids) % movies_per_page == 0:
             last_cursor -= movies_per_page
-        last_movie_url = url_for('movies_bp.movies_by_search', movies=movie_ids, cursor=last_cursor)
+        last_movie_url = url_for('movies_bp.movies_by_search', results=results_token, cursor=last_cursor)
 
     return render_template(
         'movies/movies.html',
@@ -599,19 +609,118 @@ def movies_by_search():
     )
 
 
+@movies_blueprint.route('/browse', methods=['GET'])
+def browse():
+    movies_per_page = 10
+
+    # Read query parameters. Values that are missing or not numbers are left as None, so they are not applied.
+    criteria = {
+        'genre': request.args.get('genre'),
+        'director': request.args.get('director'),
+        'actor': request.args.get('actor'),
+        'first_year': request.args.get('first_year', type=int),
+        'last_year': request.args.get('last_year', type=int),
+        'min_rating': request.args.get('min_rating', type=float),
+        'max_rating': request.args.get('max_rating', type=float),
+    }
+    criteria = {name: value for name, value in criteria.items() if value not in (None, '')}
+    cursor = request.args.get('cursor', 0, type=int)
+
+    movie_ids, facets = services.get_faceted_movies(repo.repo_instance, **criteria)
+    movies = services.get_movies_by_id(movie_ids[cursor:cursor + movies_per_page], repo.repo_instance)
+
+    # Each facet value links to the current browse narrowed by that value.
+    facet_urls = {
+        'genre': [(name, count, url_for('movies_bp.browse', **dict(criteria, genre=name)))
+                  for name, count in facets['genre']],
+        'year': [(year, count, url_for('movies_bp.browse', **dict(criteria, first_year=year, last_year=year)))
+                 for year, count in facets['year']],
+        # Ratings have one decimal place, so a whole-point bucket such as 7 spans 7.0 to 7.9.
+        'rating': [('{}+'.format(bucket), count,
+                    url_for('movies_bp.browse',
+                            **dict(criteria, min_rating=bucket, max_rating=round(bucket + 0.9, 1))))
+                   for bucket, count in facets['rating']],
+        'director': [(name, count, url_for('movies_bp.browse', **dict(criteria, director=name)))
+                     for name, count in facets['director']],
+        'actor': [(name, count, url_for('movies_bp.browse', **dict(criteria, actor=name)))
+                  for name, count in facets['actor']],
+    }
+
+    first_movie_url = None
+    last_movie_url = None
+    next_movie_url = None
+    prev_movie_url = None
+
+    if cursor > 0:
+        # There are preceding movies, so generate URLs for the 'previous' and 'first' navigation buttons.
+        prev_movie_url = url_for('movies_bp.browse', cursor=cursor - movies_per_page, **criteria)
+        first_movie_url = url_for('movies_bp.browse', **criteria)
+
+    if cursor + movies_per_page < len(movie_ids):
+        # There are further movies, so generate URLs for the 'next' and 'last' navigation buttons.
+        next_movie_url = url_for('movies_bp.browse', cursor=cursor + movies_per_page, **criteria)
+
+        last_cursor = movies_per_page * int(len(movie_ids) / movies_per_page)
+        if len(movie_ids) % movies_per_page == 0:
+            last_cursor -= movies_per_page
+        last_movie_url = url_for('movies_bp.browse', cursor=last_cursor, **criteria)
+
+    return render_template(
+        'movies/browse.html',
+        title='Browse',
+        movies_title='{} movies found'.format(len(movie_ids)),
+        movies=movies,
+        facet_urls=facet_urls,
+        clear_url=url_for('movies_bp.browse'),
+        selected_movies=utilities.get_selected_movies(5),
+        genre_urls=utilities.get_genres_and_urls(),
+        first_movie_url=first_movie_url,
+        last_movie_url=last_movie_url,
+        prev_movie_url=prev_movie_url,
+        next_movie_url=next_movie_url,
+    )
+
+
+@movies_blueprint.route('/similar_movies', methods=['GET'])
+def similar_movies():
+    # The neighbours of every movie are precomputed, so this page costs one lookup and one fetch of the movies shown.
+    movie_id = request.args.get('movie', type=int)
+    try:
+        if movie_id is None:
+            raise services.NonExistentMovieException
+        movie = services.get_movie(movie_id, repo.repo_instance)
+        movies = services.get_similar_movies(movie_id, repo.repo_instance)
+    except services.NonExistentMovieException:
+        return redirect(url_for('home_bp.home'))
+
+    for similar_movie in movies:
+        similar_movie['add_comment_url'] = url_for('movies_bp.comment_on_movies', movie=similar_movie['id'])
+        similar_movie['similar_movies_url'] = url_for('movies_bp.similar_movies', movie=similar_movie['id'])
+
+    return render_template(
+        'movies/movies.html',
+        title='Movies',
+        movies_title='More like ' + movie['title'],
+        movies=movies,
+        selected_movies=utilities.get_selected_movies(5),
+        genre_urls=utilities.get_genres_and_urls(),
+        first_movie_url=None,
+        last_movie_url=None,
+        prev_movie_url=None,
+        next_movie_url=None,
+    )
+
+
 @movies_blueprint.route('/search_movies', methods=['GET', 'POST'])
 def search_movies():
     form = SearchForm()
     # Retrieve movies ids for movies
     if form.validate_on_submit():
         name = form.search_info.data
-        movies = services.get_search_info(name, repo.repo_instance)
-        if movies is not None:
-            movie_ids = []
-            for movie in movies:
-                movie_ids.append(int(movie['id']))
-            print("movies", movie_ids)
-            return redirect(url_for('movies_bp.movies_by_search', movies=movie_ids))
+        movie_ids = services.get_movie_ids_for_search(name, repo.repo_instance)
+        if len(movie_ids) > 0:
+            # Store the results server-side, so the result page URLs only carry the query rather than the ids.
+            return redirect(url_for('movies_bp.movies_by_search', results=search_results.put(name, movie_ids)))
         else:
             return render_template("show_nothing.html",
                                    selected_movies=utilities.get_selected_movies()
@@ -630,7 +739,7 @@ class ProfanityFree:
         self.message = message
 
     def __call__(self, form, field):
-        if profanity.contains_profanity(field.data):
+        if profanity_filter.contains_profanity(field.data):
             raise ValidationError(self.message)
 
 
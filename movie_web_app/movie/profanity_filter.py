@@ -0,0 +1,168 @@
+import importlib.util
+import json
+import os
+import string
+import threading
+
+# The letters that better_profanity lets other characters stand in for, e.g. '@' or '4' for 'a'.
+CHARACTER_VARIANTS = {
+    'a': ('a', '@', '*', '4'),
+    'i': ('i', '*', 'l', '1'),
+    'o': ('o', '*', '0', '@'),
+    'u': ('u', '*', 'v'),
+    'v': ('v', '*', 'u'),
+    'l': ('l', '1'),
+    'e': ('e', '*', '3'),
+    's': ('s', '$', '5'),
+    't': ('t', '7'),
+}
+
+# Upper bounds on memoised transitions and on the automaton states they lead to, so text full of unusual characters
+# can't grow the tables without limit. Text that needs a state beyond them is scanned on without the tables.
+MAX_TRANSITIONS = 100000
+MAX_STATES = 20000
+
+
+def better_profanity_file(filename):
+    # Locates one of better_profanity's data files without importing the package, which expands its whole wordlist
+    # into every spelling at import.
+    spec = importlib.util.find_spec('better_profanity')
+    return os.path.join(spec.submodule_search_locations[0], filename)
+
+
+def read_wordlist(filename):
+    with open(filename, encoding='utf-8') as wordlist:
+        return [word.strip().lower() for word in wordlist if word.strip() != '']
+
+
+def word_characters():
+    # The characters better_profanity treats as part of a word.
+    characters = set(string.ascii_letters + string.digits + '@$*"\'')
+    with open(better_profanity_file('alphabetic_unicode.json'), encoding='utf-8') as alphabetic:
+        characters.update(json.load(alphabetic))
+    return frozenset(characters)
+
+
+class ProfanityFilter:
+    """ Finds wordlist entries in text in a single pass, matching what better_profanity's contains_profanity finds.
+
+    A word is a run of word characters. Text contains profanity if a word, or a run of consecutive words joined either
+    as written or with the separators between them dropped, spells a wordlist entry, where each character may also
+    stand in for the letters it is a variant of.
+
+    The wordlist is held as a trie of its plain spellings. The text is scanned by an Aho-Corasick style automaton
+    whose states are sets of trie nodes, so a variant character follows every edge it can stand for instead of every
+    spelling of every entry being generated up front. Transitions are computed on first use and then memoised, so
+    each comment is scanned with one dictionary lookup per character. Unlike better_profanity, a one-letter word at
+    the very end of the text is checked too, so 'f u c k' and 'f.u.c.k' are caught.
+    """
+
+    def __init__(self, words, word_characters, character_variants=CHARACTER_VARIANTS):
+        self._word_characters = word_characters
+        self._letters = {}
+        for letter, variants in character_variants.items():
+            for variant in variants:
+                self._letters.setdefault(variant, {variant}).add(letter)
+
+        # Trie node 0 is the root; _children[node] maps a letter to the next node.
+        self._children = [{}]
+        self._terminal = [False]
+        for word in words:
+            node = 0
+            for letter in word:
+                if letter not in self._children[node]:
+                    self._children[node][letter] = len(self._children)
+                    self._children.append({})
+                    self._terminal.append(False)
+                node = self._children[node][letter]
+            self._terminal[node] = True
+
+        # Automaton states are (in_word, active, suspended): the trie nodes reached by matches in progress, and the
+        # nodes reached at the end of the last word, which the next word may continue without the separators.
+        self._states = []
+        self._state_ids = {}
+        self._transitions = {}
+        self._lock = threading.Lock()
+        self._start = self._state(False, frozenset(), frozenset())
+
+    @classmethod
+    def from_better_profanity(cls):
+        return cls(read_wordlist(better_profanity_file('profanity_wordlist.txt')), word_characters())
+
+    def _state(self, in_word, active, suspended):
+        # Returns the number of the state, or None if it is new and MAX_STATES are already numbered.
+        key = (in_word, active, suspended)
+        with self._lock:
+            if key not in self._state_ids:
+                if len(self._states) >= MAX_STATES:
+                    return None
+                # Appended before it is numbered, so a reader never sees a number without its state.
+                self._states.append(key)
+                self._state_ids[key] = len(self._states) - 1
+            return self._state_ids[key]
+
+    def _advance(self, nodes, character):
+        return frozenset(self._children[node][letter] for node in nodes
+                         for letter in self._letters.get(character, (character,))
+                         if letter in self._children[node])
+
+    def _ends_match(self, nodes):
+        return any(self._terminal[node] for node in nodes)
+
+    def _next(self, key, character):
+        # Returns the (in_word, active, suspended) state after character, and whether a match ends with the word that
+        # character closes.
+        in_word, active, suspended = key
+        if character in self._word_characters:
+            if not in_word:
+                # A word starts: matches may begin here, or carry on from the previous word.
+                active = active | suspended | {0}
+            return (True, self._advance(active, character), frozenset()), False
+        if in_word:
+            return (False, self._advance(active, character), active), self._ends_match(active)
+        return (False, self._advance(active, character), suspended), False
+
+    def _transition(self, state, character):
+        # Returns the number of the next state and whether a match ended, or None if the next state can't be numbered.
+        key, matched = self._next(self._states[state], character)
+        next_state = self._state_ids.get(key)
+        if next_state is None:
+            next_state = self._state(*key)
+            if next_state is None:
+                return None
+        transition = (next_state, matched)
+        if len(self._transitions) < MAX_TRANSITIONS:
+            self._transitions[state, character] = transition
+        return transition
+
+    def _ends_in_match(self, key):
+        in_word, active, _ = key
+        return in_word and self._ends_match(active)
+
+    def contains_profanity(self, text) -> bool:
+        state = self._start
+        transitions = self._transitions
+        text = text.lower()
+        for character in text:
+            transition = transitions.get((state, character))
+            if transition is None:
+                transition = self._transition(state, character)
+                if transition is None:
+                    # Rare enough to scan the text again from the start rather than track the position.
+                    return self._scan(self._states[self._start], text)
+            state, matched = transition
+            if matched:
+                return True
+        return self._ends_in_match(self._states[state])
+
+    def _scan(self, key, text):
+        # Scans text from state key without the tables, for text that needs more states than they can hold.
+        for character in text:
+            key, matched = self._next(key, character)
+            if matched:
+                return True
+        return self._ends_in_match(key)
+
+
+# Built once at import, so application workers forked after the app is loaded share the trie.
+profanity_filter = ProfanityFilter.from_better_profanity()
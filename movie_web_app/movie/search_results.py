@@ -0,0 +1,72 @@
+import base64
+import binascii
+import threading
+import time
+from collections import OrderedDict
+
+
+def query_token(query) -> str:
+    # The URL-safe base64 of the query, without padding.
+    return base64.urlsafe_b64encode(query.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def token_query(token):
+    # Returns the query a token was made from, or None if it isn't a token.
+    if not token:
+        return None
+    try:
+        return base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8')
+    except (binascii.Error, ValueError):
+        return None
+
+
+class SearchResultCache:
+    """ Keeps the movie ids of recent searches server-side, addressed by a token that encodes the search query.
+
+    Holds at most max_entries result lists, evicting the least recently used first, and forgets a result list ttl
+    seconds after it was stored. A process that doesn't hold a token's results, such as another worker, or this one
+    once they were evicted, searches for the token's query again when get is given the search function.
+    """
+
+    def __init__(self, max_entries=256, ttl=900, clock=time.monotonic):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, query, movie_ids) -> str:
+        token = query_token(query)
+        self._store(token, movie_ids)
+        return token
+
+    def _store(self, token, movie_ids):
+        movie_ids = tuple(movie_ids)
+        with self._lock:
+            self._entries[token] = (self._clock() + self._ttl, movie_ids)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return movie_ids
+
+    def get(self, token, search=None):
+        # Returns the stored ids, or those search(query) finds for the token's query if they aren't stored. Returns
+        # None if there are neither, or the search finds nothing.
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and self._clock() < entry[0]:
+                self._entries.move_to_end(token)
+                return entry[1]
+            if entry is not None:
+                del self._entries[token]
+
+        query = token_query(token) if search is not None else None
+        if query is None:
+            return None
+        movie_ids = search(query)
+        if len(movie_ids) == 0:
+            return None
+        return self._store(token, movie_ids)
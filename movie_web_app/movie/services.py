@@ -1,3 +1,4 @@
+from collections.abc import MutableMapping
 from typing import List, Iterable
 
 from movie_web_app.adapters.repository import AbstractRepository
@@ -38,8 +39,7 @@ def add_to_watch_list(movie_id: int, username: str, repo: AbstractRepository):
     user = repo.get_user(username)
     if user is None:
         raise UnknownUserException
-    if movie not in user.watch_list:
-        repo.add_to_watch_list(user, movie)
+    repo.add_to_watch_list(user, movie)
 
 
 def get_movie(movie_id: int, repo: AbstractRepository):
@@ -54,12 +54,12 @@ def get_movie(movie_id: int, repo: AbstractRepository):
 def get_first_movie(repo: AbstractRepository):
     movie = repo.get_first_movie()
 
-    return movie_to_dict(movie)
+    return movie_to_dict(movie, NAVIGATION_FIELDS)
 
 
 def get_last_movie(repo: AbstractRepository):
     movie = repo.get_last_movie()
-    return movie_to_dict(movie)
+    return movie_to_dict(movie, NAVIGATION_FIELDS)
 
 
 def get_user(username: str, repo: AbstractRepository):
@@ -73,8 +73,7 @@ def get_movies_by_year(year, repo: AbstractRepository):
     # Returns Movies for the target year (empty if no matches), the year of the previous movie (might be null),
     # the date of the next movie (might be null)
 
-    movies = repo.get_movies_by_year(target_year=int(year))
-    movies.sort(key=lambda movie: movie.rating, reverse=True)
+    movies = repo.get_movies_by_id(repo.get_movie_ids_for_year(int(year)))
     movies_dto = list()
     prev_year = next_year = None
 
@@ -83,7 +82,7 @@ def get_movies_by_year(year, repo: AbstractRepository):
         next_year = repo.get_year_of_next_movie(movies[0])
 
         # Convert Movies to dictionary form.
-        movies_dto = movies_to_dict(movies)
+        movies_dto = movies_to_dict(movies, CARD_FIELDS)
 
     return movies_dto, prev_year, next_year
 
@@ -114,21 +113,53 @@ def remove_from_watch_list(movie_id, username, repo: AbstractRepository):
 def get_movies_by_id(id_list, repo: AbstractRepository):
     movies = repo.get_movies_by_id(id_list)
 
-    # Convert Articles to dictionary form.
-    movies_as_dict = movies_to_dict(movies)
+    # Convert Articles to the dictionary form shown on the listing pages.
+    movies_as_dict = movies_to_dict(movies, CARD_FIELDS)
 
     return movies_as_dict
 
 
+def get_similar_movies(movie_id, repo: AbstractRepository):
+    if repo.get_movie(int(movie_id)) is None:
+        raise NonExistentMovieException
+    return movies_to_dict(repo.get_movies_by_id(repo.get_similar_movie_ids(int(movie_id))), CARD_FIELDS)
+
+
+def actors_worked_together(first_actor, second_actor, repo: AbstractRepository) -> bool:
+    return repo.get_collaboration_graph().worked_with(first_actor, second_actor)
+
+
+def get_collaboration_path(first_actor, second_actor, repo: AbstractRepository):
+    # Returns the actor names along a shortest chain of shared movies between the two actors, or None.
+    return repo.get_collaboration_graph().shortest_path(first_actor, second_actor)
+
+
+def get_top_collaborators(actor_name, repo: AbstractRepository, limit=10):
+    return repo.get_collaboration_graph().top_collaborators(actor_name, limit)
+
+
+def get_movie_ids_for_search(query, repo: AbstractRepository):
+    return repo.get_movie_ids_for_search(query)
+
+
 def get_search_info(name, repo: AbstractRepository):
-    movies = repo.get_movies_for_actor(name)
-    movies += repo.get_movies(name)
-    movies += repo.get_movies_for_genre(name)
-    movies += repo.get_movies_for_director(name)
-    movies = set(movies)
-    movies = list(movies)
-    movies.sort(key=lambda movie: movie.rating, reverse=True)
-    return movies_to_dict(movies)
+    movie_ids = repo.get_movie_ids_for_search(name)
+    movies = repo.get_movies_by_id(movie_ids)
+    return movies_to_dict(movies, CARD_FIELDS)
+
+
+def get_faceted_movies(repo: AbstractRepository, facet_limit=10, **criteria):
+    # Returns the ids of the movies matching criteria (see AbstractRepository.get_movie_ids_for_facets) and, for each
+    # facet, a list of (value, count) pairs. Years and rating buckets are listed in order; genres, directors and actors
+    # are listed most common first and cut to facet_limit.
+    movie_ids = repo.get_movie_ids_for_facets(**criteria)
+    facets = dict()
+    for facet, counts in repo.get_facet_counts(movie_ids).items():
+        if facet in ('year', 'rating'):
+            facets[facet] = sorted(counts.items())
+        else:
+            facets[facet] = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:facet_limit]
+    return movie_ids, facets
 
 
 def get_comments_for_movie(movie_id, repo: AbstractRepository):
@@ -144,32 +175,104 @@ def get_watch_list_for_user(username, repo: AbstractRepository):
     user = repo.get_user(username)
     if user is None:
         raise UnknownUserException
-    user.watch_list.watch_list.sort(key=lambda movie:movie.rating, reverse=True)
-    return movies_to_dict(user.watch_list)
+    return movies_to_dict(repo.get_movies_by_id(repo.get_watch_list_ids(user)), CARD_FIELDS)
+
+
+def get_watch_list_ids_for_user(username, repo: AbstractRepository, cursor=0, limit=None):
+    # Returns the ids of a page of the user's watch list movies, highest rated first.
+    user = repo.get_user(username)
+    if user is None:
+        raise UnknownUserException
+    return repo.get_watch_list_ids(user, cursor, limit)
+
+
+def get_watch_list_size(username, repo: AbstractRepository):
+    user = repo.get_user(username)
+    if user is None:
+        raise UnknownUserException
+    return repo.get_watch_list_size(user)
+
+
+def get_watch_list_ids_among(username, id_list, repo: AbstractRepository):
+    # Returns the set of ids in id_list that are in the user's watch list, e.g. for the movies on a listing page.
+    user = repo.get_user(username)
+    if user is None:
+        raise UnknownUserException
+    return repo.get_watch_list_ids_among(user, id_list)
 
 
 # ============================================
 # Functions to convert model entities to dicts
 # ============================================
 
-def movie_to_dict(movie: Movie):
-    movie_dict = {
-        'id': movie.id,
-        'year': movie.year,
-        'title': movie.title,
-        'description': movie.description,
-        'hyperlink': None,
-        'image_hyperlink': None,
-        'comments': comments_to_dict(movie.reviews),
-        'genres': genres_to_dict(movie.genres),
-        'vote': movie.votes,
-        'rate': movie.rating
-    }
-    return movie_dict
+class MovieProjection(MutableMapping):
+    """ A dict-like view of a Movie that holds only the keys of one projection, each computed on first access.
+
+    Views may add their own keys, such as URLs, which are stored as given.
+    """
+
+    __slots__ = ('_movie', '_fields', '_values')
+
+    def __init__(self, movie: Movie, fields):
+        self._movie = movie
+        self._fields = fields
+        self._values = dict()
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._fields:
+                raise KeyError(key)
+            self._values[key] = MOVIE_FIELDS[key](self._movie)
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
 
+    def __delitem__(self, key):
+        if key in self._fields:
+            self._fields = tuple(field for field in self._fields if field != key)
+            self._values.pop(key, None)
+        else:
+            del self._values[key]
 
-def movies_to_dict(movies: Iterable[Movie]):
-    return [movie_to_dict(movie) for movie in movies]
+    def __iter__(self):
+        yield from self._fields
+        yield from (key for key in self._values if key not in self._fields)
+
+    def __len__(self):
+        return len(self._fields) + sum(1 for key in self._values if key not in self._fields)
+
+    def __repr__(self):
+        return '<MovieProjection {} {}>'.format(self._movie.id, list(self))
+
+
+MOVIE_FIELDS = {
+    'id': lambda movie: movie.id,
+    'year': lambda movie: movie.year,
+    'title': lambda movie: movie.title,
+    'description': lambda movie: movie.description,
+    'hyperlink': lambda movie: None,
+    'image_hyperlink': lambda movie: None,
+    'comments': lambda movie: comments_to_dict(movie.reviews),
+    'comment_count': lambda movie: len(movie.reviews),
+    'genres': lambda movie: genre_names_to_dict(movie.genres),
+    'vote': lambda movie: movie.votes,
+    'rate': lambda movie: movie.rating,
+}
+
+# Fields used by the navigation buttons, by the movie cards of the listing pages, and by a single movie. Comments are
+# only converted for cards whose comments are actually shown.
+NAVIGATION_FIELDS = ('id', 'year', 'title')
+CARD_FIELDS = NAVIGATION_FIELDS + ('description', 'genres', 'vote', 'rate', 'comment_count', 'comments')
+DETAIL_FIELDS = CARD_FIELDS + ('hyperlink', 'image_hyperlink')
+
+
+def movie_to_dict(movie: Movie, fields=DETAIL_FIELDS):
+    return MovieProjection(movie, fields)
+
+
+def movies_to_dict(movies: Iterable[Movie], fields=DETAIL_FIELDS):
+    return [MovieProjection(movie, fields) for movie in movies]
 
 
 def comment_to_dict(comment: Review):
@@ -185,8 +288,7 @@ def comment_to_dict(comment: Review):
 def user_to_dict(user: User):
     user_dict = {
         'username': user.user_name,
-        'password': user.password,
-        'watch_list': user.watch_list.watch_list
+        'password': user.password
     }
     return user_dict
 
@@ -207,6 +309,11 @@ def genres_to_dict(genres: Iterable[Genre]):
     return [genre_to_dict(genre) for genre in genres]
 
 
+def genre_names_to_dict(genres: Iterable[Genre]):
+    # Genres as shown on a movie, without the ids of every other movie in each genre.
+    return [{'name': genre.genre_name} for genre in genres]
+
+
 # ============================================
 # Functions to convert dicts to model entities
 # ============================================
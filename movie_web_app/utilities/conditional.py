@@ -0,0 +1,68 @@
+import hashlib
+import math
+from functools import wraps
+
+from flask import current_app, request, session
+
+import movie_web_app.adapters.repository as repo
+from movie_web_app.domainmodel.model import normalise_user_name
+
+
+def page_validators(kinds):
+    """ Returns the strong ETag of the current request's page, and when its data last changed in seconds since the
+    epoch, or None if that isn't known.
+
+    The page is identified by its URL and the signed-in user, and its data by the repository's versions of the given
+    kinds of data, plus that of the user's watch list when a user is signed in. The database repository keeps its
+    versions in the database, so every process serving the site gives a page the same ETag.
+    """
+    repository = repo.repo_instance
+    username = session.get('username')
+    versions = [(kind, repository.get_data_version(kind)) for kind in kinds]
+    if username is not None:
+        username = normalise_user_name(username)
+        versions.append(('watch_lists', repository.get_data_version('watch_lists', username)))
+    page = (request.script_root, request.path, sorted(request.args.items(multi=True)), username,
+            [(kind, version.version) for kind, version in versions])
+    etag = hashlib.sha1(repr(page).encode('utf-8')).hexdigest()
+    return etag, max((version.changed for _, version in versions if version.changed is not None), default=None)
+
+
+def _add_validators(response, etag, last_changed):
+    response.set_etag(etag)
+    if last_changed is not None:
+        # Rounded up to the header's whole seconds, so it is never earlier than the last change.
+        response.last_modified = math.ceil(last_changed)
+    # The page depends on who is signed in, so only the browser may keep it, and must revalidate it before each use.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_get(*kinds):
+    """ Lets a GET view answer a request for an unchanged page with 304 Not Modified, without running the view.
+
+    kinds are the CHANGE_KINDS of repository data the page shows. Whether the page changed is decided by its ETag
+    alone: Last-Modified is sent for information, but has whole-second resolution and doesn't tell who the page was
+    for, so If-Modified-Since is ignored. The sidebar's featured movies are not part of the ETag, so a revalidated page
+    keeps the selection it was first rendered with.
+    """
+    kinds = kinds or ('movies',)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped_view(**kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(**kwargs)
+            # Taken before the view runs, so a change made while it renders gives the next request a new ETag.
+            etag, last_changed = page_validators(kinds)
+            if request.if_none_match.contains_weak(etag):
+                return _add_validators(current_app.response_class(status=304), etag, last_changed)
+
+            response = current_app.make_response(view(**kwargs))
+            if response.status_code == 200:
+                _add_validators(response, etag, last_changed)
+            return response
+        return wrapped_view
+    return decorator
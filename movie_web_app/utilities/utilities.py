@@ -1,3 +1,7 @@
+import random
+import threading
+import time
+
 from flask import Blueprint, request, render_template, redirect, url_for, session
 
 # import movie_web_app.adapters.Movie_repo as repo
@@ -9,25 +13,73 @@ utilities_blueprint = Blueprint(
     'utilities_bp', __name__)
 
 
-def get_genres_and_urls():
-    genre_names = services.get_genre_names(repo.repo_instance)
-    genre_urls = dict()
-    for genre_name in genre_names:
-        genre_urls[genre_name] = url_for('movies_bp.movies_by_genre', genre=genre_name)
+class FragmentCache:
+    """ Holds the genre and year navigation URL maps and a pool of featured movies for the sidebar.
+
+    The fragments are rebuilt only when the catalogue changes, i.e. when the repository is replaced or its movies
+    version goes up. The featured pool is also redrawn every pool_lifetime seconds, so the sidebar keeps rotating.
+    """
+
+    def __init__(self, pool_size=30, pool_lifetime=300, clock=time.monotonic):
+        self._pool_size = pool_size
+        self._pool_lifetime = pool_lifetime
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self._catalogue = None
+        self._genre_urls = None
+        self._year_urls = None
+        self._featured = None
+        self._featured_expires = 0
+
+    def _check_catalogue(self):
+        # Generated URLs also depend on where the application is mounted.
+        catalogue = (repo.repo_instance, repo.repo_instance.changes.version('movies'), request.script_root)
+        if self._catalogue != catalogue:
+            self.invalidate()
+            self._catalogue = catalogue
+
+    def genre_urls(self):
+        with self._lock:
+            self._check_catalogue()
+            if self._genre_urls is None:
+                self._genre_urls = {genre_name: url_for('movies_bp.movies_by_genre', genre=genre_name)
+                                    for genre_name in services.get_genre_names(repo.repo_instance)}
+            return self._genre_urls
 
-    return genre_urls
+    def year_urls(self):
+        with self._lock:
+            self._check_catalogue()
+            if self._year_urls is None:
+                self._year_urls = {year: url_for('movies_bp.movies_by_date', year=year)
+                                   for year in services.get_years(repo.repo_instance)}
+            return self._year_urls
+
+    def featured_movies(self, quantity):
+        with self._lock:
+            self._check_catalogue()
+            if self._featured is None or self._clock() >= self._featured_expires:
+                movies = services.get_random_movies(self._pool_size, repo.repo_instance)
+                for movie in movies:
+                    movie['hyperlink'] = url_for('movies_bp.movies_by_date', year=int(movie['year']))
+                self._featured = movies
+                self._featured_expires = self._clock() + self._pool_lifetime
+            featured = self._featured
+        return random.sample(featured, min(quantity, len(featured)))
+
+
+fragments = FragmentCache()
+
+
+def get_genres_and_urls():
+    return fragments.genre_urls()
 
 
 def get_year_and_urls():
-    years = services.get_years(repo.repo_instance)
-    year_urls = dict()
-    for year in years:
-        year_urls[year] = url_for('movies_bp.movies_by_date', year=year)
-    return year_urls
+    return fragments.year_urls()
 
 
 def get_selected_movies(quantity=3):
-    movies = services.get_random_movies(quantity, repo.repo_instance)
-    for movie in movies:
-        movie['hyperlink'] = url_for('movies_bp.movies_by_date', year=int(movie['year']))
-    return movies
+    return fragments.featured_movies(quantity)
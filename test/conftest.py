@@ -1,13 +1,25 @@
 import os
 
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import clear_mappers, sessionmaker
+from sqlalchemy.pool import NullPool
 
 # import movie_web_app.adapters.Movie_repo as movie_repo
 from movie_web_app import create_app
-from movie_web_app.adapters import Movie_repo
+from movie_web_app.adapters import Movie_repo, database_repository
 from movie_web_app.adapters.Movie_repo import MovieRepo
+from movie_web_app.adapters.orm import metadata, map_model_to_tables
 
-TEST_DATA_PATH = "C:/Users/zhong/Desktop/compsci-235-A2/test/data"
+TEST_DATA_PATH = "/root/package/test/data"
+
+
+@pytest.fixture(autouse=True)
+def unmapped_domain_model():
+    # An application created in database mode maps the domain model; clear the mappers after every test, so the plain
+    # domain objects of the next test aren't instrumented for a database it doesn't use.
+    yield
+    clear_mappers()
 
 
 @pytest.fixture
@@ -17,6 +29,30 @@ def in_memory_repo():
     return repo
 
 
+@pytest.fixture
+def data_path():
+    return TEST_DATA_PATH
+
+
+@pytest.fixture
+def database_session_factory(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'movies.db'), connect_args={"check_same_thread": False},
+                           poolclass=NullPool)
+    clear_mappers()
+    metadata.create_all(engine)
+    map_model_to_tables()
+    session_factory = sessionmaker(bind=engine)
+    database_repository.populate(engine, session_factory, TEST_DATA_PATH, 'Data1000Movies.csv')
+
+    yield session_factory
+    clear_mappers()
+
+
+@pytest.fixture
+def database_repo(database_session_factory):
+    return database_repository.SqlAlchemyRepository(database_session_factory)
+
+
 @pytest.fixture
 def client():
     my_app = create_app({
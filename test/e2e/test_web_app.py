@@ -1,6 +1,19 @@
+import calendar
+import os
+import shutil
+import time
+
 import pytest
 
-from flask import session
+from flask import session, template_rendered
+
+from movie_web_app import create_app
+import movie_web_app.adapters.repository as repo
+from movie_web_app.adapters.caching_repository import CachingRepository
+import movie_web_app.utilities.utilities as utilities
+import movie_web_app.movie.movie_page as movie_page
+from movie_web_app.movie.search_results import SearchResultCache
+from movie_web_app.domainmodel.model import Movie
 
 
 def test_register(client):
@@ -139,6 +152,183 @@ def test_movies_with_genre(client):
     assert response.status_code == 200
 
 
+def test_catalogue_pages_answer_conditional_requests(client, auth):
+    rendered = []
+    template_rendered.connect(lambda sender, template, context, **extra: rendered.append(template.name),
+                              client.application, weak=False)
+    response = client.get('/movies_by_genre?genre=Sci-Fi')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+    assert len(rendered) == 1
+
+    response = client.get('/movies_by_genre?genre=Sci-Fi', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    assert len(rendered) == 1
+    # Only the ETag decides whether the page changed.
+    assert client.get('/movies_by_genre?genre=Sci-Fi', headers={'If-Modified-Since': last_modified}).status_code == 200
+    assert client.get('/movies_by_genre?genre=Sci-Fi&cursor=10', headers={'If-None-Match': etag}).status_code == 200
+
+    # Signing in and changing the watch list both change the page.
+    auth.login()
+    response = client.get('/movies_by_genre?genre=Sci-Fi', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    changed = time.time()
+    client.get('/watch_list_genres?genre=Sci-Fi&movie_id=1')
+    response = client.get('/movies_by_genre?genre=Sci-Fi', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert calendar.timegm(response.last_modified.utctimetuple()) >= changed
+    etag = response.headers['ETag']
+
+    # Another user's watch list is not part of the page.
+    repo.repo_instance.add_to_watch_list(repo.repo_instance.get_user('fmercury'), repo.repo_instance.get_movie(2))
+    assert client.get('/movies_by_genre?genre=Sci-Fi', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_search_pages_answer_conditional_requests(client):
+    for page in ('/search_by_genre', '/search_by_year'):
+        etag = client.get(page).headers['ETag']
+        assert client.get(page, headers={'If-None-Match': etag}).status_code == 304
+
+    etag = client.get('/search_by_year').headers['ETag']
+    movie = Movie('Zorblax Returns', 1999, 1001)
+    repo.repo_instance.add_movie(movie)
+    repo.repo_instance.add_movie_to_year_dict(movie, 1999)
+    response = client.get('/search_by_year', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'1999' in response.data
+
+
+def test_browse_with_facets(client):
+    response = client.get('/browse?director=Christopher+Nolan&first_year=2008')
+    assert response.status_code == 200
+
+    # Check that the matching movies and the facet counts are on the page.
+    assert b'4 movies found' in response.data
+    assert b'The Dark Knight' in response.data
+    assert b'The Prestige' not in response.data
+    assert b'Christian Bale (2)' in response.data
+
+
+def test_similar_movies(client):
+    # The neighbours are precomputed when the application starts, not on the first request.
+    assert repo.repo_instance._similar_movies is not None
+    response = client.get('/movies_by_genre?genre=Sci-Fi')
+    assert b'/similar_movies?movie=' in response.data
+
+    response = client.get('/similar_movies?movie=1')
+    assert response.status_code == 200
+    assert b'More like Guardians of the Galaxy' in response.data
+    assert b'Star Trek Beyond' in response.data
+
+
+def test_similar_movies_for_unknown_movie(client):
+    response = client.get('/similar_movies?movie=10009')
+    assert response.headers['Location'] == 'http://localhost/'
+
+
+def test_repository_cache_is_enabled_by_config(data_path):
+    app = create_app({'TESTING': True, 'TEST_DATA_PATH': data_path, 'REPOSITORY_CACHE': True})
+    client = app.test_client()
+
+    assert isinstance(repo.repo_instance, CachingRepository)
+    assert client.get('/movies_by_genre?genre=Sci-Fi').status_code == 200
+    assert client.get('/movies_by_genre?genre=Sci-Fi').status_code == 200
+    assert repo.repo_instance.statistics()['hits'] > 0
+
+
+def test_search_results_are_paged_by_token(client):
+    response = client.post('/search_movies', data={'search_info': 'the'})
+    assert response.status_code == 302
+
+    # Check that the result page URL carries a token for the query rather than the matching ids.
+    location = response.headers['Location']
+    assert 'results=' in location and 'movies=' not in location
+    assert len(location) < 100
+
+    response = client.get(location)
+    assert response.status_code == 200
+    assert b'Search Result' in response.data
+    assert b'cursor=10' in response.data
+
+
+def test_search_results_are_rebuilt_by_a_worker_that_does_not_hold_them(client, monkeypatch):
+    response = client.post('/search_movies', data={'search_info': 'the'})
+    location = response.headers['Location']
+    # The sidebar picks random movies, so compare the results before it.
+    page = client.get(location).data.split(b'<aside id="sidebar">')[0]
+
+    # As if another worker answered the request: the token's query is searched for again.
+    monkeypatch.setattr(movie_page, 'search_results', SearchResultCache())
+    response = client.get(location)
+    assert response.status_code == 200
+    assert response.data.split(b'<aside id="sidebar">')[0] == page
+
+
+def test_search_results_with_unknown_token(client):
+    response = client.get('/movies_by_search?results=unknown')
+    assert response.headers['Location'].endswith('/search_movies')
+
+
+def test_navigation_fragments_are_cached_until_the_catalogue_changes(client):
+    with client.application.test_request_context('/'):
+        genre_urls = utilities.get_genres_and_urls()
+        year_urls = utilities.get_year_and_urls()
+        assert genre_urls['Sci-Fi'] == '/movies_by_genre?genre=Sci-Fi'
+        assert utilities.get_genres_and_urls() is genre_urls
+        assert utilities.get_year_and_urls() is year_urls
+        assert len(utilities.get_selected_movies(5)) == 5
+
+        movie = Movie('Zorblax Returns', 1999, 1001)
+        repo.repo_instance.add_movie(movie)
+        repo.repo_instance.add_movie_to_year_dict(movie, 1999)
+
+        assert 1999 in utilities.get_year_and_urls()
+        assert utilities.get_genres_and_urls() is not genre_urls
+
+
+def test_hash_users_command_writes_a_pre_hashed_file(client, data_path, tmp_path):
+    target = str(tmp_path / 'users.csv')
+    result = client.application.test_cli_runner().invoke(
+        args=['hash-users', target, '--source', os.path.join(data_path, 'users.csv'), '--workers', '1'])
+    assert 'Wrote' in result.output
+
+    with open(target) as users:
+        lines = users.read().splitlines()
+    assert lines[0] == 'id,username,password'
+    assert all(line.split(',')[2].startswith('pbkdf2:') for line in lines[1:])
+
+
+def test_hash_users_command_reads_the_data_directory_users_by_default(client, data_path, tmp_path):
+    target = str(tmp_path / 'users.csv')
+    result = client.application.test_cli_runner().invoke(args=['hash-users', target, '--workers', '1'])
+    assert result.exit_code == 0
+
+    with open(os.path.join(data_path, 'users.csv')) as source, open(target) as users:
+        assert len(users.read().splitlines()) == len(source.read().splitlines())
+
+
+def test_hash_users_command_rewrites_the_source_only_in_place(client, data_path, tmp_path):
+    source = str(tmp_path / 'users.csv')
+    shutil.copy(os.path.join(data_path, 'users.csv'), source)
+    runner = client.application.test_cli_runner()
+
+    for args in (['--source', source], ['--source', source, source], ['--source', source, source, '--in-place']):
+        result = runner.invoke(args=['hash-users'] + args + ['--workers', '1'])
+        assert result.exit_code != 0
+    with open(source) as users:
+        original = users.read()
+    assert 'pbkdf2:' not in original
+
+    result = runner.invoke(args=['hash-users', '--source', source, '--in-place', '--workers', '1'])
+    assert result.exit_code == 0
+    with open(source + '.bak') as backup:
+        assert backup.read() == original
+    with open(source) as users:
+        assert all(line.split(',')[2].startswith('pbkdf2:') for line in users.read().splitlines()[1:])
+
+
 def test_movies_can_show_watch_list(client):
     response = client.get('/show_watchlist')
     assert response.status_code == 302
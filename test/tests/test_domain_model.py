@@ -0,0 +1,51 @@
+import pytest
+
+from movie_web_app.domainmodel.model import Movie, Actor, Director, Genre, WatchList
+
+
+def test_domain_entities_have_no_instance_dict():
+    for entity in (Movie("Moana", 2016), Actor("Auli'i Cravalho"), Director("Ron Clements"), Genre("Animation")):
+        with pytest.raises(AttributeError):
+            entity.unexpected = True
+
+
+def test_movie_references_shared_actors_and_genres():
+    actor = Actor("Auli'i Cravalho")
+    genre = Genre("Animation")
+    movie = Movie("Moana", 2016)
+
+    movie.actors = [actor, "Dwayne Johnson"]
+    movie.genres = [genre]
+
+    assert movie.actors[0] is actor
+    assert movie.actors[1] == Actor("Dwayne Johnson")
+    assert movie.genres[0] is genre
+
+
+def test_actor_colleagues():
+    actor = Actor("Auli'i Cravalho")
+    colleague = Actor("Dwayne Johnson")
+
+    assert not actor.check_if_this_actor_worked_with(colleague)
+    actor.add_actor_colleague(colleague)
+    assert actor.check_if_this_actor_worked_with(colleague)
+    assert actor.colleague == [colleague]
+
+
+def test_watch_list_is_an_ordered_set_with_a_rating_order():
+    movies = [Movie("Moana", 2016, 1), Movie("Up", 2009, 2), Movie("Coco", 2017, 3)]
+    for movie, rating in zip(movies, (7.6, 8.2, 7.6)):
+        movie.rating = rating
+    watch_list = WatchList()
+    for movie in movies + [movies[0]]:
+        watch_list.add_movie(movie)
+
+    assert watch_list.size() == 3
+    assert watch_list.watch_list == movies
+    assert watch_list.by_rating() == [movies[1], movies[0], movies[2]]
+    assert watch_list.contains(2) and 2 in watch_list.movie_ids and movies[1] in watch_list
+
+    watch_list.remove_movie(movies[1])
+    assert not watch_list.contains(2)
+    assert watch_list.by_rating() == [movies[0], movies[2]]
+    assert watch_list.first_movie_in_watchlist() is movies[0]
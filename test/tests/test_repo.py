@@ -1,9 +1,20 @@
+import os
+import time
 from datetime import date, datetime
 from typing import List
 
 import pytest
-
-from movie_web_app.adapters.repository import RepositoryException
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from movie_web_app.adapters import snapshot, Movie_repo, user_import, database_repository, comment_writer
+from movie_web_app.adapters.caching_repository import CachingRepository
+from movie_web_app.adapters.collaboration_graph import CollaborationGraph
+from movie_web_app.adapters.comment_writer import CommentWriter
+from movie_web_app.adapters.database_repository import SqlAlchemyRepository
+from movie_web_app.adapters.database_engine import create_database_engine
+from movie_web_app.adapters.orm import PersistentMovie
+from movie_web_app.adapters.repository import RepositoryException, CHANGE_KINDS
 from movie_web_app.domainmodel.model import User, Movie, Genre, Director, Actor, make_review, Review
 
 
@@ -19,6 +30,20 @@ def test_repository_can_retrieve_a_user(in_memory_repo):
     assert user == User('fmercury', '8734gfe2058v')
 
 
+def test_repository_retrieves_a_user_case_insensitively(in_memory_repo):
+    user = in_memory_repo.get_user('  FMercury ')
+    assert user is in_memory_repo.get_user('fmercury')
+
+
+def test_repository_can_add_users_in_bulk(in_memory_repo):
+    users = [User('Ringo', '123456789'), User('George', '123456789')]
+    in_memory_repo.add_users(users)
+
+    assert in_memory_repo.get_user('ringo') is users[0]
+    assert in_memory_repo.get_user('george') is users[1]
+    assert users[1] in in_memory_repo.users
+
+
 def test_repository_does_not_retrieve_a_non_existent_user(in_memory_repo):
     user = in_memory_repo.get_user('prince')
     assert user is None
@@ -80,6 +105,19 @@ def test_repository_can_retrieve_movies_by_genre(in_memory_repo):
     assert len(movies) == 13
 
 
+def test_repository_shares_one_entity_instance_between_movies(in_memory_repo):
+    movies = in_memory_repo.get_movies_by_actor(Actor("Noomi Rapace"))
+    actors = [actor for movie in movies for actor in movie.actors if actor == Actor("Noomi Rapace")]
+
+    assert len(actors) == 5
+    assert all(actor is actors[0] for actor in actors)
+    assert len(actors[0].movies) == 5
+
+    genres = [genre for movie in in_memory_repo.get_movies_by_genre(Genre("War")) for genre in movie.genres
+              if genre == Genre("War")]
+    assert all(genre is genres[0] for genre in genres)
+
+
 def test_repository_does_not_retrieve_a_movie_when_there_are_no_articles_for_a_given_actor(in_memory_repo):
     movies = in_memory_repo.get_movies_by_actor(Actor("a"))
     assert len(movies) == 0
@@ -136,7 +174,7 @@ def test_repository_returns_an_empty_list_for_non_existent_ids(in_memory_repo):
 def test_repository_returns_movie_ids_for_existing_genre(in_memory_repo):
     article_ids = in_memory_repo.get_movie_ids_for_genre('War')
 
-    assert article_ids == [78, 231, 714, 511, 114, 241, 644, 763, 895, 821, 480, 187, 161]
+    assert list(article_ids) == [78, 231, 714, 511, 114, 241, 644, 763, 895, 821, 480, 187, 161]
 
 
 def test_repository_returns_an_empty_list_for_non_existent_genre(in_memory_repo):
@@ -179,6 +217,23 @@ def test_repository_returns_none_when_there_are_no_subsequent_movie(in_memory_re
     assert next_year is None
 
 
+def test_repository_returns_sorted_year_list(in_memory_repo):
+    year_list = in_memory_repo.get_year_list()
+
+    assert list(year_list) == sorted(in_memory_repo.year_dict.keys())
+    assert year_list is in_memory_repo.get_year_list()
+
+
+def test_repository_returns_neighbouring_years_for_a_year_without_movies(in_memory_repo):
+    movie = Movie("Zorblax Returns", 2005, 1001)
+    assert in_memory_repo.get_year_of_previous_movie(movie) is None
+    assert in_memory_repo.get_year_of_next_movie(movie) == 2006
+
+    movie = Movie("Zorblax Returns", 2030, 1001)
+    assert in_memory_repo.get_year_of_previous_movie(movie) == 2016
+    assert in_memory_repo.get_year_of_next_movie(movie) is None
+
+
 def test_repository_can_add_a_genre(in_memory_repo):
     genre = Genre('Motoring')
     in_memory_repo.add_genre(genre)
@@ -226,3 +281,657 @@ def test_repository_can_add_or_remove_movie_to_or_from_watch_list(in_memory_repo
     in_memory_repo.remove_from_watch_list(user, movie)
     assert len(user.watch_list.watch_list) == 0
 
+
+def test_repository_searches_by_term_prefixes(in_memory_repo):
+    movie_ids = in_memory_repo.get_movie_ids_for_search('guard galax')
+
+    assert movie_ids == [1]
+
+
+def test_repository_search_requires_every_term_and_ranks_by_rating(in_memory_repo):
+    movie_ids = in_memory_repo.get_movie_ids_for_search('Noomi Rapace')
+
+    assert movie_ids == [591, 593, 2, 672, 230]
+
+
+def test_repository_search_indexes_added_movie(in_memory_repo):
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    in_memory_repo.add_movie(movie)
+
+    assert in_memory_repo.get_movie_ids_for_search("zorb") == [1001]
+
+
+def test_repository_search_returns_an_empty_list_for_no_matches(in_memory_repo):
+    assert in_memory_repo.get_movie_ids_for_search('zzzq') == []
+    assert in_memory_repo.get_movie_ids_for_search('') == []
+
+
+def test_repository_returns_immutable_movie_ids_for_year(in_memory_repo):
+    movie_ids = in_memory_repo.get_movie_ids_for_year(2006)
+
+    assert isinstance(movie_ids, tuple)
+    assert movie_ids is in_memory_repo.get_movie_ids_for_year(2006)
+    assert movie_ids[0] == 65
+
+
+def test_repository_keeps_movie_ids_for_genre_in_rating_order_when_adding(in_memory_repo):
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    movie.rating = '9.9'
+    in_memory_repo.add_movie(movie)
+    in_memory_repo.add_movie_to_genre_dict(movie, Genre('War'))
+    in_memory_repo.add_movie_to_year_dict(movie, 2016)
+
+    assert in_memory_repo.get_movie_ids_for_genre('War')[0] == 1001
+    assert in_memory_repo.get_movie_ids_for_year(2016)[0] == 1001
+    assert len(in_memory_repo.get_movie_ids_for_genre('War')) == 14
+
+
+def test_repository_filters_movies_by_genre_year_and_rating(in_memory_repo):
+    movie_ids = in_memory_repo.get_movie_ids_for_filter(genre='Action', first_year=2010, last_year=2015, min_rating=7,
+                                                        order_by='votes')
+
+    assert len(movie_ids) == 64
+    assert [in_memory_repo.get_movie(movie_id).title for movie_id in movie_ids[:3]] == \
+        ['Inception', 'The Dark Knight Rises', 'The Avengers']
+    for movie in in_memory_repo.get_movies_by_id(movie_ids):
+        assert 2010 <= movie.year <= 2015 and float(movie.rating) >= 7
+        assert Genre('Action') in movie.genres
+
+
+def test_repository_filter_orders_by_runtime(in_memory_repo):
+    assert in_memory_repo.get_movie_ids_for_filter(first_year=2016, min_rating=8.5, order_by='runtime') == [118, 97]
+
+
+def test_repository_filter_returns_an_empty_list_for_non_existent_genre(in_memory_repo):
+    assert in_memory_repo.get_movie_ids_for_filter(genre='Nope') == []
+
+
+def test_repository_filter_rejects_unknown_ordering(in_memory_repo):
+    with pytest.raises(ValueError):
+        in_memory_repo.get_movie_ids_for_filter(order_by='title')
+
+
+def test_repository_intersects_facet_criteria(in_memory_repo):
+    assert in_memory_repo.get_movie_ids_for_facets(director='Christopher Nolan') == [55, 81, 37, 65, 125]
+    assert in_memory_repo.get_movie_ids_for_facets(director='Christopher Nolan', actor='Christian Bale',
+                                                   first_year=2008) == [55, 125]
+    assert in_memory_repo.get_movie_ids_for_facets(actor='Chris Pratt', min_rating=7.5, max_rating=8) == [385]
+    assert in_memory_repo.get_movie_ids_for_facets(genre='Action', director='Nobody') == []
+    assert len(in_memory_repo.get_movie_ids_for_facets()) == 1000
+
+
+def test_repository_counts_facets_for_movies(in_memory_repo):
+    counts = in_memory_repo.get_facet_counts([55, 81, 37, 65, 125])
+
+    assert counts['director'] == {'Christopher Nolan': 5}
+    assert counts['genre']['Sci-Fi'] == 3
+    assert counts['actor']['Christian Bale'] == 3
+    assert counts['year'] == {2006: 1, 2008: 1, 2010: 1, 2012: 1, 2014: 1}
+    assert counts['rating'] == {8: 4, 9: 1}
+
+
+def test_columnar_repository_filters_like_the_memory_repository(in_memory_repo, data_path):
+    pytest.importorskip('numpy')
+    from movie_web_app.adapters.columnar_repository import ColumnarMovieRepo
+
+    columnar_repo = ColumnarMovieRepo()
+    Movie_repo.populate(data_path, columnar_repo)
+
+    for criteria in (dict(genre='Action', first_year=2010, last_year=2015, min_rating=7, order_by='votes'),
+                     dict(first_year=2016, min_rating=8.5, order_by='runtime'),
+                     dict(genre='War', max_rating=7.1, order_by='year'),
+                     dict(genre='Nope'),
+                     dict()):
+        assert columnar_repo.get_movie_ids_for_filter(**criteria) == in_memory_repo.get_movie_ids_for_filter(**criteria)
+
+
+def test_columnar_repository_includes_added_movie_in_filters(data_path):
+    pytest.importorskip('numpy')
+    from movie_web_app.adapters.columnar_repository import ColumnarMovieRepo
+
+    columnar_repo = ColumnarMovieRepo()
+    Movie_repo.populate(data_path, columnar_repo)
+    assert len(columnar_repo.get_movie_ids_for_filter(genre='War')) == 13
+
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    movie.rating = '9.9'
+    movie.votes = '12'
+    columnar_repo.add_movie(movie)
+    columnar_repo.add_movie_to_genre_dict(movie, Genre('War'))
+
+    assert columnar_repo.get_movie_ids_for_filter(genre='War')[0] == 1001
+    assert columnar_repo.get_movie_ids_for_filter(genre='War', order_by='votes')[-1] == 1001
+
+
+def test_repository_finds_similar_movies(in_memory_repo):
+    # Guardians of the Galaxy: the Star Trek films share its genres and two of its actors.
+    assert in_memory_repo.get_similar_movie_ids(1)[:2] == [49, 363]
+    assert len(in_memory_repo.get_similar_movie_ids(1)) == 10
+    assert in_memory_repo.get_similar_movie_ids(10009) == []
+
+
+@pytest.mark.parametrize('bulk', (False, True))
+def test_repository_folds_added_movies_into_similar_movies(in_memory_repo, bulk):
+    # populate precomputes the table; added movies update it in place.
+    similar_movies = in_memory_repo._similar_movies
+    assert similar_movies is not None
+    guardians = in_memory_repo.get_movie(1)
+
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    movie.director = guardians.director
+    for actor in guardians.actors:
+        movie.add_actor(actor)
+    if bulk:
+        in_memory_repo.add_movies([movie])
+    else:
+        in_memory_repo.add_movie(movie)
+
+    assert in_memory_repo.similar_movies is similar_movies
+    assert in_memory_repo.get_similar_movie_ids(1)[0] == 1001
+    assert in_memory_repo.get_similar_movie_ids(1001)[0] == 1
+    assert len(in_memory_repo.get_similar_movie_ids(1)) == 10
+
+
+def test_columnar_repository_finds_the_same_similar_movies(in_memory_repo, data_path):
+    pytest.importorskip('numpy')
+    from movie_web_app.adapters.columnar_repository import ColumnarMovieRepo
+
+    columnar_repo = ColumnarMovieRepo()
+    Movie_repo.populate(data_path, columnar_repo)
+
+    for movie_id in (1, 14, 500, 1000):
+        assert columnar_repo.get_similar_movie_ids(movie_id) == in_memory_repo.get_similar_movie_ids(movie_id)
+
+
+def test_repository_indexes_actor_collaborations(in_memory_repo):
+    graph = in_memory_repo.get_collaboration_graph()
+
+    assert graph.worked_with('Chris Pratt', 'Vin Diesel')
+    assert not graph.worked_with('Chris Pratt', 'Christian Bale')
+    assert not graph.worked_with('Chris Pratt', 'Nobody')
+    assert graph.top_collaborators('Christian Bale', 2) == [('Amy Adams', 2), ('Michael Caine', 2)]
+    assert graph.shortest_path('Chris Pratt', 'Christian Bale') == ['Chris Pratt', 'Bradley Cooper', 'Christian Bale']
+    assert graph.shortest_path('Chris Pratt', 'Chris Pratt') == ['Chris Pratt']
+    assert graph.shortest_path('Chris Pratt', 'Nobody') is None
+
+
+def test_repository_adds_the_collaborations_of_an_added_movie_without_a_rebuild(in_memory_repo):
+    graph = in_memory_repo.get_collaboration_graph()
+    assert not graph.worked_with('Chris Pratt', 'Christian Bale')
+
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    for name in ('Chris Pratt', 'Christian Bale', 'Zorblax'):
+        movie.add_actor(Actor(name))
+    in_memory_repo.add_movie(movie)
+
+    assert in_memory_repo.get_collaboration_graph() is graph
+    assert graph.worked_with('Christian Bale', 'Chris Pratt')
+    assert graph.shortest_path('Zorblax', 'Amy Adams') == ['Zorblax', 'Christian Bale', 'Amy Adams']
+
+
+def test_collaboration_graph_finds_shortest_paths_from_either_end():
+    casts = [['A', 'B'], ['B', 'C'], ['C', 'D'], ['D', 'E'], ['A', 'X'], ['X', 'E'], ['F', 'G']]
+    graph = CollaborationGraph.from_casts(casts)
+
+    assert len(graph) == 8 and graph.number_of_collaborations == 7
+    assert graph.shortest_path('A', 'E') == ['A', 'X', 'E']
+    assert graph.shortest_path('E', 'C') == ['E', 'D', 'C']
+    assert graph.shortest_path('A', 'G') is None
+
+
+def test_collaboration_graph_answers_the_same_before_and_after_folding_added_casts():
+    casts = [['A', 'B'], ['B', 'C'], ['C', 'D'], ['F', 'G']]
+    added = [['A', 'B', 'H'], ['D', 'F'], ['H', 'I']]
+    graph = CollaborationGraph.from_casts(casts)
+    for cast in added:
+        graph.add_cast(cast)
+
+    for answers in (graph, graph.folded(), CollaborationGraph.from_casts(casts + added)):
+        assert len(answers) == 8 and answers.number_of_collaborations == 8
+        assert answers.worked_with('H', 'B') and answers.worked_with('D', 'F') and not answers.worked_with('A', 'I')
+        assert sorted(answers.collaborators('B')) == ['A', 'C', 'H']
+        assert answers.top_collaborators('A') == [('B', 2), ('H', 1)]
+        assert answers.shortest_path('I', 'G') == ['I', 'H', 'B', 'C', 'D', 'F', 'G']
+
+
+def test_caching_repository_memoises_reads(in_memory_repo):
+    caching_repo = CachingRepository(in_memory_repo)
+
+    assert caching_repo.get_movie(1) is in_memory_repo.get_movie(1)
+    assert caching_repo.get_movie(1) is in_memory_repo.get_movie(1)
+    ids = caching_repo.get_movie_ids_for_filter(genre='War')
+    ids.append(-1)
+    assert caching_repo.get_movie_ids_for_filter(genre='War') == in_memory_repo.get_movie_ids_for_filter(genre='War')
+    assert [movie.id for movie in caching_repo.get_movies_by_id(movie_id for movie_id in (3, 1))] == [3, 1]
+
+    statistics = caching_repo.statistics()
+    assert (statistics['hits'], statistics['misses'], statistics['entries']) == (2, 3, 3)
+    assert statistics['methods']['get_movie'] == {'misses': 1, 'hits': 1}
+
+
+def test_caching_repository_invalidates_only_what_a_write_changes(in_memory_repo):
+    caching_repo = CachingRepository(in_memory_repo)
+    fmercury, thorke = caching_repo.get_user('fmercury'), caching_repo.get_user('thorke')
+    caching_repo.get_movie(1)
+    caching_repo.get_watch_list_size(fmercury)
+    caching_repo.get_watch_list_size(thorke)
+    assert len(caching_repo.get_movie_ids_for_genre('War')) == 13
+
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    caching_repo.add_movie(movie)
+    caching_repo.add_movie_to_genre_dict(movie, Genre('War'))
+    caching_repo.add_to_watch_list(fmercury, caching_repo.get_movie(2))
+
+    assert len(caching_repo.get_movie_ids_for_genre('War')) == 14
+    assert caching_repo.get_watch_list_size(fmercury) == 1
+    hits = caching_repo.statistics()['hits']
+    caching_repo.get_movie(1)
+    caching_repo.get_watch_list_size(thorke)
+    assert caching_repo.statistics()['hits'] == hits + 2
+
+
+def test_caching_repository_shares_user_entries_between_spellings(in_memory_repo):
+    caching_repo = CachingRepository(in_memory_repo)
+    assert caching_repo.get_user(' Jane') is None
+    assert caching_repo.get_user('jane') is None
+    assert caching_repo.statistics()['methods']['get_user'] == {'misses': 1, 'hits': 1}
+
+    caching_repo.add_user(User('Jane', '123456789'))
+    assert caching_repo.get_user(' Jane').user_name == 'jane'
+
+
+def test_caching_repository_expires_and_evicts_entries(in_memory_repo):
+    now = [0]
+    caching_repo = CachingRepository(in_memory_repo, max_entries=2, ttl=10, clock=lambda: now[0])
+    caching_repo.get_movie(1)
+    caching_repo.get_movie(2)
+    caching_repo.get_movie(1)
+    caching_repo.get_movie(3)
+
+    now[0] = 5
+    caching_repo.get_movie(1)
+    caching_repo.get_movie(2)
+    now[0] = 20
+    caching_repo.get_movie(2)
+
+    statistics = caching_repo.statistics()
+    assert (statistics['hits'], statistics['misses']) == (2, 5)
+    assert (statistics['evictions'], statistics['expirations']) == (2, 1)
+
+
+def test_repository_counts_versions_and_publishes_changes(in_memory_repo):
+    changes = []
+    in_memory_repo.changes.subscribe(changes.append)
+    versions = in_memory_repo.changes.versions()
+    user = in_memory_repo.get_user('fmercury')
+    movie = Movie("Zorblax Returns", 2016, 1001)
+
+    in_memory_repo.add_movie(movie)
+    in_memory_repo.add_genre(Genre('War'))
+    in_memory_repo.add_to_watch_list(user, movie)
+    review = make_review('Out of this world', user, movie, 9)
+    in_memory_repo.add_comment(review)
+
+    assert [(change.kind, change.operation) for change in changes] == [
+        ('movies', 'add_movie'), ('watch_lists', 'add_to_watch_list'), ('comments', 'add_comment')]
+    assert changes[1].subjects == (user, movie)
+    assert changes[2].version == versions['comments'] + 1
+    assert in_memory_repo.changes.version('movies') == versions['movies'] + 1
+    assert in_memory_repo.changes.version('users') == versions['users']
+
+    in_memory_repo.changes.unsubscribe(changes.append)
+    in_memory_repo.remove_from_watch_list(user, movie)
+    assert len(changes) == 3
+    assert in_memory_repo.changes.version('watch_lists') == versions['watch_lists'] + 2
+    assert in_memory_repo.changes.version('watch_lists', 'fmercury') == 2
+    assert in_memory_repo.changes.version('watch_lists', 'thorke') == 0
+    assert in_memory_repo.changes.last_changed('watch_lists', 'fmercury') == in_memory_repo.changes.last_changed(
+        'watch_lists')
+    assert in_memory_repo.changes.last_changed('watch_lists', 'thorke') is None
+
+
+def test_change_feed_survives_a_failing_subscriber(in_memory_repo):
+    def fail(change):
+        raise ValueError(change)
+
+    changes = []
+    in_memory_repo.changes.subscribe(fail)
+    in_memory_repo.changes.subscribe(changes.append)
+    in_memory_repo.add_user(User('Jane', '123456789'))
+    assert in_memory_repo.get_user('jane') is not None
+    assert [change.operation for change in changes] == ['add_user']
+
+
+def test_caching_repository_invalidates_on_writes_to_the_wrapped_repository(in_memory_repo):
+    caching_repo = CachingRepository(in_memory_repo)
+    fmercury = caching_repo.get_user('fmercury')
+    assert caching_repo.get_movie(1001) is None
+    assert caching_repo.get_watch_list_size(fmercury) == 0
+    assert caching_repo.changes is in_memory_repo.changes
+
+    movie = Movie("Zorblax Returns", 2016, 1001)
+    in_memory_repo.add_movies([movie])
+    in_memory_repo.add_to_watch_list(fmercury, movie)
+
+    assert caching_repo.get_movie(1001) is movie
+    assert caching_repo.get_watch_list_size(fmercury) == 1
+
+
+def test_repository_snapshot_round_trip(in_memory_repo, data_path, tmp_path):
+    snapshot_path = str(tmp_path / 'movies.snapshot')
+    in_memory_repo.add_to_watch_list(in_memory_repo.get_user('fmercury'), in_memory_repo.get_movie(5))
+    snapshot.save_snapshot(in_memory_repo, snapshot_path, data_path)
+
+    restored = snapshot.load_snapshot(snapshot_path, data_path)
+
+    assert restored.get_number_of_movies() == 1000
+    assert restored.get_first_movie().title == 'Inland Empire'
+    assert restored.get_movie_ids_for_genre('War') == in_memory_repo.get_movie_ids_for_genre('War')
+    assert restored.get_movie_ids_for_search('noomi rapace') == [591, 593, 2, 672, 230]
+    assert restored.get_user('fmercury').watch_list.watch_list[0].title == 'Suicide Squad'
+    assert len(restored.get_movie(1).reviews) == 3
+    assert restored.get_similar_movie_ids(1) == in_memory_repo.get_similar_movie_ids(1)
+    assert restored.get_collaboration_graph().worked_with('Chris Pratt', 'Vin Diesel')
+
+
+def test_repository_snapshot_is_ignored_when_stale(in_memory_repo, data_path, tmp_path):
+    snapshot_path = str(tmp_path / 'movies.snapshot')
+    snapshot.save_snapshot(in_memory_repo, snapshot_path, data_path)
+
+    changed_data = tmp_path / 'data'
+    changed_data.mkdir()
+    for filename in snapshot.SOURCE_FILES:
+        with open(os.path.join(data_path, filename), encoding='utf-8-sig') as source:
+            (changed_data / filename).write_text(source.read(), encoding='utf-8')
+    with open(str(changed_data / 'users.csv'), 'a') as users:
+        users.write('4,newuser,Password1\n')
+
+    assert snapshot.load_snapshot(snapshot_path, str(changed_data)) is None
+    with pytest.raises(snapshot.SnapshotException):
+        snapshot.read_snapshot(snapshot_path, str(changed_data))
+
+
+def test_database_repository_loads_a_page_of_movies_with_a_constant_number_of_queries(database_repo):
+    def queries_to_render(movie_ids):
+        database_repo.reset_session()
+        database_repo.reset_query_count()
+        for movie in database_repo.get_movies_by_id(movie_ids):
+            [genre.genre_name for genre in movie.genres]
+            movie.director.director_full_name
+            [review.user.user_name for review in movie.reviews]
+        return database_repo.query_count
+
+    assert [movie.id for movie in database_repo.get_movies_by_id([3, 1, 2])] == [3, 1, 2]
+    assert queries_to_render([1, 2, 3]) == queries_to_render(list(range(1, 51))) <= 3
+
+
+def test_database_repository_keeps_an_indexed_watch_list(database_repo):
+    user = database_repo.get_user('fmercury')
+    for movie_id in (3, 1, 2, 1):
+        database_repo.add_to_watch_list(user, database_repo.get_movie(movie_id))
+
+    ids = database_repo.get_watch_list_ids(user)
+    ratings = [movie.rating for movie in database_repo.get_movies_by_id(ids)]
+    assert sorted(ids) == [1, 2, 3]
+    assert ratings == sorted(ratings, reverse=True)
+    assert database_repo.get_watch_list_ids(user, 1, 1) == ids[1:2]
+    assert database_repo.get_watch_list_size(user) == 3
+    assert database_repo.get_watch_list_ids_among(user, [2, 3, 4]) == {2, 3}
+    assert database_repo.get_watch_list_ids(database_repo.get_user('thorke')) == []
+
+    database_repo.remove_from_watch_list(user, database_repo.get_movie(2))
+    database_repo.reset_session()
+    assert database_repo.get_watch_list_ids_among(database_repo.get_user('fmercury'), [1, 2, 3]) == {1, 3}
+
+
+def test_database_repository_ignores_a_watch_list_entry_added_concurrently(database_repo, monkeypatch):
+    user = database_repo.get_user('fmercury')
+    movie = database_repo.get_movie(1)
+    database_repo.add_to_watch_list(user, movie)
+    version = database_repo.changes.version('watch_lists')
+
+    # As if another request inserted the entry after this one checked the watch list.
+    checks = [set(), {movie.id}]
+    monkeypatch.setattr(database_repo, 'get_watch_list_ids_among', lambda user, movie_ids: checks.pop(0))
+    database_repo.add_to_watch_list(user, movie)
+    monkeypatch.undo()
+
+    assert database_repo.get_watch_list_ids(user) == [1]
+    assert database_repo.changes.version('watch_lists') == version
+
+
+def test_database_repository_shares_data_versions_between_processes(database_session_factory):
+    # Two repositories on one database stand for two worker processes.
+    repo, other = (SqlAlchemyRepository(database_session_factory) for _ in range(2))
+    versions = {kind: other.get_data_version(kind) for kind in CHANGE_KINDS}
+    assert repo.get_data_version('movies') == versions['movies']
+    assert versions['movies'].version != '' and versions['movies'].changed <= time.time()
+    assert repo.get_data_version('watch_lists', 'fmercury') == ('', None)
+
+    repo.add_to_watch_list(repo.get_user('fmercury'), repo.get_movie(1))
+    other.reset_session()
+    watch_lists, mercury = other.get_data_version('watch_lists'), other.get_data_version('watch_lists', 'fmercury')
+    assert watch_lists.version != versions['watch_lists'].version
+    assert mercury.version not in ('', watch_lists.version)
+    assert versions['watch_lists'].changed <= watch_lists.changed == mercury.changed
+    assert other.get_data_version('watch_lists', 'thorke') == ('', None)
+    assert other.get_data_version('movies') == versions['movies']
+
+    writer = CommentWriter(database_session_factory.kw['bind'], max_latency=0.01)
+    repo = SqlAlchemyRepository(database_session_factory, writer)
+    repo.add_comment(make_review('First!', repo.get_user('fmercury'), repo.get_movie(2), datetime(2020, 3, 15)))
+    repo.wait_for_comments('fmercury')
+    writer.close()
+    other.reset_session()
+    assert other.get_data_version('comments').version != versions['comments'].version
+
+
+def test_database_repository_can_add_a_movie(database_repo):
+    graph = database_repo.get_collaboration_graph()
+    movie = Movie('Zorblax Returns', 2016, 1001)
+    movie.description = 'Zorblax is back.'
+    movie.runtime_minutes = 95
+    movie.director = Director('Christopher Nolan')
+    for name in ('Christian Bale', 'Zorblax', 'Zorblax'):
+        movie.add_actor(Actor(name))
+    movie.add_genre(Genre('Sci-Fi'))
+    database_repo.add_movie(movie)
+    database_repo.add_genre(Genre('Sci-Fi'))
+    database_repo.add_actor(Actor('Zorblax'))
+    database_repo.add_director(Director('Zorblax Senior'))
+
+    database_repo.reset_session()
+    stored = database_repo.get_movie(1001)
+    assert (stored.title, stored.description, stored.runtime_minutes) == ('Zorblax Returns', 'Zorblax is back.', 95)
+    assert sorted(actor.actor_full_name for actor in stored.actors) == ['Christian Bale', 'Zorblax']
+    assert [genre.genre_name for genre in stored.genres] == ['Sci-Fi']
+    assert 1001 in database_repo.get_movie_ids_for_genre('Sci-Fi')
+    assert 1001 in database_repo.get_movie_ids_for_facets(director='Christopher Nolan', actor='Christian Bale')
+    assert len(database_repo.get_genre_list()) == 20
+    assert database_repo.changes.version('movies') == 2
+    assert database_repo.get_collaboration_graph() is graph and graph.worked_with('Zorblax', 'Christian Bale')
+
+
+def test_database_repository_orders_first_and_last_movies_by_year(database_repo):
+    assert database_repo.get_first_movie().title == 'Inland Empire'
+    assert database_repo.get_last_movie().title == 'Split'
+
+
+def test_database_repository_searches_by_term_prefixes_like_the_memory_repository(database_repo):
+    assert database_repo.get_movie_ids_for_search('guard galax') == [1]
+    assert database_repo.get_movie_ids_for_search('Noomi Rapace') == [591, 593, 2, 672, 230]
+    assert database_repo.get_movie_ids_for_search('zzzq') == []
+
+    database_repo.add_movie(Movie("Zorblax Returns", 2016, 1001))
+    assert database_repo.get_movie_ids_for_search("zorb") == [1001]
+
+
+def test_database_search_tokens_are_built_for_an_existing_database(database_session_factory):
+    engine = database_session_factory.kw['bind']
+    engine.execute('DROP TABLE movie_tokens')
+    database_repository.ensure_search_tokens(engine)
+
+    repository = SqlAlchemyRepository(database_session_factory)
+    assert repository.get_movie_ids_for_search('Noomi Rapace') == [591, 593, 2, 672, 230]
+
+
+def test_database_repository_records_versions_in_the_transaction_of_the_write(database_repo, monkeypatch):
+    def locked(*args):
+        raise OperationalError('UPDATE data_versions', {}, Exception('database is locked'))
+
+    # A write whose versions can't be recorded isn't made either, so no worker answers 304 for the changed data.
+    monkeypatch.setattr(database_repository, 'record_change', locked)
+    with pytest.raises(OperationalError):
+        database_repo.add_user(User('zorblax', 'Zorblax123'))
+    database_repo.reset_session()
+    assert database_repo.get_user('zorblax') is None
+
+
+def test_database_data_versions_are_created_for_an_existing_database(database_session_factory):
+    engine = database_session_factory.kw['bind']
+    engine.execute('DROP TABLE data_versions')
+    database_repository.ensure_data_versions(engine)
+
+    repository = SqlAlchemyRepository(database_session_factory)
+    version = repository.get_data_version('users')
+    repository.add_user(User('zorblax', 'Zorblax123'))
+    assert '' != version.version != repository.get_data_version('users').version
+
+
+def test_database_data_versions_are_recreated_without_change_times(database_session_factory):
+    engine = database_session_factory.kw['bind']
+    engine.execute('DROP TABLE data_versions')
+    engine.execute("CREATE TABLE data_versions (kind VARCHAR(32), user_name VARCHAR(255), version VARCHAR(32))")
+    database_repository.ensure_data_versions(engine)
+
+    assert SqlAlchemyRepository(database_session_factory).get_data_version('movies').changed is not None
+
+
+def test_database_repository_publishes_committed_changes(database_repo):
+    changes = []
+    database_repo.changes.subscribe(changes.append)
+    user = database_repo.get_user('fmercury')
+    movie = database_repo.get_movie(1)
+
+    database_repo.add_to_watch_list(user, movie)
+    database_repo.add_to_watch_list(user, movie)
+    database_repo.remove_from_watch_list(user, movie)
+    database_repo.add_user(User('Jane', '123456789'))
+
+    assert [change.operation for change in changes] == ['add_to_watch_list', 'remove_from_watch_list', 'add_user']
+    assert database_repo.changes.versions() == {'movies': 0, 'comments': 0, 'users': 1, 'watch_lists': 2}
+
+
+def test_database_repository_finds_similar_movies(database_repo):
+    assert database_repo.get_similar_movie_ids(1)[:2] == [49, 363]
+    assert database_repo.get_similar_movie_ids(10009) == []
+
+
+def test_database_repository_indexes_actor_collaborations(database_repo):
+    graph = database_repo.get_collaboration_graph()
+    assert len(graph) == 1985
+    assert graph.top_collaborators('Christian Bale', 2) == [('Amy Adams', 2), ('Michael Caine', 2)]
+    assert len(graph.shortest_path('Chris Pratt', 'Meryl Streep')) == 4
+
+
+def test_caching_repository_reattaches_cached_movies_to_the_current_session(database_repo):
+    caching_repo = CachingRepository(database_repo)
+    title = caching_repo.get_movie(1).title
+    database_repo.reset_session()
+
+    database_repo.reset_query_count()
+    movie = caching_repo.get_movie(1)
+    assert movie.title == title and database_repo.query_count == 0
+    assert 'Action' in [genre.genre_name for genre in movie.genres]
+
+
+def test_database_repository_writes_comments_behind_in_batches(database_session_factory):
+    writer = CommentWriter(database_session_factory.kw['bind'], batch_size=10, max_latency=0.2)
+    repo = SqlAlchemyRepository(database_session_factory, writer)
+    number_of_comments = len(repo.get_comments())
+
+    repo.reset_query_count()
+    for text in ('First!', 'Second!', 'Third!'):
+        user, movie = repo.get_user('fmercury'), repo.get_movie(2)
+        repo.add_comment(make_review(text, user, movie, datetime(2020, 3, 15)))
+        repo.reset_session()
+    queries_to_queue = repo.query_count
+
+    # The three comments are written together, with the new version of the comments, and the author sees them as soon
+    # as wait_for_comments returns.
+    repo.wait_for_comments('FMercury')
+    assert repo.query_count == queries_to_queue + 2
+    assert len(repo.get_comments()) == number_of_comments + 3
+    assert [review.review_text for review in repo.get_movie(2).reviews][-3:] == ['First!', 'Second!', 'Third!']
+
+    # Closing writes whatever is still queued.
+    repo.add_comment(make_review('Last!', repo.get_user('thorke'), repo.get_movie(3), datetime(2020, 3, 16)))
+    writer.close()
+    repo.reset_session()
+    assert len(repo.get_comments()) == number_of_comments + 4
+
+
+def test_comment_writer_retries_a_locked_database_and_survives_other_errors(database_session_factory, database_repo,
+                                                                          monkeypatch):
+    failures = [OperationalError('INSERT INTO comments', {}, Exception('database is locked'))] * 2
+
+    def record_change(connection, kind):
+        if len(failures) > 0:
+            raise failures.pop(0)
+    monkeypatch.setattr(comment_writer, 'record_change', record_change)
+
+    writer = CommentWriter(database_session_factory.kw['bind'], max_latency=0.01, retry_delay=0.01)
+    # Comments by a user and on a movie that aren't loaded, so no session keeps the database locked.
+    user, movie = User('fmercury', 'Freddie123'), PersistentMovie('Prometheus', 2012, 2)
+    number_of_comments = len(database_repo.get_comments())
+    database_repo.reset_session()
+    written = []
+
+    # A locked database delays the comment rather than dropping it.
+    writer.add(make_review('First!', user, movie, datetime(2020, 3, 15)), lambda: written.append('First!'))
+    assert writer.wait_for('fmercury', timeout=5)
+    assert written == ['First!']
+
+    # Any other error drops the batch, without reporting it written, and the writer goes on.
+    failures.append(ValueError())
+    writer.add(make_review('Second!', user, movie, datetime(2020, 3, 15)), lambda: written.append('Second!'))
+    assert writer.wait_for('fmercury', timeout=5)
+    writer.add(make_review('Third!', user, movie, datetime(2020, 3, 15)), lambda: written.append('Third!'))
+    writer.close()
+
+    assert written == ['First!', 'Third!']
+    database_repo.reset_session()
+    assert [review.review_text for review in database_repo.get_comments()[number_of_comments:]] == ['First!', 'Third!']
+
+
+def test_database_engine_pools_connections_and_applies_pragmas(tmp_path):
+    engine = create_database_engine('sqlite:///' + str(tmp_path / 'movies.db'), pool_size=2,
+                                    pragmas={'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -1024})
+
+    with engine.connect() as connection:
+        assert connection.execute('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.execute('PRAGMA synchronous').scalar() == 1
+        assert connection.execute('PRAGMA cache_size').scalar() == -1024
+    assert engine.pool.checkedin() == 1
+
+
+def test_hash_passwords_keeps_existing_hashes_and_hashes_plaintext():
+    existing_hash = generate_password_hash('Password1')
+    hashes = user_import.hash_passwords(['Secret$1', existing_hash, 'Secret$3'], workers=2, min_parallel=1)
+
+    assert hashes[1] == existing_hash
+    assert user_import.is_password_hash(hashes[0]) and check_password_hash(hashes[0], 'Secret$1')
+    assert user_import.is_password_hash(hashes[2]) and check_password_hash(hashes[2], 'Secret$3')
+    assert not user_import.is_password_hash('mvNNbc1eLA$i')
+
+
+def test_repository_loads_pre_hashed_users(tmp_path, data_path):
+    users = user_import.read_users(os.path.join(data_path, 'users.csv'), workers=1)
+    user_import.write_users(str(tmp_path / 'users.csv'), users)
+    assert user_import.read_users(str(tmp_path / 'users.csv')) == users
+
+    repo = Movie_repo.MovieRepo()
+    Movie_repo.load_users(str(tmp_path), repo)
+    user = repo.get_user('fmercury')
+    assert user.password == users[1][2]
+    assert check_password_hash(user.password, 'mvNNbc1eLA$i')
@@ -5,6 +5,9 @@ import pytest
 from movie_web_app.authentication.services import AuthenticationException
 from movie_web_app.domainmodel.model import Movie
 from movie_web_app.movie import services as movie_services
+import movie_web_app.movie.profanity_filter as profanity_filter_module
+from movie_web_app.movie.profanity_filter import ProfanityFilter, profanity_filter
+from movie_web_app.movie.search_results import SearchResultCache, query_token
 from movie_web_app.authentication import services as auth_services
 from movie_web_app.movie.services import NonExistentMovieException, UnknownUserException
 
@@ -193,6 +196,22 @@ def test_get_comments_for_non_existent_movie(in_memory_repo):
         comments_as_dict = movie_services.get_comments_for_movie(10009, in_memory_repo)
 
 
+def test_get_similar_movies(in_memory_repo):
+    movies_as_dict = movie_services.get_similar_movies(1, in_memory_repo)
+    assert [movie['title'] for movie in movies_as_dict[:2]] == ['Star Trek Beyond', 'Star Trek Into Darkness']
+
+
+def test_get_similar_movies_for_non_existent_movie(in_memory_repo):
+    with pytest.raises(NonExistentMovieException):
+        movie_services.get_similar_movies(10009, in_memory_repo)
+
+
+def test_get_collaborations(in_memory_repo):
+    assert movie_services.actors_worked_together('Vin Diesel', 'Chris Pratt', in_memory_repo)
+    assert movie_services.get_collaboration_path('Chris Pratt', 'Meryl Streep', in_memory_repo)[-1] == 'Meryl Streep'
+    assert movie_services.get_top_collaborators('Christian Bale', in_memory_repo, 1) == [('Amy Adams', 2)]
+
+
 def test_get_comments_for_movie_without_comments(in_memory_repo):
     comments_as_dict = movie_services.get_comments_for_movie(2, in_memory_repo)
     assert len(comments_as_dict) == 0
@@ -211,6 +230,18 @@ def test_can_add_or_remove_movie_to_from_watch_list(in_memory_repo):
     assert len(watch_list) == 0
 
 
+def test_watch_list_is_shown_highest_rated_first_without_duplicates(in_memory_repo):
+    for movie_id in (3, 1, 2, 1):
+        movie_services.add_to_watch_list(movie_id, 'fmercury', in_memory_repo)
+
+    ratings = [in_memory_repo.get_movie(movie_id).rating
+               for movie_id in movie_services.get_watch_list_ids_for_user('fmercury', in_memory_repo)]
+    assert len(ratings) == 3
+    assert ratings == sorted(ratings, reverse=True)
+    assert movie_services.get_watch_list_ids_among('fmercury', [2, 3, 4], in_memory_repo) == {2, 3}
+    assert movie_services.get_watch_list_size('fmercury', in_memory_repo) == 3
+
+
 def test_can_add_or_remove_movie_to_from_watch_listif_user_is_none(in_memory_repo):
     movie_id = 3
     username = None
@@ -220,3 +251,130 @@ def test_can_add_or_remove_movie_to_from_watch_listif_user_is_none(in_memory_rep
 
     with pytest.raises(UnknownUserException):
         movie_services.remove_from_watch_list(movie_id, username, in_memory_repo)
+
+
+def test_get_search_info_matches_actor_names(in_memory_repo):
+    movies_as_dict = movie_services.get_search_info('chris pratt', in_memory_repo)
+
+    assert len(movies_as_dict) == 7
+    assert movies_as_dict[0]['title'] == 'Guardians of the Galaxy'
+
+
+def test_get_faceted_movies(in_memory_repo):
+    movie_ids, facets = movie_services.get_faceted_movies(in_memory_repo, facet_limit=3, director='Christopher Nolan')
+
+    assert movie_ids == [55, 81, 37, 65, 125]
+    assert facets['genre'] == [('Action', 3), ('Drama', 3), ('Sci-Fi', 3)]
+    assert facets['year'] == [(2006, 1), (2008, 1), (2010, 1), (2012, 1), (2014, 1)]
+    assert facets['rating'] == [(8, 4), (9, 1)]
+    assert facets['actor'][0] == ('Christian Bale', 3)
+
+
+def test_search_result_cache_evicts_least_recently_used():
+    cache = SearchResultCache(max_entries=2)
+    first = cache.put('first', [1, 2, 3])
+    second = cache.put('second', [4])
+    assert cache.get(first) == (1, 2, 3)
+
+    third = cache.put('third', [5])
+
+    assert cache.get(second) is None
+    assert cache.get(first) == (1, 2, 3)
+    assert cache.get(third) == (5,)
+    assert len(cache) == 2
+
+
+def test_search_result_cache_expires_results():
+    now = [0.0]
+    cache = SearchResultCache(ttl=60, clock=lambda: now[0])
+    token = cache.put('query', [1])
+
+    now[0] = 59.0
+    assert cache.get(token) == (1,)
+    now[0] = 60.0
+    assert cache.get(token) is None
+    assert cache.get('unknown') is None
+
+
+def test_search_result_cache_searches_again_for_results_it_does_not_hold():
+    token = SearchResultCache().put('Noomi Rapace', [591, 593])
+    searches = []
+
+    def search(query):
+        searches.append(query)
+        return [591, 593, 2] if query == 'Noomi Rapace' else []
+
+    # As another worker would: the results aren't held, so the token's query is searched for again, once.
+    cache = SearchResultCache()
+    assert cache.get(token, search) == (591, 593, 2)
+    assert cache.get(token, search) == (591, 593, 2)
+    assert searches == ['Noomi Rapace']
+    assert cache.get('unknown', search) is None
+    assert cache.get(query_token('no such movie'), search) is None
+
+
+def test_listing_projection_converts_comments_only_when_read(in_memory_repo, monkeypatch):
+    converted = []
+    convert = movie_services.comments_to_dict
+    monkeypatch.setattr(movie_services, 'comments_to_dict', lambda comments: converted.append(1) or convert(comments))
+
+    movies_as_dict = movie_services.get_movies_by_id([1, 2, 3], in_memory_repo)
+
+    assert [movie['comment_count'] for movie in movies_as_dict] == [3, 0, 0]
+    assert converted == []
+    assert len(movies_as_dict[0]['comments']) == 3
+    assert converted == [1]
+
+
+def test_projections_hold_only_their_fields(in_memory_repo):
+    first_movie = movie_services.get_first_movie(in_memory_repo)
+    assert list(first_movie) == ['id', 'year', 'title']
+    with pytest.raises(KeyError):
+        first_movie['description']
+
+    movie_as_dict = movie_services.get_movie(2, in_memory_repo)
+    movie_as_dict['view_comment_url'] = '/comments'
+    assert movie_as_dict['genres'][0] == {'name': 'Adventure'}
+    assert movie_as_dict['view_comment_url'] == '/comments'
+    assert 'view_comment_url' in list(movie_as_dict)
+
+
+@pytest.mark.parametrize(('comment', 'profane'), (
+        ('What the fuck?', True),
+        ('a$$', True),
+        ('What a load of sh1t.', True),
+        ('2 girls 1 cup', True),
+        ('br0wn 5how3r', True),
+        ('hand job', True),
+        # better_profanity misses these two, as it never checks a one-letter word at the very end of the text.
+        ('f u c k', True),
+        ('f.u.c.k', True),
+        ('A first-class assessment of the glass ceiling', False),
+        ('Scunthorpe United', False),
+        ('', False),
+))
+def test_profanity_filter_matches_words_and_their_variants(comment, profane):
+    assert profanity_filter.contains_profanity(comment) == profane
+
+
+def test_profanity_filter_matches_words_joined_across_separators():
+    words_filter = ProfanityFilter(['handjob', 'ass'], frozenset('abcdefghijklmnopqrstuvwxyz@$'))
+
+    assert words_filter.contains_profanity('hand job')
+    assert words_filter.contains_profanity('as s')
+    assert words_filter.contains_profanity('@$$!')
+    assert not words_filter.contains_profanity('handjobs')
+    assert not words_filter.contains_profanity('hand jobs')
+    assert not words_filter.contains_profanity('mass')
+
+
+def test_profanity_filter_scans_on_without_its_tables_once_they_are_full(monkeypatch):
+    texts = ['hand job', 'as s', '@$$!', 'handjobs', 'hand jobs', 'mass', 'a h@ndjob', 'class', '']
+    unbounded = ProfanityFilter(['handjob', 'ass'], frozenset('abcdefghijklmnopqrstuvwxyz@$'))
+    expected = [unbounded.contains_profanity(text) for text in texts]
+
+    monkeypatch.setattr(profanity_filter_module, 'MAX_STATES', 4)
+    monkeypatch.setattr(profanity_filter_module, 'MAX_TRANSITIONS', 4)
+    bounded = ProfanityFilter(['handjob', 'ass'], frozenset('abcdefghijklmnopqrstuvwxyz@$'))
+    assert [bounded.contains_profanity(text) for text in texts] == expected
+    assert len(bounded._states) == 4 and len(bounded._transitions) <= 4